@@ -0,0 +1,64 @@
+"""
+Micro-benchmark: legacy per-call keyword sort + startswith scan vs the precompiled KeywordMatcher.
+
+Usage: python scripts/benchmark_keyword_matcher.py
+"""
+import sys
+import os
+import timeit
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.search_service import PULSE_KEYWORD_VECTORS, _extract_keywords
+from src.utils.keyword_matcher import KeywordMatcher
+
+# Realistic cell and overall descriptions as clinicians type them
+SAMPLES = [
+    "沉细无力", "弦滑", "稍空", "浮大中空", "沉迟细弱", "弦紧有力应指",
+    "左关弦滑稍数，右尺沉细无力", "脉沉细弱，尺部尤甚，按之稍空不空",
+    "浮取紧，中取宽而有力，沉取顶指", "寸浮关弦尺沉，整体偏数，略滑",
+]
+
+
+def legacy_extract(text):
+    sorted_kw = sorted(PULSE_KEYWORD_VECTORS.keys(), key=len, reverse=True)
+    found, remaining = [], text
+    while remaining:
+        matched = False
+        for kw in sorted_kw:
+            if remaining.startswith(kw):
+                found.append(kw)
+                remaining = remaining[len(kw):]
+                matched = True
+                break
+        if not matched:
+            remaining = remaining[1:]
+    return found
+
+
+def legacy_contains(text, keywords):
+    return any(k in text for k in keywords)
+
+
+def main(number=20000):
+    for text in SAMPLES:
+        assert legacy_extract(text) == _extract_keywords(text), text
+
+    print(f"=== Keyword extraction ({len(SAMPLES)} descriptions x {number} runs) ===")
+    legacy = timeit.timeit(lambda: [legacy_extract(t) for t in SAMPLES], number=number)
+    compiled = timeit.timeit(lambda: [_extract_keywords(t) for t in SAMPLES], number=number)
+    print(f"  legacy:   {legacy:.3f}s")
+    print(f"  matcher:  {compiled:.3f}s  ({legacy / compiled:.1f}x faster)")
+
+    keywords = ["无", "空", "微", "弱", "无根", "豁"]
+    matcher = KeywordMatcher(keywords)
+    print(f"\n=== Containment check ({len(keywords)} keywords) ===")
+    legacy = timeit.timeit(lambda: [legacy_contains(t, keywords) for t in SAMPLES], number=number)
+    compiled = timeit.timeit(lambda: [matcher.contains_any(t) for t in SAMPLES], number=number)
+    print(f"  legacy:   {legacy:.3f}s")
+    print(f"  matcher:  {compiled:.3f}s  ({legacy / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: ILIKE scan vs FTS5 trigram index for patient name / phone / pinyin search.
+
+Fills a temporary SQLite database with synthetic patients (Chinese names with
+pinyin, 11-digit phones) and times _query_patients_by_name with and without
+the trigram shadow table. Queries of fewer than 3 characters always use ILIKE.
+
+Usage: python scripts/benchmark_patient_search.py [n_patients ...]   (default: 50000 500000)
+"""
+import sys
+import os
+import random
+import tempfile
+import time
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from pypinyin import lazy_pinyin
+
+from src.database.models import Base, Patient
+from src.database import search_index
+from src.services.search_service import _query_patients_by_name
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红鹏飞宇浩然子涵梓轩欣怡晨阳思雨佳琪"
+ROUNDS = 20
+
+
+def fill(engine, n):
+    rng = random.Random(n)
+    pinyin_of = {ch: lazy_pinyin(ch)[0] for ch in SURNAMES + GIVEN}
+    rows = []
+    with engine.begin() as conn:
+        for i in range(n):
+            name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2)))
+            rows.append({
+                "name": name,
+                "pinyin": "".join(pinyin_of[ch] for ch in name),
+                "phone": "1" + "".join(rng.choice("0123456789") for _ in range(10)),
+                "uuid": f"{i:032x}",
+            })
+            if len(rows) == 10000:
+                conn.execute(insert(Patient), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(Patient), rows)
+
+
+def timed(db, query):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        results = _query_patients_by_name(db, query)
+    return (time.perf_counter() - start) / ROUNDS * 1000, len(results)
+
+
+def run(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        fill(engine, n)
+        db = sessionmaker(bind=engine)()
+        queries = ["zhangwei", "欧阳明", "13800", "qiuhua", "王"]
+
+        baseline = {q: timed(db, q) for q in queries}
+        start = time.perf_counter()
+        search_index.ensure_patient_search_index(engine)
+        build = time.perf_counter() - start
+        indexed = {q: timed(db, q) for q in queries}
+
+        print(f"{n} patients (index build {build:.1f}s)")
+        for q in queries:
+            (t0, n0), (t1, n1) = baseline[q], indexed[q]
+            print(f"  {q!r:12} ILIKE {t0:8.2f} ms   trigram {t1:8.2f} ms   ({n0}/{n1} hits)")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    for n in [int(a) for a in sys.argv[1:]] or [50000, 500000]:
+        run(n)
@@ -0,0 +1,81 @@
+"""
+Benchmark: 4D 八纲 vector mode vs per-position bitmask mode for similar-record search.
+
+Builds a synthetic teacher corpus from archetype pulse grids plus noisy variants
+(keyword swaps, dropped cells). A hit is relevant when it comes from the same
+archetype as the query. Reports per-query latency and precision@k for each mode.
+
+Usage: python scripts/benchmark_similarity_modes.py [corpus_size]
+"""
+import sys
+import os
+import random
+import time
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.pulse_index import PulseVectorIndex, RecordMeta
+from src.services.search_service import (
+    PULSE_KEYWORD_VECTORS, _GRID_POSITIONS, _grid_to_vector, _grid_to_position_bits, _position_weights,
+)
+
+KEYWORDS = list(PULSE_KEYWORD_VECTORS.keys())
+POSITIONS = [p for p in _GRID_POSITIONS if p.startswith(("left-", "right-"))]
+
+
+def random_grid(rng):
+    cells = rng.sample(POSITIONS, rng.randint(4, 8))
+    grid = {pos: "".join(rng.sample(KEYWORDS, rng.randint(1, 3))) for pos in cells}
+    grid["overall_description"] = "".join(rng.sample(KEYWORDS, 2))
+    return grid
+
+
+def variant(rng, grid):
+    noisy = {}
+    for pos, text in grid.items():
+        if pos != "overall_description" and rng.random() < 0.1:
+            continue  # dropped cell
+        if rng.random() < 0.25:
+            text = text + rng.choice(KEYWORDS)  # extra quality noted
+        noisy[pos] = text
+    return noisy
+
+
+def main(corpus_size=20000, archetypes=100, queries=200, k=5):
+    rng = random.Random(42)
+    bases = [random_grid(rng) for _ in range(archetypes)]
+    labels, entries = {}, []
+    for record_id in range(1, corpus_size + 1):
+        label = rng.randrange(archetypes)
+        grid = variant(rng, bases[label])
+        labels[record_id] = label
+        entries.append((record_id, _grid_to_vector(grid), None, RecordMeta(), _grid_to_position_bits(grid)))
+
+    index = PulseVectorIndex()
+    t0 = time.perf_counter()
+    index.build(entries)
+    print(f"Corpus: {corpus_size} records, {archetypes} archetypes (index build {time.perf_counter() - t0:.2f}s)")
+
+    query_set = []
+    for _ in range(queries):
+        label = rng.randrange(archetypes)
+        query_set.append((label, variant(rng, bases[label])))
+    weights = _position_weights()
+
+    modes = {
+        "vector (4D)": lambda g: index.query(_grid_to_vector(g), k=k),
+        "position (bitset)": lambda g: index.query_positions(_grid_to_position_bits(g), weights, k=k),
+    }
+    for name, run in modes.items():
+        relevant, elapsed = 0, 0.0
+        for label, grid in query_set:
+            t0 = time.perf_counter()
+            hits = run(grid)
+            elapsed += time.perf_counter() - t0
+            relevant += sum(1 for record_id, _, _ in hits if labels[record_id] == label)
+        print(f"  {name:18s} latency {elapsed / queries * 1000:7.2f} ms/query   precision@{k} {relevant / (queries * k):.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
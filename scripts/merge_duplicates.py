@@ -5,6 +5,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy import func, text
 from src.database.connection import SessionLocal
 from src.database.models import Patient, MedicalRecord
+from src.database.change_log import log_changes
 
 def merge_duplicates():
     db = SessionLocal()
@@ -30,6 +31,11 @@ def merge_duplicates():
             duplicates = [p for p in patients if p.id != primary.id]
             
             for dup in duplicates:
+                # Raw SQL bypasses the ORM change-log hook; log the changes for sync
+                moved = [u for (u,) in db.query(MedicalRecord.uuid).filter(MedicalRecord.patient_id == dup.id)]
+                log_changes(db, MedicalRecord.__tablename__, moved, "update")
+                log_changes(db, Patient.__tablename__, [dup.uuid], "delete")
+
                 # Move medical records to primary patient
                 db.execute(
                     text("UPDATE medical_records SET patient_id = :primary_id, sync_status = 'pending' WHERE patient_id = :dup_id"),
@@ -6,6 +6,8 @@ from sqlalchemy import text
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.database.connection import get_cloud_db
+from src.database.search_index import ensure_patient_search_index
+from src.database.models import ChangeLog
 
 def migrate_cloud():
     print("Migrating Cloud Database...")
@@ -59,8 +61,28 @@ def migrate_cloud():
                 db.rollback()
                 
             db.commit()
+
+            # The bulk push upserts with ON CONFLICT (uuid), which needs a unique index
+            # (ix_{table}_uuid above is a plain one)
+            try:
+                db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table}_uuid ON {table} (uuid)"))
+                db.commit()
+            except Exception as e:
+                print(f"Error adding unique uuid index to {table} (duplicate uuids?): {e}")
+                db.rollback()
+
             print(f"Table {table} migrated.")
 
+        # Change log read by sync_down of every client
+        ChangeLog.__table__.create(bind=db.get_bind(), checkfirst=True)
+        print("Change log table ready.")
+
+        # Trigram indexes for patient name/phone/pinyin ILIKE search
+        if ensure_patient_search_index(db.get_bind()):
+            print("Patient pg_trgm search indexes ready.")
+        else:
+            print("Could not create pg_trgm indexes (extension unavailable?); search falls back to scans.")
+
         print("Cloud migration completed.")
         
     except Exception as e:
@@ -0,0 +1,37 @@
+"""
+Train the local pulse vector model from the LLM vectors cached on teacher records.
+
+Run `POST /api/records/precompute-vectors` (or precompute_pulse_vectors) first so
+the records carry LLM vectors. The script then fits the model, saves it to
+PULSE_MODEL_PATH and prints the held-out calibration report, next to the same
+error for plain keyword vectors.
+
+Usage: python scripts/train_pulse_model.py [holdout_fraction] [l2]
+"""
+import sys
+import os
+import json
+
+# Add src to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import SessionLocal
+from src.services import search_service
+from src.services.llm_service import llm_service
+from src.services.pulse_model import PULSE_MODEL_PATH
+
+
+def main():
+    holdout = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    l2 = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    db = SessionLocal()
+    try:
+        report = search_service.train_pulse_model(db, llm_service, holdout=holdout, l2=l2)
+    finally:
+        db.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Saved model to {PULSE_MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Change log (outbox) for synced tables.
+
+A before_flush hook on every Session appends one change_log entry per inserted,
+updated or deleted SyncMixin row, so the entry commits or rolls back together
+with the change itself. Updates that only touch sync bookkeeping (sync_status,
+last_synced_at) are not logged, and neither they nor rows written by the sync
+engine bump updated_at: it is the row version compared across databases
+(see src/services/merkle.py), so it must only move on real local edits.
+
+Session.info controls the hook:
+- "sync_origin": origin recorded for the changes. Sessions of the sync engine set
+  it (the remote origin when applying pulled rows, the node id when writing to
+  the cloud); ordinary app sessions leave it unset, which logs 'local' and marks
+  updated rows pending.
+- "sync_origins": {uuid: origin} overriding "sync_origin" per row, for pulled
+  chunks whose rows come from different writers.
+- "change_log": False turns logging off, e.g. for a cloud database that has no
+  change_log table yet.
+
+Writes that bypass the ORM unit of work (raw SQL, Query.update/delete) must call
+log_changes() themselves.
+"""
+import os
+import uuid as uuid_lib
+import weakref
+from typing import Iterable
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from .models import ChangeLog, SyncMixin, SyncState
+
+LOCAL_ORIGIN = "local"
+# Overrides the node id generated for this installation (see node_id)
+SYNC_NODE_ID = os.getenv("SYNC_NODE_ID")
+
+_NODE_DIRECTION = "self"
+_node_ids = weakref.WeakKeyDictionary()  # engine -> node id
+
+_BOOKKEEPING = {"sync_status", "last_synced_at"}
+# Maintained by the database layer (onupdate), not edited: a change alone is no edit
+_DERIVED = {"updated_at"}
+
+
+def _changed_columns(obj) -> set:
+    # Columns only: relationships such as MedicalRecord.pulse_vectors hold local derived
+    # rows, and assigning them is no edit of the synced row
+    state = inspect(obj)
+    return {attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+
+
+def node_id(db: Session) -> str:
+    """
+    Identifies this installation in the cloud change log, so it skips its own changes on pull.
+    Generated once per local database and kept in sync_state, in the peer column of the
+    row with direction 'self': hostnames repeat across boxes built from one image.
+    """
+    if SYNC_NODE_ID:
+        return SYNC_NODE_ID
+    engine = db.get_bind()
+    cached = _node_ids.get(engine)
+    if cached is None:
+        query = db.query(SyncState).filter(SyncState.direction == _NODE_DIRECTION).order_by(SyncState.id)
+        row = query.first()
+        if row is None:
+            db.add(SyncState(peer=str(uuid_lib.uuid4()), direction=_NODE_DIRECTION))
+            db.commit()
+            # Another process may have raced us; the oldest row is the id
+            row = query.first()
+        cached = _node_ids[engine] = row.peer
+    return cached
+
+
+def log_changes(db: Session, table_name: str, uuids: Iterable[str], op: str, origin: str = None):
+    """Log changes made outside the ORM unit of work, in the caller's transaction."""
+    origin = origin or db.info.get("sync_origin") or LOCAL_ORIGIN
+    entries = [ChangeLog(table_name=table_name, row_uuid=u, op=op, origin=origin) for u in uuids]
+    db.add_all(entries)
+
+
+def _keep_version(obj):
+    # An attribute in the UPDATE's SET clause suppresses its onupdate default
+    if "updated_at" in inspect(obj).dict:
+        flag_modified(obj, "updated_at")
+
+
+@event.listens_for(Session, "before_flush")
+def _log_flushed_changes(session: Session, flush_context, instances):
+    origin = session.info.get("sync_origin")
+    edited = []
+    for obj in session.dirty:
+        if not isinstance(obj, SyncMixin):
+            continue
+        changed = _changed_columns(obj)
+        if changed - _BOOKKEEPING - _DERIVED:
+            edited.append(obj)
+            if origin is not None:
+                _keep_version(obj)
+        elif changed:
+            _keep_version(obj)
+    if session.info.get("change_log") is False:
+        return
+    row_origins = session.info.get("sync_origins") or {}
+    entries = []
+    for op, objects in (("insert", session.new), ("update", edited), ("delete", session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, SyncMixin):
+                continue
+            if op == "update" and origin is None:
+                # Edited here: the row has to go up again
+                obj.sync_status = "pending"
+            if obj.uuid is None:
+                # The column default only fires on INSERT, after this hook
+                obj.uuid = str(uuid_lib.uuid4())
+            entries.append(ChangeLog(
+                table_name=obj.__tablename__, row_uuid=obj.uuid, op=op,
+                origin=row_origins.get(obj.uuid) or origin or LOCAL_ORIGIN,
+            ))
+    if entries:
+        session.add_all(entries)
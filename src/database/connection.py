@@ -27,7 +27,9 @@ if CLOUD_DATABASE_URL and CLOUD_DATABASE_URL.startswith("postgresql"):
             CLOUD_DATABASE_URL, 
             pool_size=5, 
             max_overflow=10,
-            pool_timeout=30
+            pool_timeout=30,
+            # Fail fast on unreachable hosts; the circuit breaker takes it from there
+            connect_args={"connect_timeout": int(os.getenv("CLOUD_CONNECT_TIMEOUT", "5"))}
         )
         SessionCloud = sessionmaker(autocommit=False, autoflush=False, bind=cloud_engine)
         print("Cloud database engine configured.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Boolean, Float, LargeBinary, UniqueConstraint, func
 from sqlalchemy.types import JSON
 from sqlalchemy.orm import relationship, declarative_mixin
 from datetime import datetime
@@ -99,6 +99,53 @@ class MedicalRecord(Base, SyncMixin):
     patient = relationship("Patient", back_populates="records")
     practitioner = relationship("Practitioner", back_populates="records")
     user = relationship("User", back_populates="records")
+    pulse_vectors = relationship("PulseVector", uselist=False, cascade="all, delete-orphan")
+
+class PulseVector(Base):
+    """
+    Typed copy of a record's 八纲 pulse vectors [虚实, 阴阳, 表里, 寒热].
+    Derived from MedicalRecord.data on the local DB only (not synced), so similarity
+    search can prefilter by per-axis range in SQL without decoding JSON blobs.
+    """
+    __tablename__ = "pulse_vectors"
+
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True)
+
+    # Keyword-derived vector (always present)
+    kw_xu_shi = Column(Float, nullable=False)
+    kw_yin_yang = Column(Float, nullable=False)
+    kw_biao_li = Column(Float, nullable=False)
+    kw_han_re = Column(Float, nullable=False)
+    kw_revision = Column(String(16), nullable=False)  # Fingerprint of keyword table + weights
+
+    # LLM-derived vector (optional)
+    llm_xu_shi = Column(Float, nullable=True)
+    llm_yin_yang = Column(Float, nullable=True)
+    llm_biao_li = Column(Float, nullable=True)
+    llm_han_re = Column(Float, nullable=True)
+    llm_model = Column(String, nullable=True)  # "<model>@<prompt version>", or "unknown" for legacy
+
+    # Per-position keyword bitmasks (uint32 per grid cell), covered by kw_revision
+    position_bits = Column(LargeBinary, nullable=True)
+
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        Index("ix_pulse_vectors_kw_box", "kw_xu_shi", "kw_yin_yang", "kw_biao_li", "kw_han_re"),
+        Index("ix_pulse_vectors_llm_box", "llm_xu_shi", "llm_yin_yang", "llm_biao_li", "llm_han_re"),
+    )
+
+    KW_COLUMNS = ("kw_xu_shi", "kw_yin_yang", "kw_biao_li", "kw_han_re")
+    LLM_COLUMNS = ("llm_xu_shi", "llm_yin_yang", "llm_biao_li", "llm_han_re")
+
+    @property
+    def keyword_vector(self):
+        return [getattr(self, c) for c in self.KW_COLUMNS]
+
+    @property
+    def llm_vector(self):
+        vec = [getattr(self, c) for c in self.LLM_COLUMNS]
+        return None if any(v is None for v in vec) else vec
 
 class RecordPermission(Base):
     """Patient-level permission grants between users."""
@@ -114,3 +161,85 @@ class RecordPermission(Base):
     user = relationship("User", foreign_keys=[user_id])
     patient = relationship("Patient")
     granter = relationship("User", foreign_keys=[granted_by])
+
+class LLMVectorCache(Base):
+    """
+    Content-addressed cache of LLM pulse vectors for query grids.
+    Keyed by a hash of the normalized grid plus model and prompt version (local only, not synced).
+    """
+    __tablename__ = "llm_vector_cache"
+
+    cache_key = Column(String(64), primary_key=True)  # sha256 hex
+    model_revision = Column(String, nullable=False)  # "<model>@<prompt version>"
+
+    xu_shi = Column(Float, nullable=False)
+    yin_yang = Column(Float, nullable=False)
+    biao_li = Column(Float, nullable=False)
+    han_re = Column(Float, nullable=False)
+
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, index=True)
+    last_used_at = Column(DateTime, default=datetime.now, index=True)
+
+    @property
+    def vector(self):
+        return [self.xu_shi, self.yin_yang, self.biao_li, self.han_re]
+
+class JobCheckpoint(Base):
+    """
+    Progress of a resumable background job (local only, not synced).
+    last_record_id is committed together with the results of each chunk, so a job
+    interrupted by a restart continues after the last finished chunk.
+    """
+    __tablename__ = "job_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)  # e.g. 'pulse_vectors'
+    revision = Column(String, nullable=True)  # Results from another revision are not resumed
+    status = Column(String, nullable=False, default="running")  # 'running', 'completed', 'cancelled', 'failed'
+
+    last_record_id = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    updated = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+class ChangeLog(Base):
+    """
+    Append-only log of inserts, updates and deletes of synced rows, one entry per row change.
+    Written in the same transaction as the change (see change_log.py); seq only ever grows,
+    so peers read the changes after the last seq they acknowledged. Exists on both databases.
+    """
+    __tablename__ = "change_log"
+    __table_args__ = {"sqlite_autoincrement": True}  # Never reuse seqs of pruned entries
+
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_uuid = Column(String(36), nullable=False)
+    op = Column(String(10), nullable=False)  # 'insert', 'update', 'delete', 'upsert'
+    # 'local' for changes made on this database, else the node id of the sync client that wrote them
+    origin = Column(String, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class SyncState(Base):
+    """
+    Change-log high-water marks per sync peer and direction (local only, not synced).
+    'up' holds the last local seq pushed, 'down' the last peer seq pulled; NULL means
+    no change-log sync has completed yet.
+    """
+    __tablename__ = "sync_state"
+    __table_args__ = (UniqueConstraint("peer", "direction"),)
+
+    id = Column(Integer, primary_key=True)
+    peer = Column(String, nullable=False)  # e.g. 'cloud'
+    direction = Column(String, nullable=False)  # 'up' or 'down'
+    last_seq = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Registers the session hook that writes change_log entries
+from . import change_log  # noqa: E402,F401
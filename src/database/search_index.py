@@ -0,0 +1,117 @@
+"""
+Substring search index for patient name / phone / pinyin.
+
+- SQLite (local): an FTS5 shadow table with the trigram tokenizer over the
+  patients table (external content), kept in sync by triggers. That covers ORM
+  writes, raw SQL and duplicate merges alike.
+- PostgreSQL (cloud): pg_trgm GIN indexes. The planner uses them for the
+  existing ILIKE '%q%' predicates without any change to the query.
+
+Trigrams only help for queries of 3+ characters, so shorter queries (and
+databases without the index) keep the plain ILIKE scan.
+"""
+import logging
+import weakref
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "patients_fts"
+MIN_TRIGRAM_QUERY = 3
+
+_SEARCH_COLUMNS = ("name", "phone", "pinyin")
+
+_SQLITE_TRIGGERS = {
+    "patients_fts_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, phone, pinyin) VALUES (new.id, new.name, new.phone, new.pinyin);
+        END""",
+    "patients_fts_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, phone, pinyin)
+            VALUES ('delete', old.id, old.name, old.phone, old.pinyin);
+        END""",
+    "patients_fts_au": f"""
+        CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF name, phone, pinyin ON patients BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, phone, pinyin)
+            VALUES ('delete', old.id, old.name, old.phone, old.pinyin);
+            INSERT INTO {FTS_TABLE}(rowid, name, phone, pinyin) VALUES (new.id, new.name, new.phone, new.pinyin);
+        END""",
+}
+
+# Engines on which the index was verified; anything else takes the ILIKE path
+_indexed_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def _ensure_sqlite(conn) -> None:
+    existing = {row[0] for row in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE name = :fts OR (type = 'trigger' AND tbl_name = 'patients')"
+    ), {"fts": FTS_TABLE})}
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(_SEARCH_COLUMNS)}, content='patients', content_rowid='id', tokenize='trigram')"
+    ))
+    for ddl in _SQLITE_TRIGGERS.values():
+        conn.execute(text(ddl))
+    # A new table, or writes made while a trigger was missing: rebuild from the content table
+    if FTS_TABLE not in existing or not set(_SQLITE_TRIGGERS) <= existing:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        logger.info("Rebuilt patient trigram search index.")
+
+
+def _ensure_postgresql(conn) -> None:
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for column in _SEARCH_COLUMNS:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_patients_{column}_trgm ON patients USING gin ({column} gin_trgm_ops)"
+        ))
+
+
+def ensure_patient_search_index(engine: Engine) -> bool:
+    """
+    Create (or repair) the patient search index on engine. Returns whether it is usable.
+    Safe to call on every startup; failures (old SQLite without FTS5 trigram,
+    no permission for CREATE EXTENSION) only log and leave the ILIKE fallback.
+    """
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                _ensure_sqlite(conn)
+            elif dialect == "postgresql":
+                _ensure_postgresql(conn)
+            else:
+                return False
+    except Exception as e:
+        logger.warning(f"Patient search index unavailable on {dialect}: {e}")
+        _indexed_engines.discard(engine)
+        return False
+    _indexed_engines.add(engine)
+    return True
+
+
+def drop_patient_search_index(engine: Engine) -> None:
+    """Remove the SQLite shadow table and triggers (e.g. before dropping patients)."""
+    _indexed_engines.discard(engine)
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        for name in _SQLITE_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def uses_fts(engine: Engine, query_str: str) -> bool:
+    """Whether a search for query_str on engine should go through the FTS5 table."""
+    return (
+        engine.dialect.name == "sqlite"
+        and engine in _indexed_engines
+        and len(query_str) >= MIN_TRIGRAM_QUERY
+    )
+
+
+def fts_match_expression(query_str: str) -> str:
+    """Quote query_str as a single FTS5 phrase: a literal substring, no query operators."""
+    return '"' + query_str.replace('"', '""') + '"'
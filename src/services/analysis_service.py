@@ -1,4 +1,16 @@
 from typing import Dict, Any
+from src.utils.keyword_matcher import KeywordMatcher
+
+# Keyword sets compiled once at import and shared across calls
+_TIGHT_WIRY = KeywordMatcher(["紧", "弦"])
+_FLOATING_WEAK = KeywordMatcher(["细", "弱", "微", "无"])
+_OVERALL_WEAK = KeywordMatcher(["细", "弱", "虚"])
+_DEEP_EMPTY = KeywordMatcher(["无", "空", "微", "弱"])
+_OVERALL_ROOTLESS = KeywordMatcher(["无根", "空", "豁"])
+_MIDDLE_EMPTY = KeywordMatcher(["空", "无", "弱"])
+_FLOATING_EXCESS = KeywordMatcher(["大", "浮", "紧", "弦", "细"])
+_WARMING_HERBS = KeywordMatcher(["附子", "干姜", "肉桂", "桂枝", "细辛", "吴茱萸"])
+_CLEARING_HERBS = KeywordMatcher(["石膏", "知母", "黄连", "黄芩", "大黄"])
 
 def analyze_pulse_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -40,30 +52,23 @@ def analyze_pulse_data(data: Dict[str, Any]) -> Dict[str, Any]:
         
     overall_pulse = pulse_grid.get("overall_description", "")
     
-    def check_keywords(qualities, keywords):
-        for q in qualities:
-            for k in keywords:
-                if k in q:
-                    return True
-        return False
+    def check_keywords(qualities, matcher):
+        return any(matcher.contains_any(q) for q in qualities)
     
-    def check_overall(keywords):
-        for k in keywords:
-            if k in overall_pulse:
-                return True
-        return False
+    def check_overall(matcher):
+        return matcher.contains_any(overall_pulse)
 
-    is_floating_tight = check_keywords(fu_qualities, ["紧", "弦"]) or check_overall(["紧", "弦"])
-    is_floating_weak = check_keywords(fu_qualities, ["细", "弱", "微", "无"]) or check_overall(["细", "弱", "虚"])
-    is_deep_empty = check_keywords(chen_qualities, ["无", "空", "微", "弱"]) or check_overall(["无根", "空", "豁"])
-    is_middle_empty = check_keywords(zhong_qualities, ["空", "无", "弱"])
+    is_floating_tight = check_keywords(fu_qualities, _TIGHT_WIRY) or check_overall(_TIGHT_WIRY)
+    is_floating_weak = check_keywords(fu_qualities, _FLOATING_WEAK) or check_overall(_OVERALL_WEAK)
+    is_deep_empty = check_keywords(chen_qualities, _DEEP_EMPTY) or check_overall(_OVERALL_ROOTLESS)
+    is_middle_empty = check_keywords(zhong_qualities, _MIDDLE_EMPTY)
     
     # 2. Logic Engine
     pattern = "Unknown"
     consistency_comment = ""
     suggestion = ""
     
-    if is_deep_empty and (check_keywords(fu_qualities, ["大", "浮", "紧", "弦", "细"])):
+    if is_deep_empty and check_keywords(fu_qualities, _FLOATING_EXCESS):
         pattern = "Rootless Yang"
         consistency_comment = (
             "【郑钦安视角】脉象呈现“寸关尺浮取可见，但沉取无力或空虚”，此乃“阳气外浮，下元虚寒”之象。\n"
@@ -110,11 +115,8 @@ def analyze_pulse_data(data: Dict[str, Any]) -> Dict[str, Any]:
     if not prescription or len(prescription) < 2:
         prescription_comment = "未提供完整处方，无法进行具体药物对证分析。"
     else:
-        warming_herbs = ["附子", "干姜", "肉桂", "桂枝", "细辛", "吴茱萸"]
-        clearing_herbs = ["石膏", "知母", "黄连", "黄芩", "大黄"]
-        
-        has_warming = check_keywords([prescription], warming_herbs)
-        has_clearing = check_keywords([prescription], clearing_herbs)
+        has_warming = _WARMING_HERBS.contains_any(prescription)
+        has_clearing = _CLEARING_HERBS.contains_any(prescription)
         
         if pattern == "Rootless Yang":
             if has_warming:
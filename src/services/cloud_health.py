@@ -0,0 +1,177 @@
+"""Circuit breaker and health state for the cloud database.
+
+Every cloud access (hybrid search, sync) asks the breaker first. After
+CLOUD_BREAKER_FAILURES consecutive connection failures it opens and callers
+skip the cloud immediately instead of waiting on driver timeouts. Once the
+backoff has elapsed, one caller gets through as a half-open probe. If the probe
+succeeds the breaker closes again. If it fails, the backoff doubles, up to
+CLOUD_BREAKER_MAX_BACKOFF_SECONDS.
+
+Only connectivity errors of the cloud engine count as failures (see
+watch_engine). A statement that reaches the server and fails there (constraint
+violation, bad SQL, deadlock, statement timeout) still shows the cloud is up,
+and errors of the local database never touch the breaker.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from src.database.connection import cloud_engine
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_connection_error(exc: BaseException) -> bool:
+    """Whether exc means the cloud could not be reached (as opposed to a failing statement)."""
+    if isinstance(exc, DBAPIError):
+        # Drivers report connect failures and server-side errors alike (psycopg2 raises
+        # OperationalError for deadlocks and statement timeouts too), so only the
+        # watched engine's classification counts
+        return getattr(exc, "cloud_unreachable", False)
+    return isinstance(exc, (PoolTimeoutError, ConnectionError, TimeoutError, OSError))
+
+
+def _mark_unreachable(context):
+    # No connection yet (connect failed) or the driver reported a disconnect
+    if context.sqlalchemy_exception is not None:
+        context.sqlalchemy_exception.cloud_unreachable = context.connection is None or context.is_disconnect
+
+
+def watch_engine(engine):
+    """Classify DBAPI errors raised on engine for is_connection_error; idempotent."""
+    if not event.contains(engine, "handle_error", _mark_unreachable):
+        event.listen(engine, "handle_error", _mark_unreachable)
+
+
+class CircuitBreaker:
+    """Thread-safe closed / open / half-open breaker with exponential backoff between probes."""
+
+    def __init__(self, name: str, failure_threshold: int = 3, base_backoff: float = 5.0,
+                 max_backoff: float = 300.0, probe_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # A half-open probe that never reports back frees the slot after this long
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._open_streak = 0
+            self._next_probe_at: Optional[float] = None
+            self._probe_started_at: Optional[float] = None
+            self._last_error: Optional[str] = None
+            self._last_failure: Optional[datetime] = None
+            self._last_success: Optional[datetime] = None
+            self._metrics = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0, "probes": 0}
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _backoff(self) -> float:
+        return min(self.max_backoff, self.base_backoff * (2 ** max(0, self._open_streak - 1)))
+
+    def allow_request(self) -> bool:
+        """True if the caller may try the cloud now; False means skip it without waiting."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and now - self._probe_started_at < self.probe_timeout:
+                self._metrics["rejected"] += 1
+                return False
+            if self._state == OPEN and now < self._next_probe_at:
+                self._metrics["rejected"] += 1
+                return False
+            # Backoff elapsed (or the previous probe went silent): this caller is the probe
+            self._state = HALF_OPEN
+            self._probe_started_at = now
+            self._metrics["probes"] += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"{self.name} circuit closed; backend reachable again.")
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._open_streak = 0
+            self._probe_started_at = None
+            self._next_probe_at = None
+            self._last_success = datetime.now()
+            self._metrics["successes"] += 1
+
+    def record_failure(self, error: BaseException = None):
+        now = time.monotonic()
+        with self._lock:
+            self._consecutive_failures += 1
+            self._metrics["failures"] += 1
+            self._last_error = str(error) if error is not None else None
+            self._last_failure = datetime.now()
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._open_streak += 1
+                self._next_probe_at = now + self._backoff()
+                self._probe_started_at = None
+                self._metrics["opened"] += 1
+                logger.warning(f"{self.name} circuit open for {self._backoff():.0f}s after: {self._last_error}")
+
+    @contextmanager
+    def track(self):
+        """Record the outcome of the cloud access in the with-block; exceptions propagate."""
+        try:
+            yield
+        except Exception as e:
+            if is_connection_error(e):
+                self.record_failure(e)
+            else:
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State and counters for the health endpoint."""
+        now = time.monotonic()
+        with self._lock:
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(max(0.0, self._next_probe_at - now), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "backoff_seconds": self._backoff() if self._open_streak else 0.0,
+                "retry_in_seconds": retry_in,
+                "last_error": self._last_error,
+                "last_failure_at": self._last_failure.isoformat() if self._last_failure else None,
+                "last_success_at": self._last_success.isoformat() if self._last_success else None,
+                **self._metrics,
+            }
+
+
+cloud_health = CircuitBreaker(
+    "cloud",
+    failure_threshold=int(os.getenv("CLOUD_BREAKER_FAILURES", "3")),
+    base_backoff=float(os.getenv("CLOUD_BREAKER_BACKOFF_SECONDS", "5")),
+    max_backoff=float(os.getenv("CLOUD_BREAKER_MAX_BACKOFF_SECONDS", "300")),
+)
+
+if cloud_engine is not None:
+    watch_engine(cloud_engine)
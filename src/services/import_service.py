@@ -6,6 +6,7 @@ from typing import Dict, Any, List
 import pandas as pd
 from sqlalchemy.orm import Session
 from src.database.models import Patient, MedicalRecord, Practitioner, User
+from src.services.patient_suggest import patient_suggest
 
 class ImportService:
     def process_excel_import(self, file_contents: bytes, db: Session, current_user_id: int):
@@ -146,6 +147,8 @@ class ImportService:
                 skipped += 1
         
         db.commit()
+        # Bulk insert: let suggestion scopes reload instead of patching them row by row
+        patient_suggest.invalidate()
         
         return {
             "status": "success",
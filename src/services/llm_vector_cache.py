@@ -0,0 +1,150 @@
+"""Persistent cache of LLM pulse vectors for query grids.
+
+Repeat similarity searches on the same grid skip the LLM round-trip entirely.
+Entries live in the local llm_vector_cache table with TTL and size-based eviction,
+and concurrent identical requests share a single in-flight LLM call.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from src.database.models import LLMVectorCache
+
+logger = logging.getLogger(__name__)
+
+LLM_VECTOR_CACHE_TTL_DAYS = int(os.getenv("LLM_VECTOR_CACHE_TTL_DAYS", "30"))
+LLM_VECTOR_CACHE_MAX_ENTRIES = int(os.getenv("LLM_VECTOR_CACHE_MAX_ENTRIES", "10000"))
+# How long a follower waits for the leader's in-flight LLM call
+_INFLIGHT_WAIT_SECONDS = 120
+
+
+def make_cache_key(normalized_grid: Any, model_revision: str) -> str:
+    """Canonical sha256 over the normalized grid plus model/prompt revision."""
+    payload = json.dumps([normalized_grid, model_revision], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[List[float]] = None
+
+
+_inflight: Dict[str, _Flight] = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key: str, compute: Callable[[], Optional[List[float]]]) -> Optional[List[float]]:
+    """Run compute() once per key at a time; concurrent callers with the same key share its result."""
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        flight.done.wait(_INFLIGHT_WAIT_SECONDS)
+        return flight.result
+
+    try:
+        flight.result = compute()
+        return flight.result
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def _cache_session(db: Session) -> Session:
+    """A short-lived session on the caller's engine: cache writes never commit the caller's transaction."""
+    return Session(bind=db.get_bind(), autoflush=False)
+
+
+def _lookup(db: Session, key: str) -> Optional[List[float]]:
+    row = db.get(LLMVectorCache, key)
+    if row is None:
+        return None
+    now = datetime.now()
+    expired = row.created_at and row.created_at < now - timedelta(days=LLM_VECTOR_CACHE_TTL_DAYS)
+    vector = None if expired else row.vector
+    # Hit counts and recency only steer eviction: a failed write must not fail the search
+    cache_db = _cache_session(db)
+    try:
+        entry = cache_db.query(LLMVectorCache).filter(LLMVectorCache.cache_key == key)
+        if expired:
+            entry.delete(synchronize_session=False)
+        else:
+            entry.update({
+                LLMVectorCache.hit_count: func.coalesce(LLMVectorCache.hit_count, 0) + 1,
+                LLMVectorCache.last_used_at: now,
+            }, synchronize_session=False)
+        cache_db.commit()
+    except SQLAlchemyError as e:
+        cache_db.rollback()
+        logger.warning(f"Could not update LLM vector cache entry: {e}")
+    finally:
+        cache_db.close()
+    return vector
+
+
+def _store(db: Session, key: str, model_revision: str, vec: List[float]):
+    cache_db = _cache_session(db)
+    try:
+        cache_db.merge(LLMVectorCache(
+            cache_key=key,
+            model_revision=model_revision,
+            xu_shi=vec[0], yin_yang=vec[1], biao_li=vec[2], han_re=vec[3],
+            hit_count=0,
+            created_at=datetime.now(),
+            last_used_at=datetime.now(),
+        ))
+        cache_db.commit()
+        evict_llm_vector_cache(cache_db)
+    except SQLAlchemyError as e:
+        cache_db.rollback()
+        logger.warning(f"Could not store LLM vector cache entry: {e}")
+    finally:
+        cache_db.close()
+
+
+def evict_llm_vector_cache(db: Session) -> int:
+    """Delete expired entries, then the least recently used ones above the size limit."""
+    cutoff = datetime.now() - timedelta(days=LLM_VECTOR_CACHE_TTL_DAYS)
+    removed = db.query(LLMVectorCache).filter(LLMVectorCache.created_at < cutoff).delete(synchronize_session=False)
+
+    overflow = db.query(LLMVectorCache).count() - LLM_VECTOR_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = db.query(LLMVectorCache.cache_key).order_by(
+            LLMVectorCache.last_used_at.asc()
+        ).limit(overflow).subquery()
+        removed += db.query(LLMVectorCache).filter(
+            LLMVectorCache.cache_key.in_(oldest.select())
+        ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+def get_or_compute(db: Session, key: str, model_revision: str,
+                   compute: Callable[[], Optional[List[float]]]) -> Optional[List[float]]:
+    """Return the cached vector for key, or compute it once (shared across concurrent callers) and cache it."""
+    cached = _lookup(db, key)
+    if cached is not None:
+        return cached
+
+    def compute_and_store():
+        vec = compute()
+        if vec is not None:
+            _store(db, key, model_revision, vec)
+        return vec
+
+    return single_flight(key, compute_and_store)
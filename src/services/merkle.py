@@ -0,0 +1,128 @@
+"""
+Merkle-style comparison of a synced table between two databases.
+
+Rows are bucketed by uuid prefix. A bucket's hash is the md5 of its rows'
+"uuid|updated_at" lines in uuid order, so a bucket has the same hash on both
+sides exactly when it holds the same row versions. Each prefix is the parent
+of the sixteen buckets one hex digit longer.
+
+Only live rows are compared. Deletes are hard locally but soft (tombstones) in
+the cloud, so a deleted row is absent on one side and flagged on the other;
+comparing tombstones would keep their buckets different forever.
+
+diff_buckets() walks that tree top-down: the whole table first, then only
+the children of buckets that differ. It stops at buckets of at most
+RECONCILE_LEAF_ROWS rows. Identical tables cost one hash per side; a few
+stray rows cost a few levels of 16 hashes each.
+
+On PostgreSQL the hashes are computed in the database (md5 over string_agg),
+so only the hashes cross the network. Other databases (the local SQLite)
+stream the (uuid, updated_at) columns and hash them in Python.
+"""
+import hashlib
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, literal, literal_column, or_, select, true
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+
+RECONCILE_LEAF_ROWS = int(os.getenv("RECONCILE_LEAF_ROWS", "256"))
+# uuid4 strings start with 8 hex digits before the first dash
+MAX_DEPTH = 8
+
+# Sorts after every character a uuid can contain
+_RANGE_END = "g"
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+_PG_TIMESTAMP_FORMAT = "YYYY-MM-DD HH24:MI:SS.US"
+
+Bucket = Tuple[int, str]  # (rows, md5 hex)
+
+
+def row_line(uuid: str, updated_at: Optional[datetime]) -> str:
+    stamp = updated_at.strftime(_TIMESTAMP_FORMAT) if updated_at else ""
+    return f"{uuid}|{stamp}"
+
+
+def version_column(model):
+    """The model's updated_at, or a NULL literal for tables without one."""
+    version = getattr(model, "updated_at", None)
+    return version if version is not None else literal(None)
+
+
+def _live(model, prefixes):
+    return and_(model.is_deleted.isnot(True), in_prefixes(model, prefixes))
+
+
+def in_prefixes(model, prefixes: Optional[List[str]]):
+    """uuid range filter for the given prefixes (None: whole table); uses the uuid index."""
+    if not prefixes or prefixes == [""]:
+        return true()
+    return or_(*(and_(model.uuid >= p, model.uuid < p + _RANGE_END) for p in prefixes))
+
+
+def row_versions(db: Session, model, prefixes: Optional[List[str]]):
+    """(uuid, updated_at) of the live rows under the prefixes, in uuid order."""
+    return db.query(model.uuid, version_column(model)).filter(
+        _live(model, prefixes)
+    ).order_by(model.uuid).yield_per(1000)
+
+
+def _pg_hashes(db: Session, model, depth: int, prefixes) -> Dict[str, Bucket]:
+    version = getattr(model, "updated_at", None)
+    stamp = func.coalesce(func.to_char(version, _PG_TIMESTAMP_FORMAT), "") if version is not None else literal("")
+    line = model.uuid + "|" + stamp
+    bucket = func.substr(model.uuid, 1, depth).label("bucket")
+    # COLLATE "C" orders bytewise, as Python sorts the uuids on the other side
+    agg = func.string_agg(line, aggregate_order_by(literal_column("E'\\n'"), model.uuid.collate("C")))
+    stmt = select(bucket, func.count(), func.md5(agg)).where(_live(model, prefixes)).group_by(bucket)
+    return {prefix: (count, digest) for prefix, count, digest in db.execute(stmt)}
+
+
+def _python_hashes(db: Session, model, depth: int, prefixes) -> Dict[str, Bucket]:
+    hashes, counts = {}, {}
+    for uuid, updated_at in row_versions(db, model, prefixes):
+        prefix = uuid[:depth]
+        digest = hashes.get(prefix)
+        if digest is None:
+            digest = hashes[prefix] = hashlib.md5()
+        else:
+            digest.update(b"\n")
+        digest.update(row_line(uuid, updated_at).encode())
+        counts[prefix] = counts.get(prefix, 0) + 1
+    return {prefix: (counts[prefix], digest.hexdigest()) for prefix, digest in hashes.items()}
+
+
+def bucket_hashes(db: Session, model, depth: int, prefixes: Optional[List[str]] = None) -> Dict[str, Bucket]:
+    """{prefix of `depth` chars: (rows, md5)} of the non-empty buckets under the given prefixes."""
+    if db.get_bind().dialect.name == "postgresql":
+        return _pg_hashes(db, model, depth, prefixes)
+    return _python_hashes(db, model, depth, prefixes)
+
+
+def diff_buckets(local_db: Session, cloud_db: Session, model,
+                 leaf_rows: int = None) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Prefixes of the smallest buckets whose contents differ between the two databases,
+    plus how many levels were compared and hashes exchanged with each side.
+    """
+    leaf_rows = leaf_rows or RECONCILE_LEAF_ROWS
+    leaves, frontier = [], None
+    stats = {"levels": 0, "hashes": 0}
+    for depth in range(MAX_DEPTH + 1):
+        local = bucket_hashes(local_db, model, depth, frontier)
+        cloud = bucket_hashes(cloud_db, model, depth, frontier)
+        stats["levels"] += 1
+        stats["hashes"] += len(cloud)
+        differing = sorted(p for p in set(local) | set(cloud) if local.get(p) != cloud.get(p))
+        frontier = []
+        for prefix in differing:
+            rows = max(local.get(prefix, (0, None))[0], cloud.get(prefix, (0, None))[0])
+            if rows <= leaf_rows or depth == MAX_DEPTH:
+                leaves.append(prefix)
+            else:
+                frontier.append(prefix)
+        if not frontier:
+            break
+    return leaves, stats
@@ -9,6 +9,17 @@ import sys
 
 os.environ["PADDLE_PDX_DISABLE_MODEL_SOURCE_CHECK"] = "True"
 
+# Runs as a standalone script; make the project root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.utils.keyword_matcher import KeywordMatcher
+
+_INFO_KEYWORDS = KeywordMatcher([
+    "姓名", "性别", "年龄", "岁", "男", "女",
+    "日期", "年", "月", "日", "科别", "门诊", "住院",
+    "诊断", "主诉", "病历", "处方", "医师", "药师",
+])
+
 
 def run_ocr(image_path: str) -> dict:
     from paddleocr import PaddleOCR
@@ -59,14 +70,8 @@ def run_ocr(image_path: str) -> dict:
 
 
 def classify_region(text: str) -> str:
-    info_keywords = [
-        "姓名", "性别", "年龄", "岁", "男", "女",
-        "日期", "年", "月", "日", "科别", "门诊", "住院",
-        "诊断", "主诉", "病历", "处方", "医师", "药师",
-    ]
-    for kw in info_keywords:
-        if kw in text:
-            return "info"
+    if _INFO_KEYWORDS.contains_any(text):
+        return "info"
     if len(text) <= 4 and any(c.isdigit() for c in text):
         return "info"
     return "medicine"
@@ -0,0 +1,298 @@
+"""In-memory prefix index for search-as-you-type patient suggestions.
+
+One index per account scope, since the same prefix must not surface patients
+outside the caller's scope:
+  ("all",)             admins: every patient
+  ("creator", id)      personal accounts: patients they created
+  ("practitioner", id) practitioners: patients they have records for
+
+Each patient is indexed under its name, full pinyin, pinyin initials, phone
+number and last four phone digits. A scope keeps its (key, patient_id) pairs
+sorted, so a prefix is one bisect range. Very common short prefixes ("z",
+"zh") cover thousands of keys; their ranked top-N is cached until a write
+touches that prefix.
+
+Scopes are built from the local DB on first use (or warmed at startup) and kept
+in an LRU of PATIENT_SUGGEST_MAX_SCOPES, which bounds memory. Saves update the
+loaded scopes incrementally. Bulk writes (import, sync pull) invalidate them.
+A scope loads without holding the index lock, so saves and other scopes'
+suggestions do not wait on it; saves made meanwhile are replayed onto it.
+"""
+import bisect
+import functools
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pypinyin import Style, lazy_pinyin
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from src.database.models import MedicalRecord, Patient
+from src.utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+PATIENT_SUGGEST_MAX_SCOPES = int(os.getenv("PATIENT_SUGGEST_MAX_SCOPES", "64"))
+# Prefix ranges up to this many keys are ranked on the fly; larger ones are cached
+_SCAN_LIMIT = 64
+_HOT_TOP_N = 50
+_PHONE_SUFFIX = 4
+_KEY_END = "\uffff"
+
+Scope = Tuple[Any, ...]
+
+
+class PatientEntry(NamedTuple):
+    id: int
+    name: str
+    gender: Optional[str]
+    age: Optional[int]
+    phone: Optional[str]
+    last_visit: Optional[datetime]
+
+
+@functools.lru_cache(maxsize=65536)
+def _name_keys(name: str) -> Tuple[str, str, str]:
+    """Name, full pinyin and pinyin initials; memoized since names repeat a lot."""
+    return (
+        name.lower(),
+        "".join(lazy_pinyin(name)).lower(),
+        "".join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower(),
+    )
+
+
+def search_keys(name: str, phone: Optional[str]) -> List[str]:
+    """Lower-cased keys a patient can be found under."""
+    keys = set(_name_keys(name)) if name else set()
+    if phone:
+        phone = phone.strip()
+        keys.add(phone)
+        if len(phone) > _PHONE_SUFFIX:
+            keys.add(phone[-_PHONE_SUFFIX:])
+    keys.discard("")
+    return sorted(keys)
+
+
+def _rank(entry: PatientEntry) -> Tuple[float, int]:
+    """Most recently seen first, newer patients breaking ties."""
+    return (entry.last_visit.timestamp() if entry.last_visit else 0.0, entry.id)
+
+
+class _ScopeIndex:
+    def __init__(self, entries: Iterable[PatientEntry]):
+        self.patients: Dict[int, PatientEntry] = {}
+        self._keys_of: Dict[int, List[str]] = {}
+        pairs = []
+        for entry in entries:
+            keys = search_keys(entry.name, entry.phone)
+            self.patients[entry.id] = entry
+            self._keys_of[entry.id] = keys
+            pairs.extend((key, entry.id) for key in keys)
+        pairs.sort()
+        self._pairs: List[Tuple[str, int]] = pairs
+        self._hot: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.patients)
+
+    def _drop_hot(self, keys: Iterable[str]):
+        for key in keys:
+            for i in range(1, len(key) + 1):
+                self._hot.pop(key[:i], None)
+
+    def upsert(self, entry: PatientEntry):
+        self.remove(entry.id)
+        keys = search_keys(entry.name, entry.phone)
+        self.patients[entry.id] = entry
+        self._keys_of[entry.id] = keys
+        for key in keys:
+            bisect.insort(self._pairs, (key, entry.id))
+        self._drop_hot(keys)
+
+    def remove(self, patient_id: int):
+        keys = self._keys_of.pop(patient_id, None)
+        if keys is None:
+            return
+        del self.patients[patient_id]
+        for key in keys:
+            i = bisect.bisect_left(self._pairs, (key, patient_id))
+            if i < len(self._pairs) and self._pairs[i] == (key, patient_id):
+                del self._pairs[i]
+        self._drop_hot(keys)
+
+    def _top(self, lo: int, hi: int, n: int) -> List[int]:
+        ids = {patient_id for _, patient_id in self._pairs[lo:hi]}
+        return heapq.nlargest(n, ids, key=lambda i: _rank(self.patients[i]))
+
+    def suggest(self, prefix: str, n: int) -> List[PatientEntry]:
+        lo = bisect.bisect_left(self._pairs, (prefix,))
+        hi = bisect.bisect_left(self._pairs, (prefix + _KEY_END,))
+        if hi - lo <= _SCAN_LIMIT or n > _HOT_TOP_N:
+            ids = self._top(lo, hi, n)
+        else:
+            ids = self._hot.get(prefix)
+            if ids is None:
+                ids = self._hot[prefix] = self._top(lo, hi, _HOT_TOP_N)
+            ids = ids[:n]
+        return [self.patients[i] for i in ids]
+
+
+def scope_for(user_id: Optional[int], account_type: str = "practitioner") -> Scope:
+    """Scope key matching the visibility rules of search_service._query_patients_by_name."""
+    if user_id is None:
+        return ("all",)
+    if account_type == "personal":
+        return ("creator", user_id)
+    return ("practitioner", user_id)
+
+
+def _load_scope(db: Session, scope: Scope) -> _ScopeIndex:
+    last_visit = func.max(MedicalRecord.visit_date)
+    columns = (Patient.id, Patient.name, Patient.gender, Patient.age, Patient.phone)
+    query = db.query(*columns, func.coalesce(last_visit, Patient.updated_at)).outerjoin(
+        MedicalRecord, MedicalRecord.patient_id == Patient.id
+    ).filter(Patient.is_deleted.isnot(True))
+    if scope[0] == "creator":
+        query = query.filter(Patient.creator_id == scope[1])
+    elif scope[0] == "practitioner":
+        query = query.filter(MedicalRecord.user_id == scope[1])
+    return _ScopeIndex(PatientEntry(*row) for row in query.group_by(*columns))
+
+
+class PatientSuggestIndex:
+    """LRU of per-scope prefix indexes; thread-safe."""
+
+    def __init__(self, max_scopes: int = PATIENT_SUGGEST_MAX_SCOPES):
+        self._scopes = LRUCache(max_scopes)
+        self._lock = threading.RLock()
+        self._load_locks: Dict[Scope, threading.Lock] = {}  # One load per scope at a time
+        # Scopes being loaded -> writes made meanwhile, replayed before the scope is installed
+        self._loading: Dict[Scope, List[Callable[[_ScopeIndex], None]]] = {}
+
+    def _get_scope(self, db: Session, scope: Scope) -> _ScopeIndex:
+        index = self._scopes.get(scope)
+        if index is not None:
+            return index
+        with self._lock:
+            load_lock = self._load_locks.setdefault(scope, threading.Lock())
+        with load_lock:
+            index = self._scopes.get(scope)
+            if index is not None:
+                return index
+            with self._lock:
+                writes = self._loading[scope] = []
+            # Seconds on large patient tables: only callers of this scope wait for it
+            index = _load_scope(db, scope)
+            with self._lock:
+                # Not installed if invalidate() ran meanwhile: the load may predate a bulk write
+                if self._loading.get(scope) is writes:
+                    del self._loading[scope]
+                    for write in writes:
+                        write(index)
+                    self._scopes.put(scope, index)
+                self._load_locks.pop(scope, None)
+        return index
+
+    def _apply(self, scope: Scope, write: Callable[[_ScopeIndex], None]):
+        """Apply a write to a loaded scope, or queue it for a scope being loaded; caller holds the lock."""
+        index = self._scopes.get(scope)
+        if index is not None:
+            write(index)
+        elif scope in self._loading:
+            self._loading[scope].append(write)
+
+    def suggest(self, db: Session, prefix: str, user_id: Optional[int] = None,
+                account_type: str = "practitioner", limit: int = 10) -> List[Dict[str, Any]]:
+        """Top `limit` patients in the caller's scope with a key starting with prefix."""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        index = self._get_scope(db, scope_for(user_id, account_type))
+        with self._lock:
+            entries = index.suggest(prefix, limit)
+        return [
+            {
+                "id": e.id,
+                "name": e.name,
+                "gender": e.gender,
+                "age": e.age,
+                "phone": e.phone,
+                "last_visit": e.last_visit.strftime("%Y-%m-%d") if e.last_visit else None,
+            }
+            for e in entries
+        ]
+
+    def note_patient(self, patient: Patient, user_id: Optional[int] = None, visit_date: datetime = None):
+        """Add or refresh a patient in every loaded scope it belongs to (after create, edit or a new visit)."""
+        entry = PatientEntry(patient.id, patient.name, patient.gender, patient.age, patient.phone,
+                             visit_date or patient.updated_at)
+        scopes = [("all",)]
+        if patient.creator_id is not None:
+            scopes.append(("creator", patient.creator_id))
+        if user_id is not None:
+            scopes.append(("practitioner", user_id))
+
+        def upsert(index: _ScopeIndex):
+            current = entry
+            previous = index.patients.get(patient.id)
+            if previous and previous.last_visit and current.last_visit and previous.last_visit > current.last_visit:
+                current = current._replace(last_visit=previous.last_visit)
+            index.upsert(current)
+
+        with self._lock:
+            for scope in scopes:
+                self._apply(scope, upsert)
+
+    def remove_patient(self, patient_id: int):
+        """Drop a deleted or merged-away patient from every loaded scope."""
+        with self._lock:
+            for scope in self._scopes.keys() + list(self._loading):
+                self._apply(scope, lambda index: index.remove(patient_id))
+
+    def invalidate(self):
+        """Forget all scopes; they reload from the DB on next use."""
+        with self._lock:
+            self._scopes.clear()
+            self._loading.clear()
+
+    def warm(self, db: Session, scopes: Iterable[Scope]) -> int:
+        """Load the given scopes ahead of the first keystroke; returns the number loaded."""
+        count = 0
+        for scope in scopes:
+            self._get_scope(db, scope)
+            count += 1
+        return count
+
+    def __len__(self) -> int:
+        return len(self._scopes)
+
+
+patient_suggest = PatientSuggestIndex()
+
+
+def warm_patient_suggest(session_factory, max_scopes: int = PATIENT_SUGGEST_MAX_SCOPES):
+    """Warm the admin scope plus the most recently active users' scopes (used at startup)."""
+    from src.database.models import User
+    db = session_factory()
+    try:
+        scopes: List[Scope] = [("all",)]
+        recent_users = db.query(MedicalRecord.user_id).filter(
+            MedicalRecord.user_id.isnot(None)
+        ).group_by(MedicalRecord.user_id).order_by(
+            func.max(MedicalRecord.visit_date).desc()
+        ).limit(max(0, max_scopes - 1)).all()
+        scopes += [("practitioner", user_id) for (user_id,) in recent_users]
+        personal = db.query(User.id).filter(User.account_type == "personal").limit(
+            max(0, max_scopes - len(scopes))
+        ).all()
+        scopes += [("creator", user_id) for (user_id,) in personal]
+        loaded = patient_suggest.warm(db, scopes)
+        logger.info(f"Warmed patient suggestion index for {loaded} scopes.")
+    except Exception as e:
+        logger.warning(f"Could not warm patient suggestion index: {e}")
+    finally:
+        db.close()
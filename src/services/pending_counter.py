@@ -0,0 +1,146 @@
+"""
+In-memory count of rows waiting to be pushed (sync_status 'pending'), per database.
+
+Session hooks keep the count current without querying. After each flush they
+record the sync_status transitions of the flushed rows, and those deltas are
+applied once the transaction commits (a rollback discards them). Bulk writes
+that bypass the unit of work report their transitions with note().
+
+The first count() for a database runs the COUNT queries once. After that,
+reads are O(1). A reconciliation in the background recounts every
+PENDING_RECONCILE_SECONDS, correcting drift from raw SQL writes such as
+merge_duplicates.py.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+
+from src.database.connection import Base
+from src.database.models import SyncMixin
+
+logger = logging.getLogger(__name__)
+
+PENDING_RECONCILE_SECONDS = float(os.getenv("PENDING_RECONCILE_SECONDS", "600"))
+
+_DELTA_KEY = "pending_delta"
+
+
+def _synced_models():
+    return [m.class_ for m in Base.registry.mappers if issubclass(m.class_, SyncMixin)]
+
+
+class PendingCounter:
+    """Pending-row counts per engine and table, adjusted on commit and recounted now and then."""
+
+    def __init__(self, reconcile_seconds: float = PENDING_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._lock = threading.Lock()
+        self._counts = weakref.WeakKeyDictionary()  # engine -> {table: count}
+        self._counted_at = weakref.WeakKeyDictionary()  # engine -> monotonic time of the last recount
+        self._reconciling = weakref.WeakSet()
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+            self._counted_at.clear()
+
+    def count(self, session_factory) -> int:
+        """Pending rows of the database behind session_factory."""
+        db = session_factory()
+        try:
+            engine = db.get_bind()
+            with self._lock:
+                counts = self._counts.get(engine)
+                stale = counts is not None and time.monotonic() - self._counted_at[engine] > self.reconcile_seconds
+            if counts is None:
+                counts = self.reconcile(db)
+            elif stale and engine not in self._reconciling:
+                self._reconciling.add(engine)
+                threading.Thread(target=self._reconcile_in_background, args=(session_factory, engine),
+                                 name="pending-reconcile", daemon=True).start()
+        finally:
+            db.close()
+        with self._lock:
+            # invalidate() may have dropped the engine meanwhile; the counts read above still stand
+            return sum(self._counts.get(engine, counts).values())
+
+    def _reconcile_in_background(self, session_factory, engine):
+        db = session_factory()
+        try:
+            self.reconcile(db)
+        except Exception as e:
+            logger.warning(f"Pending count reconciliation failed: {e}")
+        finally:
+            db.close()
+            self._reconciling.discard(engine)
+
+    def reconcile(self, db: Session) -> Dict[str, int]:
+        """Recount every synced table of db's database and replace the maintained counts."""
+        counts = {
+            model.__tablename__: db.query(func.count(model.id)).filter(model.sync_status == 'pending').scalar()
+            for model in _synced_models()
+        }
+        engine = db.get_bind()
+        with self._lock:
+            previous = self._counts.get(engine)
+            if previous is not None and previous != counts:
+                logger.info(f"Pending counts drifted: {previous} -> {counts}")
+            self._counts[engine] = counts
+            self._counted_at[engine] = time.monotonic()
+        return counts
+
+    def note(self, db: Session, table_name: str, delta: int):
+        """Record a pending-count change made outside the unit of work, applied when db commits."""
+        if delta:
+            deltas = db.info.setdefault(_DELTA_KEY, {})
+            deltas[table_name] = deltas.get(table_name, 0) + delta
+
+    def _apply(self, engine, deltas: Dict[str, int]):
+        with self._lock:
+            counts = self._counts.get(engine)
+            if counts is None:
+                # Not counted yet: the first count() sees these rows anyway
+                return
+            for table_name, delta in deltas.items():
+                counts[table_name] = max(0, counts.get(table_name, 0) + delta)
+
+
+pending_counter = PendingCounter()
+
+
+def _status_change(obj, op: str) -> int:
+    state = inspect(obj)
+    if op == "insert":
+        return 1 if state.dict.get("sync_status") == "pending" else 0
+    if op == "delete":
+        return -1 if state.committed_state.get("sync_status", state.dict.get("sync_status")) == "pending" else 0
+    added, _, deleted = state.attrs.sync_status.history
+    if not added:
+        return 0
+    return (added[0] == "pending") - (bool(deleted) and deleted[0] == "pending")
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flushed_transitions(session: Session, flush_context):
+    for op, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if isinstance(obj, SyncMixin):
+                pending_counter.note(session, obj.__tablename__, _status_change(obj, op))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_transitions(session: Session):
+    deltas = session.info.pop(_DELTA_KEY, None)
+    if deltas:
+        pending_counter._apply(session.get_bind(), deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_transitions(session: Session):
+    session.info.pop(_DELTA_KEY, None)
@@ -0,0 +1,223 @@
+"""Background job that precomputes LLM pulse vectors for teacher records.
+
+The job runs on its own thread with its own DB session, so the request that
+starts it returns at once. LLM calls for a chunk of records go through a
+bounded thread pool and a shared rate limit (PRECOMPUTE_WORKERS,
+PRECOMPUTE_RATE_PER_SECOND). After each chunk, the vectors and the job
+checkpoint (last record id, counters) commit together in a job_checkpoints
+row.
+
+Starting the job again after a restart, a crash or a cancel resumes from that
+checkpoint, as long as the LLM revision is unchanged. Records whose LLM call
+failed stay without a vector and are picked up by the next full run
+(restart=True).
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.database.connection import SessionLocal
+from src.database.models import JobCheckpoint, MedicalRecord
+from src.services import search_service
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "4"))
+# LLM calls per second across all workers; 0 disables the limit
+PRECOMPUTE_RATE_PER_SECOND = float(os.getenv("PRECOMPUTE_RATE_PER_SECOND", "2"))
+
+JOB_KIND = "pulse_vectors"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart; rate <= 0 means unlimited."""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _checkpoint_dict(checkpoint: Optional[JobCheckpoint]) -> Dict[str, Any]:
+    if checkpoint is None:
+        return {"status": None}
+    return {
+        "job_id": checkpoint.id,
+        "status": checkpoint.status,
+        "revision": checkpoint.revision,
+        "last_record_id": checkpoint.last_record_id,
+        "total": checkpoint.total,
+        "processed": checkpoint.processed,
+        "updated": checkpoint.updated,
+        "failed": checkpoint.failed,
+        "progress": round(checkpoint.processed / checkpoint.total, 4) if checkpoint.total else 1.0,
+        "error": checkpoint.error,
+        "started_at": checkpoint.started_at.isoformat() if checkpoint.started_at else None,
+        "updated_at": checkpoint.updated_at.isoformat() if checkpoint.updated_at else None,
+        "finished_at": checkpoint.finished_at.isoformat() if checkpoint.finished_at else None,
+    }
+
+
+class PrecomputeJob:
+    """Runs at most one precompute job per process; state lives in job_checkpoints."""
+
+    def __init__(self, session_factory=SessionLocal, workers: int = PRECOMPUTE_WORKERS,
+                 rate_per_second: float = PRECOMPUTE_RATE_PER_SECOND,
+                 chunk_size: int = search_service.PRECOMPUTE_CHUNK_SIZE):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.rate_per_second = rate_per_second
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._run_started: Optional[float] = None
+        self._run_processed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _latest(self, db: Session) -> Optional[JobCheckpoint]:
+        return db.query(JobCheckpoint).filter(JobCheckpoint.kind == JOB_KIND).order_by(
+            JobCheckpoint.id.desc()
+        ).first()
+
+    @staticmethod
+    def _teacher_records_after(db: Session, after_id: int) -> int:
+        return db.query(MedicalRecord.id).filter(
+            MedicalRecord.practitioner_id.isnot(None), MedicalRecord.id > after_id
+        ).count()
+
+    def _open_checkpoint(self, db: Session, revision: str, restart: bool) -> JobCheckpoint:
+        """
+        Resume the latest unfinished run of this revision, or start a new one.
+        A resumed run recounts its total, as records were added or deleted meanwhile.
+        """
+        checkpoint = self._latest(db)
+        if (restart or checkpoint is None or checkpoint.status == COMPLETED
+                or checkpoint.revision != revision):
+            checkpoint = JobCheckpoint(kind=JOB_KIND, revision=revision, last_record_id=0)
+            checkpoint.total = self._teacher_records_after(db, 0)
+            db.add(checkpoint)
+        else:
+            logger.info(f"Resuming pulse vector precompute job {checkpoint.id} after record {checkpoint.last_record_id}.")
+            checkpoint.total = checkpoint.processed + self._teacher_records_after(db, checkpoint.last_record_id)
+        checkpoint.status = RUNNING
+        checkpoint.error = None
+        checkpoint.finished_at = None
+        db.commit()
+        return checkpoint
+
+    def start(self, llm_service, restart: bool = False) -> Tuple[Dict[str, Any], bool]:
+        """
+        Start (or resume) the job in the background. Returns (status, started);
+        started is False when a job is already running in this process.
+        """
+        with self._lock:
+            if self.running:
+                return self.status(), False
+            db = self.session_factory()
+            try:
+                checkpoint = self._open_checkpoint(db, search_service.llm_vector_revision(llm_service), restart)
+                job_id = checkpoint.id
+            finally:
+                db.close()
+            self._stop.clear()
+            self._run_started = time.monotonic()
+            self._run_processed = 0
+            self._thread = threading.Thread(
+                target=self._run, args=(job_id, llm_service), name="precompute-pulse-vectors", daemon=True
+            )
+            self._thread.start()
+        return self.status(), True
+
+    def cancel(self) -> bool:
+        """Ask the running job to stop after the current chunk; returns whether one was running."""
+        if not self.running:
+            return False
+        self._stop.set()
+        return True
+
+    def wait(self, timeout: float = None):
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, job_id: int, llm_service):
+        db = self.session_factory()
+        checkpoint = db.get(JobCheckpoint, job_id)
+
+        def on_chunk(chunk_db, last_id, scanned, pending, updated):
+            checkpoint.last_record_id = last_id
+            checkpoint.processed += scanned
+            checkpoint.updated += updated
+            checkpoint.failed += pending - updated
+            self._run_processed += scanned
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="precompute-llm") as executor:
+                search_service.precompute_pulse_vectors(
+                    db, llm_service,
+                    after_id=checkpoint.last_record_id,
+                    executor=executor,
+                    rate_limiter=RateLimiter(self.rate_per_second),
+                    on_chunk=on_chunk,
+                    should_stop=self._stop.is_set,
+                    chunk_size=self.chunk_size,
+                )
+            checkpoint.status = CANCELLED if self._stop.is_set() else COMPLETED
+            checkpoint.finished_at = datetime.now()
+            db.commit()
+        except Exception as e:
+            logger.error(f"Pulse vector precompute job {job_id} failed: {e}")
+            db.rollback()
+            checkpoint = db.get(JobCheckpoint, job_id)
+            checkpoint.status = FAILED
+            checkpoint.error = str(e)
+            db.commit()
+        finally:
+            db.close()
+
+    def status(self, db: Session = None) -> Dict[str, Any]:
+        """Latest checkpoint plus live throughput; a 'running' job with no live thread was interrupted."""
+        own = db is None
+        db = db or self.session_factory()
+        try:
+            result = _checkpoint_dict(self._latest(db))
+        finally:
+            if own:
+                db.close()
+        result["active"] = self.running
+        if result["status"] == RUNNING and not result["active"]:
+            result["status"] = "interrupted"
+        if result["active"] and self._run_started is not None:
+            elapsed = time.monotonic() - self._run_started
+            rate = self._run_processed / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, result["total"] - result["processed"])
+            result["records_per_second"] = round(rate, 2)
+            result["eta_seconds"] = round(remaining / rate) if rate else None
+        return result
+
+
+precompute_job = PrecomputeJob()
@@ -0,0 +1,359 @@
+"""In-process similarity index over 八纲 pulse vectors.
+
+Keeps an (N×4) float32 matrix of keyword-derived vectors for the teacher
+corpus, a parallel matrix of cached LLM vectors, the matching record IDs and
+per-record filter metadata (practitioner, author, patient, visit day).
+
+Each row also holds a fixed-size array of per-position keyword bitmasks, scored
+with weighted per-position Jaccard via vectorized popcount over the corpus.
+
+Rows are bucketed on a uniform grid over [-1, 1]^4. A k-nearest-neighbour
+query visits buckets ring by ring around the query cell and stops as soon as
+the k-th best distance is provably within the searched region, so lookups
+touch only nearby buckets instead of the whole corpus.
+The index knows nothing about pulse grids; search_service feeds it vectors.
+"""
+import threading
+from datetime import date
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+VECTOR_DIM = 4
+# Largest possible euclidean distance between two vectors in [-1, 1]^4
+MAX_DISTANCE = float(np.sqrt(VECTOR_DIM * (2.0 ** 2)))  # 4.0
+
+# Buckets per axis; 8 → 4096 cells of width 0.25
+BUCKETS_PER_AXIS = 8
+_CELL_WIDTH = 2.0 / BUCKETS_PER_AXIS
+
+_INITIAL_CAPACITY = 256
+
+# Per-position bitmask slots: left/right/legacy × 寸关尺 × 浮中沉 + overall description
+POSITION_SLOTS = 28
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Per-element popcount of a uint32 array."""
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(values)
+    as_bytes = values.view(np.uint8).reshape(values.shape + (4,))
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+class RecordMeta(NamedTuple):
+    """Filterable attributes of an indexed record."""
+    practitioner_id: Optional[int] = None
+    user_id: Optional[int] = None
+    patient_id: Optional[int] = None
+    visit_date: Optional[date] = None
+
+
+def _cell_of(vec) -> Tuple[int, ...]:
+    return tuple(int(min(max((float(v) + 1.0) // _CELL_WIDTH, 0), BUCKETS_PER_AXIS - 1)) for v in vec)
+
+
+class _BucketGrid:
+    """Maps grid cells to the set of index rows whose vector falls inside them."""
+
+    def __init__(self):
+        self.cells: Dict[Tuple[int, ...], Set[int]] = {}
+        self.cell_of_row: Dict[int, Tuple[int, ...]] = {}
+
+    def add(self, row: int, vec):
+        self.discard(row)
+        cell = _cell_of(vec)
+        self.cells.setdefault(cell, set()).add(row)
+        self.cell_of_row[row] = cell
+
+    def discard(self, row: int):
+        cell = self.cell_of_row.pop(row, None)
+        if cell is None:
+            return
+        members = self.cells[cell]
+        members.discard(row)
+        if not members:
+            del self.cells[cell]
+
+    def move(self, old_row: int, new_row: int):
+        cell = self.cell_of_row.pop(old_row)
+        members = self.cells[cell]
+        members.discard(old_row)
+        members.add(new_row)
+        self.cell_of_row[new_row] = cell
+
+    def rings(self, query) -> Iterator[Tuple[float, List[int]]]:
+        """
+        Yield (guaranteed_radius, rows) for rings of non-empty cells at growing Chebyshev
+        distance from the query cell. Every row farther than guaranteed_radius from the
+        query lies in a later ring. Rings are produced lazily so callers can stop early.
+        """
+        if not self.cells:
+            return
+        q_cell = np.asarray(_cell_of(query))
+        cells = list(self.cells.keys())
+        ring_of_cell = np.abs(np.asarray(cells) - q_cell).max(axis=1)
+        order = np.argsort(ring_of_cell, kind="stable")
+        ring_sorted = ring_of_cell[order]
+        q = np.asarray(query, dtype=np.float64)
+
+        bounds = np.flatnonzero(np.diff(ring_sorted)) + 1
+        for chunk in np.split(order, bounds):
+            r = ring_of_cell[chunk[0]]
+            rows = [row for i in chunk for row in self.cells[cells[i]]]
+            lo = (q_cell - r) * _CELL_WIDTH - 1.0
+            hi = (q_cell + r + 1) * _CELL_WIDTH - 1.0
+            # Box sides on the domain boundary have nothing beyond them
+            below = np.where(q_cell - r <= 0, np.inf, q - lo)
+            above = np.where(q_cell + r >= BUCKETS_PER_AXIS - 1, np.inf, hi - q)
+            yield float(min(below.min(), above.min())), rows
+
+
+class PulseVectorIndex:
+    """Dense vector index with O(1) upsert/remove by record ID."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._reset_storage(_INITIAL_CAPACITY)
+
+    def _reset_storage(self, capacity: int):
+        self._size = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._kw = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+        self._llm = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+        self._has_llm = np.zeros(capacity, dtype=bool)
+        # Filter metadata; -1 / 0 stand for "unknown"
+        self._practitioner = np.full(capacity, -1, dtype=np.int64)
+        self._user = np.full(capacity, -1, dtype=np.int64)
+        self._patient = np.full(capacity, -1, dtype=np.int64)
+        self._visit_day = np.zeros(capacity, dtype=np.int64)
+        self._bits = np.zeros((capacity, POSITION_SLOTS), dtype=np.uint32)
+        self._bit_counts = np.zeros((capacity, POSITION_SLOTS), dtype=np.uint8)
+        self._row_of: Dict[int, int] = {}
+        # Buckets over keyword vectors, and over "LLM vector if cached, else keyword vector"
+        self._kw_grid = _BucketGrid()
+        self._pref_grid = _BucketGrid()
+
+    _ROW_ARRAYS = ("_ids", "_kw", "_llm", "_has_llm", "_practitioner", "_user", "_patient", "_visit_day", "_bits", "_bit_counts")
+
+    def _grow(self, min_capacity: int):
+        capacity = len(self._ids)
+        if min_capacity <= capacity:
+            return
+        new_capacity = max(min_capacity, capacity * 2)
+        for name in self._ROW_ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    @property
+    def is_built(self) -> bool:
+        return self._built
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._row_of
+
+    def build(self, entries: Sequence[Tuple]):
+        """Replace the index contents with (record_id, keyword_vec, llm_vec[, RecordMeta[, position_bits]]) entries."""
+        with self._lock:
+            self._reset_storage(max(_INITIAL_CAPACITY, len(entries)))
+            for entry in entries:
+                self._upsert_locked(*entry)
+            self._built = True
+
+    def invalidate(self):
+        """Drop all contents; the next search triggers a rebuild."""
+        with self._lock:
+            self._reset_storage(_INITIAL_CAPACITY)
+            self._built = False
+
+    def upsert(self, record_id: int, kw_vec: Sequence[float], llm_vec: Optional[Sequence[float]] = None,
+               meta: Optional[RecordMeta] = None, bits: Optional[np.ndarray] = None):
+        """Insert or replace the vectors of a record. No-op until the index is built."""
+        with self._lock:
+            if not self._built:
+                return
+            self._upsert_locked(record_id, kw_vec, llm_vec, meta, bits)
+
+    def _upsert_locked(self, record_id, kw_vec, llm_vec=None, meta=None, bits=None):
+        row = self._row_of.get(record_id)
+        if row is None:
+            self._grow(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._row_of[record_id] = row
+            self._ids[row] = record_id
+        self._kw[row] = kw_vec
+        if llm_vec is not None:
+            self._llm[row] = llm_vec
+            self._has_llm[row] = True
+        else:
+            self._llm[row] = 0.0
+            self._has_llm[row] = False
+
+        meta = meta or RecordMeta()
+        self._practitioner[row] = -1 if meta.practitioner_id is None else meta.practitioner_id
+        self._user[row] = -1 if meta.user_id is None else meta.user_id
+        self._patient[row] = -1 if meta.patient_id is None else meta.patient_id
+        self._visit_day[row] = meta.visit_date.toordinal() if meta.visit_date else 0
+        self._bits[row] = 0 if bits is None else bits
+        self._bit_counts[row] = _popcount(self._bits[row])
+
+        self._kw_grid.add(row, self._kw[row])
+        self._pref_grid.add(row, self._llm[row] if self._has_llm[row] else self._kw[row])
+
+    def remove(self, record_id: int):
+        """Remove a record by swapping the last row into its slot."""
+        with self._lock:
+            row = self._row_of.pop(record_id, None)
+            if row is None:
+                return
+            last = self._size - 1
+            self._kw_grid.discard(row)
+            self._pref_grid.discard(row)
+            if row != last:
+                moved_id = int(self._ids[last])
+                for name in self._ROW_ARRAYS:
+                    array = getattr(self, name)
+                    array[row] = array[last]
+                self._row_of[moved_id] = row
+                self._kw_grid.move(last, row)
+                self._pref_grid.move(last, row)
+            self._size = last
+
+    def _filter_mask(self, rows: np.ndarray, practitioner_id=None, user_id=None, patient_id=None,
+                     start_date: Optional[date] = None, end_date: Optional[date] = None) -> np.ndarray:
+        mask = np.ones(rows.size, dtype=bool)
+        if practitioner_id is not None:
+            mask &= self._practitioner[rows] == practitioner_id
+        if user_id is not None:
+            mask &= self._user[rows] == user_id
+        if patient_id is not None:
+            mask &= self._patient[rows] == patient_id
+        if start_date is not None:
+            mask &= self._visit_day[rows] >= start_date.toordinal()
+        if end_date is not None:
+            mask &= self._visit_day[rows] <= end_date.toordinal()
+        return mask
+
+    def query(self, vec: Sequence[float], k: int = 5, use_llm: bool = False,
+              min_similarity: Optional[float] = None, offset: int = 0,
+              **filters) -> List[Tuple[int, float, List[float]]]:
+        """
+        Return up to k (record_id, similarity, candidate_vec) tuples, best first, skipping the first offset.
+        With use_llm, rows with a cached LLM vector are compared on that vector.
+        Rows whose compared vector is all zeros carry no pulse signal and are skipped.
+        Supported filters: practitioner_id, user_id, patient_id, start_date, end_date.
+        """
+        need = offset + k
+        if k <= 0:
+            return []
+        query = np.asarray(vec, dtype=np.float32)
+        max_distance = MAX_DISTANCE if min_similarity is None else (1.0 - min_similarity) * MAX_DISTANCE
+
+        with self._lock:
+            if self._size == 0:
+                return []
+            grid = self._pref_grid if use_llm else self._kw_grid
+            found_rows: List[np.ndarray] = []
+            found_dist: List[np.ndarray] = []
+            best = np.empty(0, dtype=np.float32)
+
+            for guaranteed, ring_rows in grid.rings(query):
+                rows = np.fromiter(ring_rows, dtype=np.int64, count=len(ring_rows))
+                rows = rows[self._filter_mask(rows, **filters)]
+                if rows.size:
+                    matrix = self._kw[rows]
+                    if use_llm:
+                        matrix = np.where(self._has_llm[rows, None], self._llm[rows], matrix)
+                    dist = np.sqrt(np.square(matrix - query).sum(axis=1))
+                    keep = np.any(matrix != 0, axis=1) & (dist <= max_distance + 1e-6)
+                    found_rows.append(rows[keep])
+                    found_dist.append(dist[keep])
+                    best = np.concatenate([best, dist[keep]])
+                # Everything closer than `guaranteed` has been seen: stop once the
+                # need-th best is inside it, or nothing beyond can pass the threshold.
+                if guaranteed >= max_distance:
+                    break
+                if best.size >= need and np.partition(best, need - 1)[need - 1] <= guaranteed:
+                    break
+
+            if not found_rows:
+                return []
+            rows = np.concatenate(found_rows)
+            dist = np.concatenate(found_dist)
+            if rows.size == 0:
+                return []
+            top = min(need, rows.size)
+            part = np.argpartition(dist, top - 1)[:top] if top < rows.size else np.arange(rows.size)
+            # Ties keep insertion order, as a full scan would
+            order = part[np.lexsort((rows[part], dist[part]))][offset:need]
+
+            results = []
+            for i in order:
+                row = rows[i]
+                candidate = self._llm[row] if (use_llm and self._has_llm[row]) else self._kw[row]
+                results.append((int(self._ids[row]), float(1.0 - dist[i] / MAX_DISTANCE), candidate.tolist()))
+            return results
+
+    def query_positions(self, bits: np.ndarray, weights: np.ndarray, k: int = 5,
+                        min_similarity: Optional[float] = None, offset: int = 0,
+                        **filters) -> List[Tuple[int, float, List[float]]]:
+        """
+        Rank rows by weighted per-position Jaccard of keyword bitmasks against bits.
+        Only positions filled in either grid count; the score is their weighted mean.
+        Returns (record_id, similarity, keyword_vec) tuples like query().
+        """
+        need = offset + k
+        if k <= 0:
+            return []
+        bits = np.asarray(bits, dtype=np.uint32)
+        weights = np.asarray(weights, dtype=np.float32)
+
+        with self._lock:
+            n = self._size
+            if n == 0:
+                return []
+            if any(v is not None for v in filters.values()):
+                rows = np.flatnonzero(self._filter_mask(np.arange(n), **filters))
+                counts = self._bit_counts[rows]
+            else:
+                rows = np.arange(n)
+                counts = self._bit_counts[:n]
+
+            # Intersections are non-zero only where the query has bits, so AND just those slots;
+            # unions follow from the cached per-row popcounts: |a ∪ b| = |a| + |b| - |a ∩ b|.
+            q_slots = np.flatnonzero(bits)
+            q_counts = _popcount(bits[q_slots]).astype(np.float32)
+            inter = _popcount(self._bits[rows[:, None], q_slots] & bits[q_slots]).astype(np.float32)
+            union = counts[:, q_slots].astype(np.float32) + q_counts - inter
+            numerator = (np.divide(inter, union, out=np.zeros_like(inter), where=union > 0) * weights[q_slots]).sum(axis=1)
+
+            # Denominator: weights of slots filled in either grid
+            row_filled = counts > 0
+            total = row_filled.astype(np.float32) @ weights
+            total += (~row_filled[:, q_slots]).astype(np.float32) @ weights[q_slots]
+            score = np.divide(numerator, total, out=np.zeros_like(total), where=total > 0)
+
+            matrix_nonempty = row_filled.any(axis=1)
+            keep = matrix_nonempty & (score > 0)
+            if min_similarity is not None:
+                keep &= score >= min_similarity
+            rows, score = rows[keep], score[keep]
+            if rows.size == 0:
+                return []
+            top = min(need, rows.size)
+            part = np.argpartition(-score, top - 1)[:top] if top < rows.size else np.arange(rows.size)
+            order = part[np.lexsort((rows[part], -score[part]))][offset:need]
+            return [(int(self._ids[rows[i]]), float(score[i]), self._kw[rows[i]].tolist()) for i in order]
+
+
+# Singleton instance
+pulse_index = PulseVectorIndex()
@@ -0,0 +1,201 @@
+"""Offline-trained linear model that predicts LLM pulse vectors from a grid.
+
+Features are keyword counts per grid position (keyword × position), plus each
+keyword's share of the filled cells and a bias term. Ridge least squares fits
+them to the LLM vectors already cached on teacher records. The LLM still
+labels the corpus offline, but a search query is answered locally by a sparse
+dot product and never waits on an LLM call.
+
+Models are saved as .npz files. Each file records the LLM revision it imitates
+so that search only uses it against vectors from that same model and prompt.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.utils.keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+PULSE_MODEL_PATH = os.getenv("PULSE_MODEL_PATH", os.path.join("data", "models", "pulse_vector_model.npz"))
+
+# Below this many labelled records a fit is mostly noise; training refuses
+MIN_TRAINING_RECORDS = 20
+
+_AXES = ("xu_shi", "yin_yang", "biao_li", "han_re")
+
+
+class PulseVectorModel:
+    """Ridge regression from keyword × position counts to the 4D LLM vector."""
+
+    def __init__(self, keywords: Sequence[str], slots: Sequence[str], weights: Optional[np.ndarray] = None,
+                 target_revision: str = "", report: Optional[Dict[str, Any]] = None):
+        self.keywords = tuple(keywords)
+        self.slots = tuple(slots)
+        self.target_revision = target_revision
+        self.report = report or {}
+        self._matcher = KeywordMatcher(self.keywords)
+        self._keyword_col = {kw: i for i, kw in enumerate(self.keywords)}
+        self._slot_row = {slot: i for i, slot in enumerate(self.slots)}
+        self.weights = weights if weights is not None else np.zeros((self.n_features, 4))
+
+    @property
+    def n_features(self) -> int:
+        # bias + keyword × slot counts + per-keyword share of filled cells
+        return 1 + len(self.slots) * len(self.keywords) + len(self.keywords)
+
+    def _sparse_features(self, grid: Dict[str, Any]) -> Tuple[List[int], List[float]]:
+        """Non-zero feature indices and values of one grid."""
+        n_kw = len(self.keywords)
+        share_base = 1 + len(self.slots) * n_kw
+        counts: Dict[int, float] = {0: 1.0}
+        shares: Dict[int, float] = {}
+        filled = 0
+        for slot, row in self._slot_row.items():
+            text = grid.get(slot, "")
+            if not isinstance(text, str) or not text.strip():
+                continue
+            filled += 1
+            for kw in self._matcher.scan(text):
+                col = self._keyword_col[kw]
+                idx = 1 + row * n_kw + col
+                counts[idx] = counts.get(idx, 0.0) + 1.0
+                shares[share_base + col] = shares.get(share_base + col, 0.0) + 1.0
+        for idx, value in shares.items():
+            counts[idx] = value / filled
+        return list(counts), list(counts.values())
+
+    def features(self, grids: Iterable[Dict[str, Any]]) -> np.ndarray:
+        grids = list(grids)
+        X = np.zeros((len(grids), self.n_features))
+        for i, grid in enumerate(grids):
+            idx, values = self._sparse_features(grid)
+            X[i, idx] = values
+        return X
+
+    def fit(self, grids: Sequence[Dict[str, Any]], targets: np.ndarray, l2: float = 1.0) -> "PulseVectorModel":
+        """Closed-form ridge fit; the bias column is not penalized."""
+        X = self.features(grids)
+        Y = np.asarray(targets, dtype=np.float64)
+        penalty = np.full(self.n_features, float(l2))
+        penalty[0] = 0.0
+        gram = X.T @ X + np.diag(penalty)
+        self.weights = np.linalg.solve(gram, X.T @ Y)
+        return self
+
+    def predict(self, grid: Dict[str, Any]) -> Optional[List[float]]:
+        """Predicted LLM vector for one grid, clamped to [-1, 1]; None when no keyword is recognized."""
+        idx, values = self._sparse_features(grid)
+        if len(idx) == 1:
+            return None
+        vec = np.asarray(values) @ self.weights[idx]
+        return np.clip(vec, -1.0, 1.0).tolist()
+
+    def predict_many(self, grids: Sequence[Dict[str, Any]]) -> np.ndarray:
+        return np.clip(self.features(grids) @ self.weights, -1.0, 1.0)
+
+    def save(self, path: str = None):
+        path = path or PULSE_MODEL_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path, weights=self.weights,
+            keywords=np.array(self.keywords), slots=np.array(self.slots),
+            target_revision=np.array(self.target_revision),
+            report=np.array(repr(self.report)),
+        )
+
+    @classmethod
+    def load(cls, path: str = None) -> "PulseVectorModel":
+        import ast
+        with np.load(path or PULSE_MODEL_PATH, allow_pickle=False) as f:
+            return cls(
+                keywords=[str(k) for k in f["keywords"]],
+                slots=[str(s) for s in f["slots"]],
+                weights=f["weights"],
+                target_revision=str(f["target_revision"]),
+                report=ast.literal_eval(str(f["report"])),
+            )
+
+
+def _error_metrics(predicted: np.ndarray, actual: np.ndarray) -> Dict[str, Any]:
+    """MAE/RMSE per axis and mean 八纲 similarity (1 - distance/4) between two vector sets."""
+    diff = predicted - actual
+    similarity = 1.0 - np.linalg.norm(diff, axis=1) / 4.0
+    return {
+        "mae": {axis: round(float(v), 4) for axis, v in zip(_AXES, np.abs(diff).mean(axis=0))},
+        "rmse": {axis: round(float(v), 4) for axis, v in zip(_AXES, np.sqrt((diff ** 2).mean(axis=0)))},
+        "mean_similarity": round(float(similarity.mean()), 4),
+        "p10_similarity": round(float(np.percentile(similarity, 10)), 4),
+    }
+
+
+def train(grids: Sequence[Dict[str, Any]], targets: Sequence[Sequence[float]], keywords: Sequence[str],
+          slots: Sequence[str], target_revision: str, baseline=None, holdout: float = 0.2,
+          l2: float = 1.0, seed: int = 0) -> PulseVectorModel:
+    """
+    Fit on a random (1 - holdout) split and report errors on the rest, then refit on all rows.
+    baseline(grid) -> vector, if given, is scored on the same held-out rows for comparison.
+    """
+    if len(grids) < MIN_TRAINING_RECORDS:
+        raise ValueError(f"Need at least {MIN_TRAINING_RECORDS} records with LLM vectors, got {len(grids)}")
+    Y = np.asarray(targets, dtype=np.float64)
+    order = np.random.default_rng(seed).permutation(len(grids))
+    n_holdout = max(1, int(len(grids) * holdout))
+    test_idx, train_idx = order[:n_holdout], order[n_holdout:]
+
+    model = PulseVectorModel(keywords, slots, target_revision=target_revision)
+    model.fit([grids[i] for i in train_idx], Y[train_idx], l2=l2)
+    test_grids = [grids[i] for i in test_idx]
+    report = {
+        "target_revision": target_revision,
+        "n_train": int(len(train_idx)),
+        "n_holdout": int(n_holdout),
+        "l2": l2,
+        "model": _error_metrics(model.predict_many(test_grids), Y[test_idx]),
+    }
+    if baseline is not None:
+        report["keyword_baseline"] = _error_metrics(np.array([baseline(g) for g in test_grids]), Y[test_idx])
+
+    start = time.perf_counter()
+    for grid in test_grids:
+        model.predict(grid)
+    report["predict_us"] = round((time.perf_counter() - start) / len(test_grids) * 1e6, 1)
+
+    model.fit(grids, Y, l2=l2)
+    report["n_fit"] = len(grids)
+    model.report = report
+    return model
+
+
+_active_model: Optional[PulseVectorModel] = None
+_active_loaded = False
+_active_lock = threading.Lock()
+
+
+def get_active_model() -> Optional[PulseVectorModel]:
+    """The model saved at PULSE_MODEL_PATH, loaded once per process; None if none was trained."""
+    global _active_model, _active_loaded
+    if _active_loaded:
+        return _active_model
+    with _active_lock:
+        if not _active_loaded:
+            if os.path.exists(PULSE_MODEL_PATH):
+                try:
+                    _active_model = PulseVectorModel.load(PULSE_MODEL_PATH)
+                    logger.info(f"Loaded pulse vector model for {_active_model.target_revision}.")
+                except Exception as e:
+                    logger.warning(f"Could not load pulse vector model: {e}")
+            _active_loaded = True
+    return _active_model
+
+
+def set_active_model(model: Optional[PulseVectorModel]):
+    """Swap the in-process model, e.g. right after training."""
+    global _active_model, _active_loaded
+    with _active_lock:
+        _active_model = model
+        _active_loaded = True
@@ -1,8 +1,11 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 from datetime import datetime, date
 from src.database.models import Patient, MedicalRecord, Practitioner
+from src.services import search_service
+from src.services.patient_suggest import patient_suggest
+from src.utils.pagination import keyset_before
 from pypinyin import lazy_pinyin, Style
 import re
 
@@ -115,6 +118,7 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
         existing_record.user_id = user_id # Track who updated it
         existing_record.updated_at = datetime.now()
         record_id = existing_record.id
+        saved_record = existing_record
         message = "Record updated successfully"
     else:
         new_record = MedicalRecord(
@@ -128,9 +132,13 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
         db.add(new_record)
         db.flush() # To get the ID before commit if needed
         record_id = new_record.id
+        saved_record = new_record
         message = "Record saved successfully"
     
+    search_service.store_pulse_vectors(db, saved_record)
     db.commit()
+    search_service.index_medical_record(saved_record)
+    patient_suggest.note_patient(patient, user_id, saved_record.visit_date)
     return {
         "status": "success", 
         "message": message, 
@@ -139,18 +147,28 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
         "practitioner_id": practitioner_id
     }
 
-def get_patient_history(db: Session, patient_id: int) -> List[Dict[str, Any]]:
-    records = db.query(MedicalRecord)\
-        .filter(MedicalRecord.patient_id == patient_id)\
-        .order_by(MedicalRecord.visit_date.desc())\
-        .all()
-    return [
-        {
+def _patient_history_query(db: Session, patient_id: int, after=None):
+    """Projected history rows (no record JSON), newest first; keyset on (visit_date, id)."""
+    query = db.query(MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint)\
+        .filter(MedicalRecord.patient_id == patient_id)
+    if after is not None:
+        query = query.filter(keyset_before(MedicalRecord.visit_date, MedicalRecord.id, after))
+    return query.order_by(MedicalRecord.visit_date.desc(), MedicalRecord.id.desc())
+
+def iter_patient_history(db: Session, patient_id: int, after=None) -> Iterator[Dict[str, Any]]:
+    """Stream a patient's history from a server-side cursor, starting after the (visit_date, id) cursor."""
+    for r in _patient_history_query(db, patient_id, after).yield_per(500):
+        yield {
             "id": r.id,
             "visit_date": r.visit_date.strftime("%Y-%m-%d"),
-            "complaint": r.complaint
+            "complaint": r.complaint,
+            "_sort": (r.visit_date, r.id),
         }
-        for r in records
+
+def get_patient_history(db: Session, patient_id: int) -> List[Dict[str, Any]]:
+    return [
+        {k: v for k, v in r.items() if k != "_sort"}
+        for r in iter_patient_history(db, patient_id)
     ]
 
 def get_record_by_id(db: Session, record_id: int) -> Dict[str, Any]:
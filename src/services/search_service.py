@@ -1,13 +1,28 @@
-from typing import Dict, Any, List, Tuple, Optional
-from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Tuple, Optional
+from datetime import datetime, date, time, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from src.database.models import Patient, MedicalRecord
+from sqlalchemy import or_, and_, func, text as sql_text
+from src.database.models import Patient, MedicalRecord, PulseVector
 from src.database.connection import SessionLocal, SessionCloud
+from src.database import search_index
+from src.services import llm_vector_cache, pulse_model
+from src.services.cloud_health import cloud_health
+from src.services.pulse_index import PulseVectorIndex, RecordMeta, pulse_index, MAX_DISTANCE, POSITION_SLOTS
+from src.services.text_index import TEXT_INDEX_PATH, text_index
+from src.utils.keyword_matcher import KeywordMatcher
+from src.utils.lru_cache import LRUCache
+from src.utils.pagination import keyset_before
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
 import logging
+import hashlib
+import heapq
+import itertools
+import threading
+import time as _time
 import math
 import json
-import copy
+import os
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -20,39 +35,176 @@ def _get_cloud_session():
             logger.warning(f"Could not create cloud session: {e}")
     return None
 
-def _query_patients_by_date(db: Session, start, end, user_id: int = None, source: str = "local") -> List[Dict[str, Any]]:
-    """Helper to query patients from a single database session."""
-    query = db.query(MedicalRecord).join(Patient).filter(
-        func.date(MedicalRecord.visit_date) >= start,
-        func.date(MedicalRecord.visit_date) <= end
-    )
-    
-    if user_id is not None:
-        query = query.filter(MedicalRecord.user_id == user_id)
-    
-    records = query.order_by(MedicalRecord.visit_date.desc()).all()
-    
-    results = []
-    for r in records:
-        p = r.patient
-        if p:
-            results.append({
-                "uuid": p.uuid,  # Use UUID for deduplication
-                "id": p.id,
-                "name": p.name,
-                "gender": p.gender,
-                "age": p.age,
-                "phone": p.phone,
-                "last_visit": r.visit_date.strftime("%Y-%m-%d"),
-                "source": source
-            })
-    return results
+# Longest a hybrid query waits for the cloud before answering with local results only
+CLOUD_QUERY_BUDGET_SECONDS = float(os.getenv("CLOUD_QUERY_BUDGET_SECONDS", "1.5"))
+
+# Rows fetched per round-trip when streaming from a server-side cursor
+_STREAM_CHUNK = 500
+# Cloud rows fetched per page when no page size is requested
+_CLOUD_PAGE_SIZE = 200
+_NO_VISIT = datetime(1970, 1, 1)
 
-def get_patients_by_date_range(db: Session, start_date_str: str = None, end_date_str: str = None, single_date_str: str = None, user_id: int = None) -> List[Dict[str, Any]]:
+_cloud_executor: Optional[ThreadPoolExecutor] = None
+_cloud_executor_lock = threading.Lock()
+
+
+def _get_cloud_executor() -> ThreadPoolExecutor:
+    global _cloud_executor
+    with _cloud_executor_lock:
+        if _cloud_executor is None:
+            _cloud_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cloud-query")
+        return _cloud_executor
+
+
+def _run_cloud_query(query_fn, *args, **kwargs) -> Optional[List[Dict[str, Any]]]:
+    """Open a cloud session, run query_fn on it and close it, all on the worker thread. None if no cloud."""
+    cloud_db = _get_cloud_session()
+    if cloud_db is None:
+        return None
+    try:
+        with cloud_health.track():
+            return query_fn(cloud_db, *args, source="cloud", **kwargs)
+    finally:
+        cloud_db.close()
+
+
+def _await_cloud(future, deadline: float) -> Tuple[List[Dict[str, Any]], bool]:
+    """(rows, partial): the cloud rows, or [] and True when the cloud missed the deadline or failed."""
+    try:
+        return future.result(timeout=max(0.0, deadline - _time.monotonic())) or [], False
+    except FuturesTimeout:
+        # The worker finishes (and closes its session) in the background
+        logger.warning(f"Cloud query exceeded {CLOUD_QUERY_BUDGET_SECONDS}s budget; returning local results.")
+    except Exception as e:
+        logger.warning(f"Cloud query failed: {e}")
+    return [], True
+
+
+class HybridRows:
     """
-    Hybrid query: Find patients from BOTH Local and Cloud databases within a date range.
-    Results are merged by UUID. Local records take priority.
+    Iterator over the k-way merge of local and cloud rows, newest first.
+    partial is True when cloud rows are missing (deadline, failure or open breaker).
+    """
+
+    def __init__(self, rows: Iterator[Dict[str, Any]], partial: bool = False):
+        self._rows = rows
+        self.partial = partial
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        return next(self._rows)
+
+
+def _hybrid_rows(db: Session, fetch_page, build_query, args: tuple, after=None, limit: int = None) -> HybridRows:
+    """
+    Stream local and cloud rows merged by their (sort value, uuid) key, descending.
+
+    Local rows stream from a server-side cursor on the caller's session. The first cloud
+    page is fetched on a worker thread while the local query starts, within
+    CLOUD_QUERY_BUDGET_SECONDS; later pages continue from the last cloud row's key.
+    Both sides start after the same cursor, so the merge respects it. A cloud row whose
+    patient is also a local result is dropped (local takes priority); that is checked with
+    one uuid-IN query per cloud page.
+    """
+    local_rows = _stream_rows(build_query(db, *args, after=after), "local")
+    if not SessionCloud:
+        return HybridRows(local_rows)
+    if not cloud_health.allow_request():
+        # Known-down cloud: answer from local without paying any cloud latency
+        return HybridRows(local_rows, partial=True)
+
+    page_size = min(limit, _CLOUD_PAGE_SIZE) if limit else _CLOUD_PAGE_SIZE
+    deadline = _time.monotonic() + CLOUD_QUERY_BUDGET_SECONDS
+    future = _get_cloud_executor().submit(_run_cloud_query, fetch_page, build_query, args, after=after, limit=page_size)
+    first_local = next(local_rows, None)
+    first_page, partial = _await_cloud(future, deadline)
+    result = HybridRows(iter(()), partial)
+
+    def cloud_rows():
+        page = first_page
+        while page:
+            in_local = {
+                row.uuid for row in build_query(db, *args, uuids=[r["uuid"] for r in page]).with_entities(Patient.uuid)
+            }
+            for row in page:
+                if row["uuid"] not in in_local:
+                    yield row
+            if len(page) < page_size:
+                return
+            next_future = _get_cloud_executor().submit(
+                _run_cloud_query, fetch_page, build_query, args, after=page[-1]["_sort"], limit=page_size
+            )
+            page, missed = _await_cloud(next_future, _time.monotonic() + CLOUD_QUERY_BUDGET_SECONDS)
+            result.partial = result.partial or missed
+
+    local = itertools.chain([first_local] if first_local else [], local_rows)
+    result._rows = heapq.merge(local, cloud_rows(), key=lambda r: r["_sort"], reverse=True)
+    return result
+
+
+def _stream_rows(query, source: str) -> Iterator[Dict[str, Any]]:
+    """Patient rows from a server-side cursor, fetched in chunks."""
+    for row in query.yield_per(_STREAM_CHUNK):
+        yield _patient_row(row, source)
+
+
+def _fetch_patient_page(db: Session, build_query, args: tuple, source: str = "local", after=None,
+                        limit: int = None) -> List[Dict[str, Any]]:
+    query = build_query(db, *args, after=after)
+    if limit:
+        query = query.limit(limit)
+    return [_patient_row(row, source) for row in query]
+
+
+def _patient_row(row, source: str) -> Dict[str, Any]:
+    return {
+        "uuid": row.uuid,  # Use UUID for deduplication
+        "id": row.id,
+        "name": row.name,
+        "gender": row.gender,
+        "age": row.age,
+        "phone": row.phone,
+        "last_visit": row.sort_at.strftime("%Y-%m-%d") if row.sort_at != _NO_VISIT else None,
+        "source": source,
+        "_sort": (row.sort_at, row.uuid),
+    }
+
+
+def public_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip the internal uuid and sort key from a patient row."""
+    return {k: v for k, v in row.items() if k not in ("uuid", "_sort")}
+
+
+_PATIENT_COLUMNS = (Patient.id, Patient.uuid, Patient.name, Patient.gender, Patient.age, Patient.phone)
+
+
+def _patients_by_date_query(db: Session, start, end, user_id: int = None, after=None, uuids=None):
     """
+    One projected row per patient with their latest visit in [start, end]; the record
+    JSON is never read and patients come from the same query (no per-row lazy loads).
+    Ordered by (latest visit, uuid) descending; `after` is a keyset cursor on that key.
+    """
+    last_visit = func.max(MedicalRecord.visit_date)
+    query = db.query(*_PATIENT_COLUMNS, last_visit.label("sort_at")).join(
+        MedicalRecord, MedicalRecord.patient_id == Patient.id
+    )
+    query = _apply_record_filters(query, user_id=user_id, start_date=start, end_date=end)
+    if uuids is not None:
+        query = query.filter(Patient.uuid.in_(uuids))
+    query = query.group_by(*_PATIENT_COLUMNS)
+    if after is not None:
+        query = query.having(keyset_before(last_visit, Patient.uuid, after))
+    return query.order_by(last_visit.desc(), Patient.uuid.desc())
+
+
+def _query_patients_by_date(db: Session, start, end, user_id: int = None, source: str = "local") -> List[Dict[str, Any]]:
+    """Helper to query patients from a single database session."""
+    return _fetch_patient_page(db, _patients_by_date_query, (start, end, user_id), source=source)
+
+
+def _parse_date_range(start_date_str: str = None, end_date_str: str = None, single_date_str: str = None):
     # Handle dates and defaults
     if start_date_str and end_date_str:
         start = datetime.strptime(start_date_str, "%Y-%m-%d").date()
@@ -72,54 +224,56 @@ def get_patients_by_date_range(db: Session, start_date_str: str = None, end_date
         
     if start > end:
         start, end = end, start
-    
-    # 1. Query Local DB (passed in as 'db')
-    local_results = _query_patients_by_date(db, start, end, user_id)
-    
-    # 2. Query Cloud DB (with graceful fallback)
-    cloud_results = []
-    cloud_db = _get_cloud_session()
-    if cloud_db:
-        try:
-            cloud_results = _query_patients_by_date(cloud_db, start, end, user_id, source="cloud")
-        except Exception as e:
-            logger.warning(f"Cloud query failed: {e}")
-        finally:
-            cloud_db.close()
-    
-    # 3. Merge: Local takes priority, Cloud supplements
-    seen_uuids = set()
-    merged_results = []
-    
-    for p in local_results:
-        if p["uuid"] not in seen_uuids:
-            seen_uuids.add(p["uuid"])
-            merged_results.append(p)
-    
-    for p in cloud_results:
-        if p["uuid"] not in seen_uuids:
-            seen_uuids.add(p["uuid"])
-            merged_results.append(p)
-    
-    # Sort by last_visit descending
-    merged_results.sort(key=lambda x: x["last_visit"], reverse=True)
-    
-    # Remove internal 'uuid' but keep 'source' for UI
-    return [{k: v for k, v in p.items() if k not in ['uuid']} for p in merged_results]
+    return start, end
 
 
-def _query_patients_by_name(db: Session, query_str: str, user_id: int = None, account_type: str = "practitioner", source: str = "local") -> List[Dict[str, Any]]:
-    """Helper to search patients from a single database session."""
-    # Escape wildcard characters to prevent denial of service via '%%%...'
-    safe_query = query_str.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-    
-    base_filter = or_(
-        Patient.name.ilike(f"%{safe_query}%", escape="\\"),
-        Patient.phone.ilike(f"%{safe_query}%", escape="\\"),
-        Patient.pinyin.ilike(f"%{safe_query}%", escape="\\")
-    )
+def iter_patients_by_date_range(db: Session, start_date_str: str = None, end_date_str: str = None,
+                                single_date_str: str = None, user_id: int = None,
+                                after=None, limit: int = None) -> HybridRows:
+    """
+    Streaming form of get_patients_by_date_range: merged local/cloud rows, latest visit
+    first, starting after the (visit datetime, uuid) cursor `after`.
+    Rows keep internal 'uuid'/'_sort' keys; see public_row.
+    """
+    start, end = _parse_date_range(start_date_str, end_date_str, single_date_str)
+    return _hybrid_rows(db, _fetch_patient_page, _patients_by_date_query, (start, end, user_id), after, limit)
+
+
+def get_patients_by_date_range(db: Session, start_date_str: str = None, end_date_str: str = None, single_date_str: str = None, user_id: int = None,
+                               return_partial: bool = False):
+    """
+    Hybrid query: Find patients from BOTH Local and Cloud databases within a date range.
+    Results are merged by UUID. Local records take priority.
+    Both databases are queried in parallel; with return_partial=True the result is
+    (results, partial), where partial means the cloud missed its deadline or failed.
+    """
+    rows = iter_patients_by_date_range(db, start_date_str, end_date_str, single_date_str, user_id)
+    results = [public_row(p) for p in rows]
+    return (results, rows.partial) if return_partial else results
+
+
+def _patients_by_name_query(db: Session, query_str: str, user_id: int = None, account_type: str = "practitioner",
+                            after=None, uuids=None):
+    """Patients matching query_str in name/phone/pinyin, most recently updated first (keyset on (updated_at, uuid))."""
+    if search_index.uses_fts(db.get_bind(), query_str):
+        # Trigram FTS5 shadow table: substring match without scanning patients
+        base_filter = Patient.id.in_(
+            sql_text(f"SELECT rowid FROM {search_index.FTS_TABLE} WHERE {search_index.FTS_TABLE} MATCH :fts_query")
+            .bindparams(fts_query=search_index.fts_match_expression(query_str))
+        )
+    else:
+        # Escape wildcard characters to prevent denial of service via '%%%...'
+        # (on Postgres these ILIKEs are served by the pg_trgm GIN indexes)
+        safe_query = query_str.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        
+        base_filter = or_(
+            Patient.name.ilike(f"%{safe_query}%", escape="\\"),
+            Patient.phone.ilike(f"%{safe_query}%", escape="\\"),
+            Patient.pinyin.ilike(f"%{safe_query}%", escape="\\")
+        )
     
-    query = db.query(Patient).filter(base_filter)
+    updated_at = func.coalesce(Patient.updated_at, _NO_VISIT)
+    query = db.query(*_PATIENT_COLUMNS, updated_at.label("sort_at")).filter(base_filter)
     
     if user_id is not None:
         if account_type == 'personal':
@@ -132,61 +286,46 @@ def _query_patients_by_name(db: Session, query_str: str, user_id: int = None, ac
                 MedicalRecord.user_id == user_id
             ).distinct().subquery()
             query = query.filter(Patient.id.in_(patient_ids))
-        
-    patients = query.limit(20).all()
-    
-    return [
-        {
-            "uuid": p.uuid,
-            "id": p.id,
-            "name": p.name,
-            "gender": p.gender,
-            "age": p.age,
-            "phone": p.phone,
-            "last_visit": p.updated_at.strftime("%Y-%m-%d") if p.updated_at else None,
-            "source": source
-        }
-        for p in patients
-    ]
+    if uuids is not None:
+        query = query.filter(Patient.uuid.in_(uuids))
+    if after is not None:
+        query = query.filter(keyset_before(updated_at, Patient.uuid, after))
+    return query.order_by(updated_at.desc(), Patient.uuid.desc())
+
+
+def _query_patients_by_name(db: Session, query_str: str, user_id: int = None, account_type: str = "practitioner", source: str = "local") -> List[Dict[str, Any]]:
+    """Helper to search patients from a single database session."""
+    return _fetch_patient_page(db, _patients_by_name_query, (query_str, user_id, account_type),
+                               source=source, limit=SEARCH_PAGE_SIZE)
+
+
+# Default page size of patient search (the original hard cap)
+SEARCH_PAGE_SIZE = 20
 
-def search_patients(db: Session, query: str, user_id: int = None, account_type: str = "practitioner") -> List[Dict[str, Any]]:
+
+def iter_search_patients(db: Session, query: str, user_id: int = None, account_type: str = "practitioner",
+                         after=None, limit: int = None) -> HybridRows:
+    """
+    Streaming form of search_patients: merged local/cloud matches, most recently updated
+    first, starting after the (updated_at, uuid) cursor `after`.
+    Rows keep internal 'uuid'/'_sort' keys; see public_row.
+    """
+    if not query:
+        return HybridRows(iter(()))
+    return _hybrid_rows(db, _fetch_patient_page, _patients_by_name_query, (query, user_id, account_type), after, limit)
+
+
+def search_patients(db: Session, query: str, user_id: int = None, account_type: str = "practitioner",
+                    return_partial: bool = False):
     """
     Hybrid search: Find patients from BOTH Local and Cloud databases by name/phone.
     Results are merged by UUID. Local records take priority.
+    Both databases are queried in parallel; with return_partial=True the result is
+    (results, partial), where partial means the cloud missed its deadline or failed.
     """
-    if not query:
-        return []
-    
-    # 1. Query Local DB
-    local_results = _query_patients_by_name(db, query, user_id, account_type)
-    
-    # 2. Query Cloud DB
-    cloud_results = []
-    cloud_db = _get_cloud_session()
-    if cloud_db:
-        try:
-            cloud_results = _query_patients_by_name(cloud_db, query, user_id, account_type, source="cloud")
-        except Exception as e:
-            logger.warning(f"Cloud search failed: {e}")
-        finally:
-            cloud_db.close()
-    
-    # 3. Merge by UUID
-    seen_uuids = set()
-    merged_results = []
-    
-    for p in local_results:
-        if p["uuid"] not in seen_uuids:
-            seen_uuids.add(p["uuid"])
-            merged_results.append(p)
-    
-    for p in cloud_results:
-        if p["uuid"] not in seen_uuids:
-            seen_uuids.add(p["uuid"])
-            merged_results.append(p)
-    
-    # Return without internal 'uuid' field
-    return [{k: v for k, v in p.items() if k != 'uuid'} for p in merged_results[:20]]
+    rows = iter_search_patients(db, query, user_id, account_type, limit=SEARCH_PAGE_SIZE)
+    results = [public_row(p) for p in itertools.islice(rows, SEARCH_PAGE_SIZE)]
+    return (results, rows.partial) if return_partial else results
 
 # 八纲辨证 keyword → 4D vector mapping: [虚实, 阴阳, 表里, 寒热]
 # 虚实: 虚(-1) ↔ 实(+1), 阴阳: 阴(-1) ↔ 阳(+1)
@@ -224,34 +363,87 @@ _DEPTH_WEIGHTS = {"chen": 1.5, "zhong": 1.0, "fu": 0.8}
 _OVERALL_WEIGHT = 1.2
 
 
+# Compiled once at import; shared by every cell of every grid.
+# Rebuilt by _check_vector_tables() if PULSE_KEYWORD_VECTORS changes.
+_PULSE_KEYWORD_MATCHER = KeywordMatcher(PULSE_KEYWORD_VECTORS)
+
+# Clinicians reuse a small vocabulary of phrases, so phrase→vector and grid→vector
+# results are memoized. Sizes are configurable; counters via pulse_vector_cache_info().
+_phrase_vector_cache = LRUCache(int(os.getenv("PULSE_PHRASE_CACHE_SIZE", "4096")))
+_grid_vector_cache = LRUCache(int(os.getenv("PULSE_GRID_CACHE_SIZE", "20000")))
+_vector_tables_fingerprint = None
+
+_GRID_POSITIONS = [
+    f"{prefix}{pos}-{depth}"
+    for prefix in ("left-", "right-", "")
+    for depth in ("fu", "zhong", "chen")
+    for pos in ("cun", "guan", "chi")
+]
+
+
+_POSITION_SLOTS = _GRID_POSITIONS + ["overall_description"]
+_SLOT_OF_POSITION = {key: i for i, key in enumerate(_POSITION_SLOTS)}
+assert len(_POSITION_SLOTS) == POSITION_SLOTS
+
+# Bit i of a position bitmask = i-th keyword of PULSE_KEYWORD_VECTORS. A uint32 holds the
+# first 32 keywords; later ones still count in the 4D vectors but not in position similarity.
+_POSITION_MASK_BITS = 32
+_KEYWORD_BITS: Dict[str, int] = {}
+
+
+def _check_vector_tables():
+    """Drop memoized vectors and recompile the matcher when the keyword table or weights change."""
+    global _vector_tables_fingerprint, _PULSE_KEYWORD_MATCHER, _KEYWORD_BITS
+    fingerprint = (
+        tuple((kw, tuple(vec)) for kw, vec in PULSE_KEYWORD_VECTORS.items()),
+        tuple(_DEPTH_WEIGHTS.items()),
+        _OVERALL_WEIGHT,
+    )
+    if fingerprint == _vector_tables_fingerprint:
+        return
+    if _vector_tables_fingerprint is not None:
+        logger.info("Pulse keyword table or weights changed; clearing vector caches.")
+        _PULSE_KEYWORD_MATCHER = KeywordMatcher(PULSE_KEYWORD_VECTORS)
+    keywords = list(PULSE_KEYWORD_VECTORS)
+    if len(keywords) > _POSITION_MASK_BITS:
+        logger.warning(f"Position bitmasks hold {_POSITION_MASK_BITS} pulse keywords; "
+                       f"{', '.join(keywords[_POSITION_MASK_BITS:])} are left out of position similarity.")
+    _KEYWORD_BITS = {kw: 1 << i for i, kw in enumerate(keywords[:_POSITION_MASK_BITS])}
+    _phrase_vector_cache.clear()
+    _grid_vector_cache.clear()
+    _vector_tables_fingerprint = fingerprint
+
+
+def pulse_vector_cache_info() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters of the phrase and grid vector caches."""
+    return {"phrase": _phrase_vector_cache.info(), "grid": _grid_vector_cache.info()}
+
+
 def _extract_keywords(text: str) -> List[str]:
     """Extract matching pulse keywords from text, longest match first."""
-    found = []
-    # Sort keywords by length descending so multi-char keywords match first
-    sorted_kw = sorted(PULSE_KEYWORD_VECTORS.keys(), key=len, reverse=True)
-    remaining = text
-    while remaining:
-        matched = False
-        for kw in sorted_kw:
-            if remaining.startswith(kw):
-                found.append(kw)
-                remaining = remaining[len(kw):]
-                matched = True
-                break
-        if not matched:
-            remaining = remaining[1:]
-    return found
+    _check_vector_tables()
+    return _PULSE_KEYWORD_MATCHER.scan(text)
 
 
-def _text_to_vector(text: str) -> List[float]:
-    """Convert a pulse description text to a 4D 八纲 vector by summing keyword vectors."""
+def _phrase_vector(text: str) -> Tuple[float, ...]:
+    """Memoized keyword sum for one phrase. Callers must run _check_vector_tables() first."""
+    cached = _phrase_vector_cache.get(text)
+    if cached is not None:
+        return cached
     vec = [0.0, 0.0, 0.0, 0.0]
-    keywords = _extract_keywords(text)
-    for kw in keywords:
+    for kw in _PULSE_KEYWORD_MATCHER.scan(text):
         kw_vec = PULSE_KEYWORD_VECTORS[kw]
         for i in range(4):
             vec[i] += kw_vec[i]
-    return vec
+    result = tuple(vec)
+    _phrase_vector_cache.put(text, result)
+    return result
+
+
+def _text_to_vector(text: str) -> List[float]:
+    """Convert a pulse description text to a 4D 八纲 vector by summing keyword vectors."""
+    _check_vector_tables()
+    return list(_phrase_vector(text))
 
 
 def _normalize_vector(vec: List[float]) -> List[float]:
@@ -262,47 +454,68 @@ def _normalize_vector(vec: List[float]) -> List[float]:
     return [v / max_abs for v in vec]
 
 
+def _grid_cells(grid: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    """Canonical (position, stripped text) pairs of the non-empty cells of a grid."""
+    cells = []
+    for key in _GRID_POSITIONS + ["overall_description"]:
+        text = grid.get(key, "")
+        if isinstance(text, str):
+            text = text.strip()
+            if text:
+                cells.append((key, text))
+    return tuple(cells)
+
+
 def _grid_to_vector(grid: Dict[str, Any]) -> List[float]:
     """Convert an entire pulse grid to a weighted 4D 八纲 vector."""
-    base_positions = [
-        "cun-fu", "guan-fu", "chi-fu",
-        "cun-zhong", "guan-zhong", "chi-zhong",
-        "cun-chen", "guan-chen", "chi-chen",
-    ]
+    _check_vector_tables()
+    cells = _grid_cells(grid)
+    cached = _grid_vector_cache.get(cells)
+    if cached is not None:
+        return list(cached)
+
     accumulated = [0.0, 0.0, 0.0, 0.0]
     total_weight = 0.0
-
-    for prefix in ("left-", "right-", ""):
-        for pos in base_positions:
-            key = f"{prefix}{pos}" if prefix else pos
-            text = grid.get(key, "")
-            if not isinstance(text, str):
-                continue
-            text = text.strip()
-            if not text:
-                continue
-            # Determine depth weight from position name
-            depth = pos.split("-")[-1]  # fu / zhong / chen
-            weight = _DEPTH_WEIGHTS.get(depth, 1.0)
-            vec = _text_to_vector(text)
-            for i in range(4):
-                accumulated[i] += vec[i] * weight
-            total_weight += weight
-
-    # Overall description
-    overall = grid.get("overall_description", "")
-    if isinstance(overall, str) and overall.strip():
-        vec = _text_to_vector(overall.strip())
+    for key, text in cells:
+        if key == "overall_description":
+            weight = _OVERALL_WEIGHT
+        else:
+            # Determine depth weight from position name: fu / zhong / chen
+            weight = _DEPTH_WEIGHTS.get(key.rsplit("-", 1)[-1], 1.0)
+        vec = _phrase_vector(text)
         for i in range(4):
-            accumulated[i] += vec[i] * _OVERALL_WEIGHT
-        total_weight += _OVERALL_WEIGHT
+            accumulated[i] += vec[i] * weight
+        total_weight += weight
 
     if total_weight == 0:
-        return [0.0, 0.0, 0.0, 0.0]
+        result = [0.0, 0.0, 0.0, 0.0]
+    else:
+        # Average by total weight, then normalize
+        averaged = [accumulated[i] / total_weight for i in range(4)]
+        result = _normalize_vector(averaged)
 
-    # Average by total weight, then normalize
-    averaged = [accumulated[i] / total_weight for i in range(4)]
-    return _normalize_vector(averaged)
+    _grid_vector_cache.put(cells, tuple(result))
+    return result
+
+
+def _grid_to_position_bits(grid: Dict[str, Any]) -> np.ndarray:
+    """Encode a grid as one keyword bitmask per position, keeping which position carried which quality."""
+    _check_vector_tables()
+    bits = np.zeros(len(_POSITION_SLOTS), dtype=np.uint32)
+    for key, text in _grid_cells(grid):
+        mask = 0
+        for kw in _PULSE_KEYWORD_MATCHER.scan(text):
+            mask |= _KEYWORD_BITS.get(kw, 0)
+        bits[_SLOT_OF_POSITION[key]] = mask
+    return bits
+
+
+def _position_weights() -> np.ndarray:
+    """Per-slot weights for position Jaccard scoring, matching the 4D mode's depth weights."""
+    return np.array([
+        _OVERALL_WEIGHT if key == "overall_description" else _DEPTH_WEIGHTS.get(key.rsplit("-", 1)[-1], 1.0)
+        for key in _POSITION_SLOTS
+    ], dtype=np.float32)
 
 
 def _format_grid_for_prompt(grid: Dict[str, Any]) -> str:
@@ -341,6 +554,56 @@ _LLM_PULSE_USER_PROMPT_TEMPLATE = """脉象数据：
 只输出JSON，不要其他文字。"""
 
 
+_LLM_PULSE_BATCH_PROMPT_TEMPLATE = """以下是{count}条脉象记录，每条以“记录 ID”开头：
+
+{records}
+
+请分别根据每条记录所有位点的脉象描述，输出一个JSON数组，每条记录一个对象，包含记录ID和四个维度的评分（-1到1之间的小数）：
+- id: 记录ID（整数）
+- xu_shi: 虚(-1)到实(+1)
+- yin_yang: 阴(-1)到阳(+1)
+- biao_li: 表(-1)到里(+1)
+- han_re: 寒(-1)到热(+1)
+
+只输出JSON数组，不要其他文字。"""
+
+_LLM_VECTOR_FIELDS = ("xu_shi", "yin_yang", "biao_li", "han_re")
+
+# Batched extraction: prompt plus expected answer of one request must fit the token budget
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "4000"))
+LLM_BATCH_MAX_GRIDS = int(os.getenv("LLM_BATCH_MAX_GRIDS", "20"))
+# One {"id": .., "xu_shi": .., ...} object in the answer
+_LLM_ANSWER_TOKENS_PER_GRID = 40
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else text[3:]
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+
+def _parse_llm_vector(entry: Any) -> Optional[List[float]]:
+    """Validate one LLM answer object into a clamped 4D vector, or None."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        vec = [float(entry[field]) for field in _LLM_VECTOR_FIELDS]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if any(math.isnan(v) for v in vec):
+        return None
+    # Clamp to [-1, 1]
+    return [max(-1.0, min(1.0, v)) for v in vec]
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: about one token per CJK character, four ASCII characters per token."""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+
 def _llm_grid_to_vector(grid: Dict[str, Any], llm_service) -> Optional[List[float]]:
     """Use LLM to extract a 4D 八纲辨证 vector from pulse grid data.
     Returns None if LLM is unavailable or fails."""
@@ -351,29 +614,145 @@ def _llm_grid_to_vector(grid: Dict[str, Any], llm_service) -> Optional[List[floa
     try:
         user_prompt = _LLM_PULSE_USER_PROMPT_TEMPLATE.format(grid_text=grid_text)
         response = llm_service._call_llm(_LLM_PULSE_SYSTEM_PROMPT, user_prompt)
-
-        # Strip markdown code fences if present
-        text = response.strip()
-        if text.startswith("```"):
-            text = text.split("\n", 1)[1] if "\n" in text else text[3:]
-            text = text.rsplit("```", 1)[0]
-        text = text.strip()
-
-        parsed = json.loads(text)
-        vec = [
-            float(parsed["xu_shi"]),
-            float(parsed["yin_yang"]),
-            float(parsed["biao_li"]),
-            float(parsed["han_re"]),
-        ]
-        # Clamp to [-1, 1]
-        vec = [max(-1.0, min(1.0, v)) for v in vec]
+        vec = _parse_llm_vector(json.loads(_strip_code_fence(response)))
+        if vec is None:
+            raise ValueError(f"invalid vector in LLM answer: {response[:200]}")
         return vec
     except Exception as e:
         logger.warning(f"LLM pulse vector extraction failed: {e}")
         return None
 
 
+def _pack_grid_batches(items: List[Tuple[int, str]], token_budget: int = None,
+                       max_grids: int = None) -> List[List[Tuple[int, str]]]:
+    """
+    Greedily pack (record_id, grid_text) items into batches whose estimated prompt and
+    answer tokens stay within token_budget. An item too large for any batch goes alone.
+    """
+    token_budget = token_budget or LLM_BATCH_TOKEN_BUDGET
+    max_grids = max_grids or LLM_BATCH_MAX_GRIDS
+    base = _estimate_tokens(_LLM_PULSE_SYSTEM_PROMPT) + _estimate_tokens(
+        _LLM_PULSE_BATCH_PROMPT_TEMPLATE.format(count=0, records="")
+    )
+    batches, batch, used = [], [], base
+    for record_id, grid_text in items:
+        cost = _estimate_tokens(f"记录 {record_id}:\n{grid_text}\n\n") + _LLM_ANSWER_TOKENS_PER_GRID
+        if batch and (used + cost > token_budget or len(batch) >= max_grids):
+            batches.append(batch)
+            batch, used = [], base
+        batch.append((record_id, grid_text))
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _llm_batch_vectors(batch: List[Tuple[int, str]], grids: Dict[int, Dict[str, Any]], llm_service,
+                       rate_limiter=None) -> Dict[int, List[float]]:
+    """
+    One LLM request for a batch of formatted grids, answered as a JSON array keyed by record id.
+    Entries that are missing or fail validation are retried one grid per request.
+    """
+    vectors: Dict[int, List[float]] = {}
+    if len(batch) > 1:
+        records = "\n\n".join(f"记录 {record_id}:\n{grid_text}" for record_id, grid_text in batch)
+        user_prompt = _LLM_PULSE_BATCH_PROMPT_TEMPLATE.format(count=len(batch), records=records)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = llm_service._call_llm(_LLM_PULSE_SYSTEM_PROMPT, user_prompt)
+            parsed = json.loads(_strip_code_fence(response))
+            if isinstance(parsed, dict):
+                # Tolerate {"<id>": {...}} as well as [{"id": <id>, ...}]
+                parsed = [{"id": key, **value} for key, value in parsed.items() if isinstance(value, dict)]
+            if not isinstance(parsed, list):
+                raise ValueError("expected a JSON array")
+            wanted = {record_id for record_id, _ in batch}
+            for entry in parsed:
+                try:
+                    record_id = int(entry.get("id"))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+                vec = _parse_llm_vector(entry)
+                if record_id in wanted and vec is not None:
+                    vectors[record_id] = vec
+        except Exception as e:
+            logger.warning(f"Batched LLM pulse vector extraction failed for {len(batch)} grids: {e}")
+
+    for record_id, _ in batch:
+        if record_id in vectors:
+            continue
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        vec = _llm_grid_to_vector(grids[record_id], llm_service)
+        if vec is not None:
+            vectors[record_id] = vec
+    return vectors
+
+
+def llm_grids_to_vectors(items: List[Tuple[int, Dict[str, Any]]], llm_service, executor=None,
+                         rate_limiter=None, token_budget: int = None) -> Dict[int, List[float]]:
+    """
+    LLM vectors for many (record_id, pulse_grid) pairs, packing several grids per request
+    within the token budget. Returns {record_id: vector} for the grids that succeeded.
+    """
+    grids = dict(items)
+    formatted = [(record_id, _format_grid_for_prompt(grid)) for record_id, grid in items]
+    batches = _pack_grid_batches([(record_id, text) for record_id, text in formatted if text], token_budget)
+    run = lambda batch: _llm_batch_vectors(batch, grids, llm_service, rate_limiter)
+    vectors: Dict[int, List[float]] = {}
+    for result in (executor.map(run, batches) if executor is not None else map(run, batches)):
+        vectors.update(result)
+    return vectors
+
+
+def _llm_query_vector(db: Session, grid: Dict[str, Any], llm_service) -> Optional[List[float]]:
+    """LLM vector for a query grid, served from the persistent cache when the same grid was seen before."""
+    cells = _grid_cells(grid)
+    if not cells:
+        return None
+    revision = llm_vector_revision(llm_service)
+    key = llm_vector_cache.make_cache_key(cells, revision)
+    return llm_vector_cache.get_or_compute(db, key, revision, lambda: _llm_grid_to_vector(grid, llm_service))
+
+
+def _learned_query_vector(grid: Dict[str, Any], llm_service) -> Optional[List[float]]:
+    """Predict the LLM vector with the offline-trained model, if one matches the current LLM revision."""
+    model = pulse_model.get_active_model()
+    if model is None or model.target_revision != llm_vector_revision(llm_service):
+        return None
+    return model.predict(grid)
+
+
+def train_pulse_model(db: Session, llm_service, holdout: float = 0.2, l2: float = 1.0,
+                      save: bool = True) -> Dict[str, Any]:
+    """
+    Fit the offline pulse model to the LLM vectors cached on records from the current LLM revision.
+    Vectors cached before records were stamped with pulse_vector_model count as current, as they
+    do for search. Returns the calibration report (held-out error of the model and of the keyword vectors).
+    """
+    revision = llm_vector_revision(llm_service)
+    grids, targets = [], []
+    for record in db.query(MedicalRecord).filter(MedicalRecord.data.isnot(None)).yield_per(500):
+        data = record.data
+        vec = _cached_llm_vector(data)
+        if vec is None or "pulse_grid" not in data or data.get("pulse_vector_model") not in (None, revision):
+            continue
+        grids.append(data["pulse_grid"])
+        targets.append(vec)
+
+    _check_vector_tables()
+    model = pulse_model.train(
+        grids, targets, keywords=list(PULSE_KEYWORD_VECTORS), slots=_POSITION_SLOTS,
+        target_revision=revision, baseline=_grid_to_vector, holdout=holdout, l2=l2,
+    )
+    if save:
+        model.save()
+    pulse_model.set_active_model(model)
+    logger.info(f"Trained pulse vector model on {len(grids)} records: {model.report}")
+    return model.report
+
+
 def _vector_similarity(vec_a: List[float], vec_b: List[float]) -> float:
     """Compute similarity between two 4D vectors. Returns 0.0 ~ 1.0."""
     dist = math.sqrt(sum((a - b) ** 2 for a, b in zip(vec_a, vec_b)))
@@ -381,24 +760,240 @@ def _vector_similarity(vec_a: List[float], vec_b: List[float]) -> float:
     return 1.0 - (dist / max_dist)
 
 
-def search_similar_records(db: Session, current_grid: Dict[str, Any], llm_service=None) -> List[Dict[str, Any]]:
+# Bump when the LLM prompt changes in a way that shifts the produced vectors
+_LLM_PULSE_PROMPT_VERSION = "v1"
+
+# Set PULSE_INDEX_ENABLED=0 when running several worker processes: a per-process
+# index cannot see the other workers' saves, so search prefilters in SQL instead.
+PULSE_INDEX_ENABLED = os.getenv("PULSE_INDEX_ENABLED", "1") != "0"
+
+_pulse_vector_table_fresh = False
+
+
+def keyword_vector_revision() -> str:
+    """Fingerprint of the keyword table and weights. Stored keyword vectors with another revision are stale."""
+    payload = json.dumps([PULSE_KEYWORD_VECTORS, _DEPTH_WEIGHTS, _OVERALL_WEIGHT], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def llm_vector_revision(llm_service) -> str:
+    """Identify which model and prompt version produced an LLM vector."""
+    return f"{getattr(llm_service, 'model', 'unknown')}@{_LLM_PULSE_PROMPT_VERSION}"
+
+
+def _cached_llm_vector(data: Dict[str, Any]) -> Optional[List[float]]:
+    """Read a cached LLM pulse vector from record data, or None if absent/invalid."""
+    if not data or not data.get("pulse_vector"):
+        return None
+    try:
+        vec = [float(v) for v in data["pulse_vector"]]
+    except (TypeError, ValueError):
+        return None
+    return vec if len(vec) == 4 else None
+
+
+def _record_index_entry(record_id: int, data: Dict[str, Any]):
+    """Build a (record_id, keyword_vec, llm_vec) index entry, or None without a pulse grid."""
+    if not data or "pulse_grid" not in data:
+        return None
+    return (record_id, _grid_to_vector(data["pulse_grid"]), _cached_llm_vector(data))
+
+
+def store_pulse_vectors(db: Session, record: MedicalRecord, revision: str = None):
     """
-    Search for similar medical records based on 八纲辨证 vector similarity.
-    When llm_service is provided, uses LLM to extract semantic vectors from free-text
-    pulse descriptions. Falls back to keyword-based vectors when LLM is unavailable.
-    Only searches records that have a practitioner (teacher records) for learning reference.
+    Write the record's vectors to the pulse_vectors table within the caller's transaction.
+    The JSON data stays the synced source of truth; the table is a local typed copy.
     """
-    if not current_grid:
-        return []
+    entry = _record_index_entry(record.id, record.data)
+    if entry is None:
+        record.pulse_vectors = None
+        return
+    _, kw_vec, llm_vec = entry
+    row = record.pulse_vectors
+    if row is None:
+        row = PulseVector(record_id=record.id)
+        record.pulse_vectors = row
+    for column, value in zip(PulseVector.KW_COLUMNS, kw_vec):
+        setattr(row, column, value)
+    row.kw_revision = revision or keyword_vector_revision()
+    for column, value in zip(PulseVector.LLM_COLUMNS, llm_vec or [None] * 4):
+        setattr(row, column, value)
+    row.position_bits = _grid_to_position_bits(record.data["pulse_grid"]).astype("<u4").tobytes()
+    row.llm_model = (record.data.get("pulse_vector_model") or "unknown") if llm_vec else None
+
+
+def refresh_pulse_vector_table(db: Session, chunk_size: int = 500) -> int:
+    """Backfill pulse_vectors rows that are missing or carry a stale keyword revision."""
+    global _pulse_vector_table_fresh
+    revision = keyword_vector_revision()
+    stale_ids = [record_id for (record_id,) in db.query(MedicalRecord.id).outerjoin(
+        PulseVector, PulseVector.record_id == MedicalRecord.id
+    ).filter(
+        MedicalRecord.practitioner_id.isnot(None),
+        or_(
+            PulseVector.record_id.is_(None),
+            PulseVector.kw_revision != revision,
+            PulseVector.position_bits.is_(None),
+        )
+    ).all()]
+
+    for i in range(0, len(stale_ids), chunk_size):
+        chunk = stale_ids[i:i + chunk_size]
+        for record in db.query(MedicalRecord).filter(MedicalRecord.id.in_(chunk)).all():
+            store_pulse_vectors(db, record, revision)
+        db.commit()
+
+    if stale_ids:
+        logger.info(f"Refreshed stored pulse vectors for {len(stale_ids)} records.")
+    _pulse_vector_table_fresh = True
+    return len(stale_ids)
+
+
+def _record_meta(record: MedicalRecord) -> RecordMeta:
+    return RecordMeta(record.practitioner_id, record.user_id, record.patient_id,
+                      record.visit_date.date() if record.visit_date else None)
+
+
+def _pulse_vector_entries(query) -> List[Tuple[int, List[float], Optional[List[float]], RecordMeta]]:
+    """Turn projected (record_id, kw x4, llm x4, practitioner, user, patient, visit_date, bits) rows into index entries."""
+    entries = []
+    for row in query:
+        llm_vec = list(row[5:9])
+        visit_date = row[12].date() if row[12] else None
+        bits = np.frombuffer(row[13], dtype="<u4").astype(np.uint32) if row[13] else None
+        entries.append((
+            row[0], list(row[1:5]), None if any(v is None for v in llm_vec) else llm_vec,
+            RecordMeta(row[9], row[10], row[11], visit_date), bits,
+        ))
+    return entries
+
+
+def _teacher_pulse_vector_query(db: Session):
+    columns = [getattr(PulseVector, c) for c in PulseVector.KW_COLUMNS + PulseVector.LLM_COLUMNS]
+    return db.query(
+        PulseVector.record_id, *columns,
+        MedicalRecord.practitioner_id, MedicalRecord.user_id, MedicalRecord.patient_id, MedicalRecord.visit_date,
+        PulseVector.position_bits,
+    ).join(
+        MedicalRecord, MedicalRecord.id == PulseVector.record_id
+    ).filter(MedicalRecord.practitioner_id.isnot(None))
+
+
+def _apply_record_filters(query, practitioner_id=None, user_id=None, patient_id=None, start_date=None, end_date=None):
+    """SQL equivalent of PulseVectorIndex filter predicates (sargable visit_date range)."""
+    if practitioner_id is not None:
+        query = query.filter(MedicalRecord.practitioner_id == practitioner_id)
+    if user_id is not None:
+        query = query.filter(MedicalRecord.user_id == user_id)
+    if patient_id is not None:
+        query = query.filter(MedicalRecord.patient_id == patient_id)
+    if start_date is not None:
+        query = query.filter(MedicalRecord.visit_date >= datetime.combine(start_date, time.min))
+    if end_date is not None:
+        query = query.filter(MedicalRecord.visit_date < datetime.combine(end_date + timedelta(days=1), time.min))
+    return query
+
+
+def ensure_pulse_index(db: Session):
+    """Build the in-process pulse index over all teacher records on first use."""
+    if pulse_index.is_built:
+        return
+    refresh_pulse_vector_table(db)
+    entries = _pulse_vector_entries(_teacher_pulse_vector_query(db))
+    pulse_index.build(entries)
+    logger.info(f"Built pulse similarity index with {len(entries)} teacher records.")
+
+
+def invalidate_pulse_vectors():
+    """Force a table backfill and index rebuild, e.g. when records changed in bulk behind the service's back."""
+    global _pulse_vector_table_fresh
+    _pulse_vector_table_fresh = False
+    pulse_index.invalidate()
+    # Reloads from disk and catches up on the next text search
+    text_index.invalidate()
+
+
+def _prefilter_pulse_vectors(db: Session, vec: List[float], max_distance: float, use_llm: bool, **filters):
+    """
+    Fetch candidate vectors inside the per-axis bounding box around vec.
+    The box encloses the euclidean ball of radius max_distance, so nothing within reach is lost.
+    """
+    def in_box(columns):
+        return and_(*[
+            getattr(PulseVector, c).between(v - max_distance, v + max_distance)
+            for c, v in zip(columns, vec)
+        ])
+
+    box = in_box(PulseVector.KW_COLUMNS)
+    if use_llm:
+        box = or_(
+            and_(PulseVector.llm_xu_shi.isnot(None), in_box(PulseVector.LLM_COLUMNS)),
+            and_(PulseVector.llm_xu_shi.is_(None), box),
+        )
+    return _pulse_vector_entries(_apply_record_filters(_teacher_pulse_vector_query(db), **filters).filter(box))
+
+
+def index_medical_record(record: MedicalRecord):
+    """Add, refresh or drop a record in the pulse index after it was saved."""
+    entry = _record_index_entry(record.id, record.data) if record.practitioner_id is not None else None
+    if entry:
+        pulse_index.upsert(*entry, _record_meta(record), _grid_to_position_bits(record.data["pulse_grid"]))
+    else:
+        pulse_index.remove(record.id)
+    if record.practitioner_id is not None:
+        text_index.upsert(record.id, _record_text_segments(record.data, record.complaint, record.diagnosis),
+                          _record_meta(record))
+    else:
+        text_index.remove(record.id)
+
 
+def unindex_medical_record(record_id: int):
+    """Drop a deleted record from the pulse and text indexes."""
+    pulse_index.remove(record_id)
+    text_index.remove(record_id)
+
+
+def reindex_medical_records(db: Session, record_ids: Iterable[int], chunk_size: int = 500) -> int:
+    """
+    Refresh stored vectors and index entries of records written behind record_service's
+    back, e.g. pulled by sync. Ids that no longer exist are dropped from the indexes.
+    Returns the number of records refreshed.
+    """
+    record_ids = list(record_ids)
+    refreshed = 0
+    for i in range(0, len(record_ids), chunk_size):
+        chunk = record_ids[i:i + chunk_size]
+        for record in db.query(MedicalRecord).filter(MedicalRecord.id.in_(chunk)).all():
+            store_pulse_vectors(db, record)
+        db.commit()
+        # One query reloads the chunk the commit expired
+        records = db.query(MedicalRecord).filter(MedicalRecord.id.in_(chunk)).all()
+        for record in records:
+            index_medical_record(record)
+        for record_id in set(chunk) - {record.id for record in records}:
+            unindex_medical_record(record_id)
+        refreshed += len(records)
+    return refreshed
+
+
+# Default minimum weighted per-position Jaccard for the "position" mode
+_POSITION_SIMILARITY_THRESHOLD = 0.5
+
+
+def _vector_similarity_hits(db: Session, current_grid: Dict[str, Any], llm_service, limit: int, offset: int,
+                            min_similarity: Optional[float], filters: Dict[str, Any]):
+    """KNN over 4D 八纲 vectors (LLM vector for the query when available)."""
     # Try LLM vector first, fall back to keyword-based
     current_vec = None
     used_llm = False
     if llm_service:
-        current_vec = _llm_grid_to_vector(current_grid, llm_service)
+        # A trained model imitating this LLM answers locally; otherwise ask the LLM (cached)
+        current_vec = _learned_query_vector(current_grid, llm_service)
+        if current_vec is None:
+            current_vec = _llm_query_vector(db, current_grid, llm_service)
         if current_vec:
             used_llm = True
-            logger.info(f"Using LLM vector for current input: {current_vec}")
+            logger.info(f"Using LLM-space vector for current input: {current_vec}")
 
     if current_vec is None:
         current_vec = _grid_to_vector(current_grid)
@@ -407,82 +1002,307 @@ def search_similar_records(db: Session, current_grid: Dict[str, Any], llm_servic
     if current_vec == [0.0, 0.0, 0.0, 0.0]:
         return []
 
-    candidates = db.query(MedicalRecord).filter(
-        MedicalRecord.practitioner_id.isnot(None)
-    ).order_by(MedicalRecord.created_at.desc()).limit(200).all()
-
-    results = []
     # LLM vectors are more precise and spread out, so use a lower threshold
-    similarity_threshold = 0.80 if used_llm else 0.90
+    similarity_threshold = min_similarity
+    if similarity_threshold is None:
+        similarity_threshold = 0.80 if used_llm else 0.90
 
-    for record in candidates:
-        if not record.data or "pulse_grid" not in record.data:
-            continue
+    if PULSE_INDEX_ENABLED:
+        ensure_pulse_index(db)
+        index = pulse_index
+    else:
+        if not _pulse_vector_table_fresh:
+            refresh_pulse_vector_table(db)
+        max_distance = (1.0 - similarity_threshold) * MAX_DISTANCE
+        index = PulseVectorIndex()
+        index.build(_prefilter_pulse_vectors(db, current_vec, max_distance, used_llm, **filters))
+    return index.query(current_vec, k=limit, offset=offset, use_llm=used_llm,
+                       min_similarity=similarity_threshold, **filters)
 
-        # Prefer cached LLM vector if available
-        candidate_vec = None
-        if used_llm and record.data.get("pulse_vector"):
-            try:
-                candidate_vec = [float(v) for v in record.data["pulse_vector"]]
-                if len(candidate_vec) != 4:
-                    candidate_vec = None
-            except (TypeError, ValueError):
-                candidate_vec = None
 
-        if candidate_vec is None:
-            candidate_grid = record.data["pulse_grid"]
-            candidate_vec = _grid_to_vector(candidate_grid)
+def _position_similarity_hits(db: Session, current_grid: Dict[str, Any], limit: int, offset: int,
+                              min_similarity: Optional[float], filters: Dict[str, Any]):
+    """Weighted per-position Jaccard over keyword bitmasks; keeps which position carried which quality."""
+    bits = _grid_to_position_bits(current_grid)
+    if not bits.any():
+        return []
+    threshold = _POSITION_SIMILARITY_THRESHOLD if min_similarity is None else min_similarity
 
-        if candidate_vec == [0.0, 0.0, 0.0, 0.0]:
-            continue
+    if PULSE_INDEX_ENABLED:
+        ensure_pulse_index(db)
+        index = pulse_index
+    else:
+        if not _pulse_vector_table_fresh:
+            refresh_pulse_vector_table(db)
+        # Bitmask similarity has no bounding box; prefilter on the record predicates only
+        index = PulseVectorIndex()
+        index.build(_pulse_vector_entries(_apply_record_filters(_teacher_pulse_vector_query(db), **filters)))
+    return index.query_positions(bits, _position_weights(), k=limit, offset=offset,
+                                 min_similarity=threshold, **filters)
+
+
+def search_similar_records(db: Session, current_grid: Dict[str, Any], llm_service=None, limit: int = 5,
+                           offset: int = 0, min_similarity: Optional[float] = None,
+                           practitioner_id: int = None, user_id: int = None, patient_id: int = None,
+                           start_date: date = None, end_date: date = None,
+                           mode: str = "vector") -> List[Dict[str, Any]]:
+    """
+    Search for similar medical records based on 八纲辨证 vector similarity.
+    When llm_service is provided, uses LLM to extract semantic vectors from free-text
+    pulse descriptions. Falls back to keyword-based vectors when LLM is unavailable.
+    Only searches records that have a practitioner (teacher records) for learning reference.
+    Candidates come from the in-process pulse index, which covers the whole teacher corpus,
+    or from an SQL bounding-box prefilter over pulse_vectors when the index is disabled.
+    Results can be narrowed by practitioner, author (user_id), patient and visit date window,
+    and paged with limit/offset. min_similarity overrides the default threshold.
+    mode="position" ranks by per-position keyword overlap instead of the averaged 4D vector
+    (no LLM call); the returned "vector" is then the candidate's keyword vector.
+    """
+    if not current_grid:
+        return []
+
+    filters = {
+        "practitioner_id": practitioner_id, "user_id": user_id, "patient_id": patient_id,
+        "start_date": start_date, "end_date": end_date,
+    }
+    if mode == "position":
+        hits = _position_similarity_hits(db, current_grid, limit, offset, min_similarity, filters)
+    elif mode == "vector":
+        hits = _vector_similarity_hits(db, current_grid, llm_service, limit, offset, min_similarity, filters)
+    else:
+        raise ValueError(f"Unknown similarity mode: {mode}")
+    if not hits:
+        return []
 
-        similarity = _vector_similarity(current_vec, candidate_vec)
-        if similarity >= similarity_threshold:
-            patient = record.patient
-            results.append({
-                "record_id": record.id,
-                "patient_name": patient.name if patient else "Unknown",
-                "visit_date": record.visit_date.strftime("%Y-%m-%d"),
-                "score": round(similarity * 100, 1),
-                "similarity": round(similarity, 4),
-                "vector": [round(v, 3) for v in candidate_vec],
-                "pulse_grid": record.data["pulse_grid"],
-                "complaint": record.complaint,
-            })
-
-    results.sort(key=lambda x: x["similarity"], reverse=True)
-    return results[:5]
-
-
-def precompute_pulse_vectors(db: Session, llm_service) -> int:
-    """Batch compute LLM pulse vectors for records that don't have one cached.
-    Returns the number of records updated."""
     records = db.query(MedicalRecord).filter(
-        MedicalRecord.practitioner_id.isnot(None)
+        MedicalRecord.id.in_([record_id for record_id, _, _ in hits])
     ).all()
+    records_by_id = {r.id: r for r in records}
 
-    updated = 0
-    for record in records:
-        if not record.data or "pulse_grid" not in record.data:
-            continue
-        # Skip if already has a cached vector
-        if record.data.get("pulse_vector"):
+    results = []
+    for record_id, similarity, candidate_vec in hits:
+        record = records_by_id.get(record_id)
+        if record is None or not record.data or "pulse_grid" not in record.data:
+            # Deleted behind the index's back (e.g. by a script); drop it lazily
+            pulse_index.remove(record_id)
             continue
+        patient = record.patient
+        results.append({
+            "record_id": record.id,
+            "patient_name": patient.name if patient else "Unknown",
+            "visit_date": record.visit_date.strftime("%Y-%m-%d"),
+            "score": round(similarity * 100, 1),
+            "similarity": round(similarity, 4),
+            "vector": [round(v, 3) for v in candidate_vec],
+            "pulse_grid": record.data["pulse_grid"],
+            "complaint": record.complaint,
+        })
 
-        vec = _llm_grid_to_vector(record.data["pulse_grid"], llm_service)
-        if vec is None:
-            continue
+    return results
 
-        new_data = copy.deepcopy(record.data)
-        new_data["pulse_vector"] = [round(v, 4) for v in vec]
-        record.data = new_data
-        updated += 1
 
-        # Commit in batches of 10 to avoid long transactions
-        if updated % 10 == 0:
-            db.commit()
+PRECOMPUTE_CHUNK_SIZE = 200
+
+
+def iter_precompute_chunks(db: Session, after_id: int = 0,
+                           chunk_size: int = PRECOMPUTE_CHUNK_SIZE) -> Iterator[Tuple[int, int, List[Tuple[int, Dict[str, Any]]]]]:
+    """
+    Walk teacher records past after_id in id order, one keyset chunk at a time.
+    Yields (last_id, scanned, pending) where pending holds (record_id, pulse_grid) for
+    records without a cached LLM vector. Only id and data are read, and each chunk is a
+    separate query, so callers may commit between chunks.
+    """
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.data).filter(
+            MedicalRecord.practitioner_id.isnot(None),
+            MedicalRecord.id > after_id,
+        ).order_by(MedicalRecord.id).limit(chunk_size).yield_per(chunk_size)
+        scanned, pending = 0, []
+        for record_id, data in rows:
+            scanned += 1
+            after_id = record_id
+            if data and "pulse_grid" in data and not data.get("pulse_vector"):
+                pending.append((record_id, data["pulse_grid"]))
+        if not scanned:
+            return
+        yield after_id, scanned, pending
+
+
+def apply_llm_vectors(db: Session, vectors: Dict[int, List[float]], revision: str) -> int:
+    """Cache LLM vectors on their records (JSON, pulse_vectors table and index); the caller commits."""
+    if not vectors:
+        return 0
+    records = db.query(MedicalRecord).filter(MedicalRecord.id.in_(list(vectors))).all()
+    for record in records:
+        # A new top-level dict is enough for the JSON column to register the change
+        record.data = {
+            **record.data,
+            "pulse_vector": [round(v, 4) for v in vectors[record.id]],
+            "pulse_vector_model": revision,
+        }
+        store_pulse_vectors(db, record)
+        index_medical_record(record)
+    return len(records)
+
+
+def precompute_pulse_vectors(db: Session, llm_service, after_id: int = 0, executor=None, rate_limiter=None,
+                             on_chunk=None, should_stop=None, chunk_size: int = PRECOMPUTE_CHUNK_SIZE) -> int:
+    """
+    Batch compute LLM pulse vectors for records that don't have one cached.
+    Returns the number of records updated.
+
+    Grids of a chunk are sent several per LLM request (llm_grids_to_vectors); executor
+    runs those requests concurrently and rate_limiter.acquire() is called before each.
+    on_chunk(db, last_id, scanned, pending, updated) runs before each chunk commits, so a
+    checkpoint written there lands in the same transaction as the vectors.
+    should_stop() is checked between chunks.
+    """
+    revision = llm_vector_revision(llm_service)
+    updated = 0
+    for last_id, scanned, pending in iter_precompute_chunks(db, after_id, chunk_size):
+        vectors = llm_grids_to_vectors(pending, llm_service, executor=executor, rate_limiter=rate_limiter)
+        chunk_updated = apply_llm_vectors(db, vectors, revision)
+        if on_chunk is not None:
+            on_chunk(db, last_id, scanned, len(pending), chunk_updated)
+        db.commit()
+        updated += chunk_updated
+        if chunk_updated:
             logger.info(f"Precomputed {updated} pulse vectors so far...")
+        if should_stop is not None and should_stop():
+            break
 
-    db.commit()
     logger.info(f"Precomputed pulse vectors for {updated} records total.")
     return updated
+
+
+# Minimum TF-IDF cosine for free-text search hits
+_TEXT_SIMILARITY_THRESHOLD = 0.05
+# Catch-up after loading a saved text index re-reads records written this long before the save
+_TEXT_CATCHUP_MARGIN = timedelta(minutes=10)
+_text_index_lock = threading.Lock()
+
+
+def _record_text_segments(data: Dict[str, Any], complaint: Optional[str], diagnosis: Optional[str]) -> List[str]:
+    """Free-text segments of a record for the text index: pulse cells, complaint, diagnosis."""
+    grid = (data or {}).get("pulse_grid") or {}
+    return [text for _, text in _grid_cells(grid)] + [complaint or "", diagnosis or ""]
+
+
+def _teacher_text_docs(query) -> Iterator[Tuple[int, List[str], RecordMeta]]:
+    columns = query.with_entities(
+        MedicalRecord.id, MedicalRecord.data, MedicalRecord.complaint, MedicalRecord.diagnosis,
+        MedicalRecord.practitioner_id, MedicalRecord.user_id, MedicalRecord.patient_id, MedicalRecord.visit_date,
+    )
+    for record_id, data, complaint, diagnosis, practitioner_id, user_id, patient_id, visit_date in columns.yield_per(1000):
+        meta = RecordMeta(practitioner_id, user_id, patient_id, visit_date.date() if visit_date else None)
+        yield record_id, _record_text_segments(data, complaint, diagnosis), meta
+
+
+def _teacher_records(db: Session):
+    return db.query(MedicalRecord).filter(MedicalRecord.practitioner_id.isnot(None))
+
+
+def rebuild_text_index(db: Session, save: bool = True) -> Dict[str, Any]:
+    """Refit the text index (vocabulary, IDF, postings) on all teacher records and persist it."""
+    started = _time.perf_counter()
+    text_index.fit(_teacher_text_docs(_teacher_records(db)))
+    if save:
+        text_index.save(TEXT_INDEX_PATH)
+    stats = {
+        "records": len(text_index),
+        "vocabulary": text_index.vocabulary_size,
+        "seconds": round(_time.perf_counter() - started, 2),
+    }
+    logger.info(f"Built text similarity index: {stats}")
+    return stats
+
+
+def _catch_up_text_index(db: Session) -> int:
+    """
+    Bring a text index loaded from disk up to date with records written or deleted after it was saved.
+    Returns the number of records removed or upserted.
+    """
+    indexed = text_index.record_ids()
+    current = {record_id for (record_id,) in _teacher_records(db).with_entities(MedicalRecord.id)}
+    for record_id in indexed - current:
+        text_index.remove(record_id)
+
+    since = text_index.saved_at - _TEXT_CATCHUP_MARGIN
+    # sync_down keeps the cloud updated_at but stamps last_synced_at
+    changed = _teacher_records(db).filter(or_(
+        MedicalRecord.updated_at >= since, MedicalRecord.last_synced_at >= since,
+    ))
+    docs = list(_teacher_text_docs(changed))
+    missing = list(current - indexed - {record_id for record_id, _, _ in docs})
+    for i in range(0, len(missing), 500):
+        docs += _teacher_text_docs(_teacher_records(db).filter(MedicalRecord.id.in_(missing[i:i + 500])))
+    for record_id, segments, meta in docs:
+        text_index.upsert(record_id, segments, meta)
+    return len(indexed - current) + len(docs)
+
+
+def ensure_text_index(db: Session):
+    """Load the saved text index (or fit one) on first use."""
+    if text_index.is_built:
+        return
+    with _text_index_lock:
+        if text_index.is_built:
+            return
+        try:
+            text_index.load(TEXT_INDEX_PATH)
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"No usable saved text index ({e}); fitting a new one.")
+            rebuild_text_index(db)
+            return
+        if _catch_up_text_index(db):
+            # Otherwise every load re-reads the same records written since the last save
+            try:
+                text_index.save(TEXT_INDEX_PATH)
+            except OSError as e:
+                logger.warning(f"Could not save the caught-up text index: {e}")
+        logger.info(f"Loaded text similarity index with {len(text_index)} records.")
+
+
+def search_records_by_text(db: Session, text: str, limit: int = 5, offset: int = 0,
+                           min_similarity: Optional[float] = None, practitioner_id: int = None,
+                           user_id: int = None, patient_id: int = None, start_date: date = None,
+                           end_date: date = None) -> List[Dict[str, Any]]:
+    """
+    Find teacher records whose pulse descriptions, complaint and diagnosis resemble free text.
+    Ranks by TF-IDF cosine over character n-grams from the local text index (no LLM, no network).
+    Filters and paging work as in search_similar_records.
+    """
+    if not text or not text.strip():
+        return []
+    ensure_text_index(db)
+    hits = text_index.query(
+        text, k=limit, offset=offset,
+        min_similarity=_TEXT_SIMILARITY_THRESHOLD if min_similarity is None else min_similarity,
+        practitioner_id=practitioner_id, user_id=user_id, patient_id=patient_id,
+        start_date=start_date, end_date=end_date,
+    )
+    if not hits:
+        return []
+
+    records_by_id = {
+        r.id: r for r in db.query(MedicalRecord).filter(MedicalRecord.id.in_([record_id for record_id, _ in hits]))
+    }
+    results = []
+    for record_id, similarity in hits:
+        record = records_by_id.get(record_id)
+        if record is None:
+            # Deleted behind the index's back (e.g. by a script); drop it lazily
+            text_index.remove(record_id)
+            continue
+        patient = record.patient
+        results.append({
+            "record_id": record.id,
+            "patient_name": patient.name if patient else "Unknown",
+            "visit_date": record.visit_date.strftime("%Y-%m-%d") if record.visit_date else None,
+            "score": round(similarity * 100, 1),
+            "similarity": round(similarity, 4),
+            "pulse_grid": (record.data or {}).get("pulse_grid"),
+            "complaint": record.complaint,
+            "diagnosis": record.diagnosis,
+        })
+    return results
@@ -0,0 +1,140 @@
+"""Runs cloud sync on a background thread, on demand and on a schedule.
+
+Requests never run a sync on the event loop: trigger() queues a run and returns
+at once. Triggers that arrive while a run is in progress are merged into a
+single follow-up run, because the current run may already be past the changes
+that prompted them. wait() blocks until the run covering a trigger has finished.
+
+The runner keeps the live progress of the current run and the result of the
+last one; /api/sync/status is answered from this state and the maintained
+pending count without touching the database.
+
+SYNC_INTERVAL_SECONDS > 0 also triggers a sync that often (see start_schedule).
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from src.services.sync_service import SyncProgress, SyncService
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "0"))
+
+
+class SyncRunner:
+    """At most one sync at a time per process; overlapping triggers coalesce into one follow-up run."""
+
+    def __init__(self, service: SyncService = None, interval: float = SYNC_INTERVAL_SECONDS):
+        self.service = service or SyncService()
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._requested = 0  # Generation of the latest trigger
+        self._completed = 0  # Generation covered by the last finished run
+        self._running = 0  # Generation covered by the run in progress
+        self._reconcile = False  # The next run also compares the databases (SyncService.reconcile)
+        self._progress: Optional[SyncProgress] = None
+        self._started_at: Optional[datetime] = None
+        self._finished_at: Optional[datetime] = None
+        self._last_result: Optional[Dict[str, Any]] = None
+        self._schedule: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.version = 0  # Bumped whenever the run state changes (not per progress step)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self, reconcile: bool = False) -> Tuple[int, bool]:
+        """
+        Queue a sync, followed by a reconciliation when reconcile=True. Returns (generation,
+        started): started is False when the trigger was merged into the follow-up of a run
+        already in progress.
+        """
+        with self._cond:
+            self._requested += 1
+            self._reconcile = self._reconcile or reconcile
+            started = self._thread is None
+            if started:
+                self._thread = threading.Thread(target=self._work, name="sync-runner", daemon=True)
+                self._thread.start()
+            return self._requested, started
+
+    def wait(self, generation: int, timeout: float = None) -> Optional[Dict[str, Any]]:
+        """Result of the run that covered `generation`, or None on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._completed >= generation, timeout):
+                return None
+            return self._last_result
+
+    def _work(self):
+        while True:
+            with self._cond:
+                if self._completed >= self._requested:
+                    self._thread = None
+                    return
+                generation = self._running = self._requested
+                reconcile, self._reconcile = self._reconcile, False
+                self._progress = SyncProgress()
+                self._started_at = datetime.now()
+                self.version += 1
+            try:
+                result = self.service.sync_all(self._progress)
+                if reconcile:
+                    result["reconcile"] = self.service.reconcile(self._progress)
+            except Exception as e:
+                logger.error(f"Sync run failed: {e}")
+                result = {"status": "error", "message": str(e)}
+            with self._cond:
+                self._completed = generation
+                self._last_result = result
+                self._finished_at = datetime.now()
+                self._progress = None
+                self.version += 1
+                self._cond.notify_all()
+
+    def pending_count(self) -> int:
+        return self.service.get_pending_count()
+
+    def progress_version(self) -> Tuple[int, int]:
+        """Changes whenever status() would; cheap enough to poll."""
+        progress = self._progress
+        return self.version, progress.version if progress else 0
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            progress = self._progress
+            result = {
+                "running": progress is not None,
+                "queued": self._requested > (self._running if progress is not None else self._completed),
+                "started_at": self._started_at.isoformat() if self._started_at else None,
+                "finished_at": self._finished_at.isoformat() if self._finished_at else None,
+                "last_result": self._last_result,
+            }
+        result["progress"] = progress.snapshot() if progress else None
+        result["interval_seconds"] = self.interval or None
+        return result
+
+    def start_schedule(self) -> bool:
+        """Trigger a sync every `interval` seconds on a daemon thread; returns whether it started."""
+        if self.interval <= 0 or (self._schedule is not None and self._schedule.is_alive()):
+            return False
+        self._stop.clear()
+        self._schedule = threading.Thread(target=self._scheduled, name="sync-schedule", daemon=True)
+        self._schedule.start()
+        return True
+
+    def stop_schedule(self):
+        self._stop.set()
+
+    def _scheduled(self):
+        # While the cloud is down, runs fail fast in get_cloud_db until the breaker allows a probe
+        while not self._stop.wait(self.interval):
+            if not self.running:
+                self.trigger()
+
+
+sync_runner = SyncRunner()
@@ -1,14 +1,298 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from datetime import datetime
+from sqlalchemy import text, func, event, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
 from src.database.connection import SessionLocal, SessionCloud
-from src.database.models import User, Patient, Practitioner, MedicalRecord
+from src.database.models import User, Patient, Practitioner, MedicalRecord, ChangeLog, SyncState
+from src.database.change_log import LOCAL_ORIGIN, log_changes, node_id
+from src.services import merkle, search_service
+from src.services.cloud_health import cloud_health, is_connection_error, watch_engine
+from src.services.patient_suggest import patient_suggest
+from src.services.pending_counter import pending_counter
 import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Rows pushed per INSERT ... ON CONFLICT statement, and cloud rows held in memory
+# and written per local transaction when pulling
+SYNC_CHUNK_SIZE = int(os.getenv("SYNC_CHUNK_SIZE", "500"))
+
+# Dialects whose insert() supports on_conflict_do_update
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+# Keys per IN (...) lookup, below SQLite's bound-parameter limit
+_LOOKUP_BATCH = 900
+
+# sync_state peer name of the cloud database
+SYNC_PEER = "cloud"
+# Cloud change-log entries younger than this are applied but not acknowledged, so entries
+# of writer transactions that had not committed yet at read time are picked up next run
+SYNC_CHANGE_SETTLE_SECONDS = float(os.getenv("SYNC_CHANGE_SETTLE_SECONDS", "60"))
+# Origin logged for rows pulled without a cloud change-log entry
+CLOUD_ORIGIN = "cloud"
+# Cloud chunks sync_down reads ahead of the local writer; 0 reads and writes in turn on one thread
+SYNC_PIPELINE_DEPTH = int(os.getenv("SYNC_PIPELINE_DEPTH", "2"))
+
+
+class SyncIdMap:
+    """
+    Per-run cache of local id <-> uuid <-> cloud id for the models rows point at.
+    Lookups for keys not seen yet in the run are fetched in bulk, one IN query per
+    side and batch; rows written by the run are remembered as they are written, so
+    children never query for parents synced earlier in the same run. Keys known to be
+    missing on a side are cached as None.
+    Cloud lookups run on the thread that owns cloud_db: a pipelined pull prefetches them
+    on its reader thread (prefetch_cloud), so the writer only hits cached cloud keys.
+    """
+
+    def __init__(self, local_db: Session, cloud_db: Session):
+        self.local_db = local_db
+        self.cloud_db = cloud_db
+        self._lock = threading.Lock()
+        self._local_uuid = {}   # model -> {local id: uuid}
+        self._local_id = {}     # model -> {uuid: local id}
+        self._cloud_uuid = {}   # model -> {cloud id: uuid}
+        self._cloud_id = {}     # model -> {uuid: cloud id}
+
+    def remember(self, model, uuid, local_id=None, cloud_id=None):
+        with self._lock:
+            if local_id is not None:
+                self._local_uuid.setdefault(model, {})[local_id] = uuid
+                self._local_id.setdefault(model, {})[uuid] = local_id
+            if cloud_id is not None:
+                self._cloud_uuid.setdefault(model, {})[cloud_id] = uuid
+                self._cloud_id.setdefault(model, {})[uuid] = cloud_id
+
+    def _fetch(self, db: Session, key_column, value_column, keys, known: dict, reverse: dict):
+        """Fill known[key] = value (None when absent) for keys not cached yet."""
+        missing = [key for key in keys if key not in known]
+        for i in range(0, len(missing), _LOOKUP_BATCH):
+            batch = missing[i:i + _LOOKUP_BATCH]
+            found = dict(db.query(key_column, value_column).filter(key_column.in_(batch)).all())
+            with self._lock:
+                for key in batch:
+                    value = found.get(key)
+                    known[key] = value
+                    if value is not None:
+                        reverse[value] = key
+
+    def prefetch_cloud(self, model, cloud_ids):
+        """Cache the uuids of the given cloud ids of model (the cloud half of to_local)."""
+        self._cloud_uuids(model, set(cloud_ids) - {None})
+
+    def _local_uuids(self, model, local_ids):
+        known = self._local_uuid.setdefault(model, {})
+        self._fetch(self.local_db, model.id, model.uuid, local_ids, known, self._local_id.setdefault(model, {}))
+        return known
+
+    def _cloud_ids(self, model, uuids):
+        known = self._cloud_id.setdefault(model, {})
+        self._fetch(self.cloud_db, model.uuid, model.id, uuids, known, self._cloud_uuid.setdefault(model, {}))
+        return known
+
+    def _cloud_uuids(self, model, cloud_ids):
+        known = self._cloud_uuid.setdefault(model, {})
+        self._fetch(self.cloud_db, model.id, model.uuid, cloud_ids, known, self._cloud_id.setdefault(model, {}))
+        return known
+
+    def _local_ids(self, model, uuids):
+        known = self._local_id.setdefault(model, {})
+        self._fetch(self.local_db, model.uuid, model.id, uuids, known, self._local_uuid.setdefault(model, {}))
+        return known
+
+    def to_cloud(self, model, local_ids):
+        """{local id: cloud id} for the given local ids of model; ids without a cloud row are left out."""
+        local_ids = set(local_ids) - {None}
+        uuid_of = self._local_uuids(model, local_ids)
+        uuids = {uuid_of[i] for i in local_ids} - {None}
+        cloud_id_of = self._cloud_ids(model, uuids)
+        return {
+            i: cloud_id_of[uuid_of[i]]
+            for i in local_ids if uuid_of[i] is not None and cloud_id_of.get(uuid_of[i]) is not None
+        }
+
+    def to_local(self, model, cloud_ids):
+        """{cloud id: local id} for the given cloud ids of model; ids without a local row are left out."""
+        cloud_ids = set(cloud_ids) - {None}
+        uuid_of = self._cloud_uuids(model, cloud_ids)
+        uuids = {uuid_of[i] for i in cloud_ids} - {None}
+        local_id_of = self._local_ids(model, uuids)
+        return {
+            i: local_id_of[uuid_of[i]]
+            for i in cloud_ids if uuid_of[i] is not None and local_id_of.get(uuid_of[i]) is not None
+        }
+
+
+class _QueryCounter:
+    """Counts statements the current sync run sends to each database (its own threads only)."""
+
+    def __init__(self, **engines):
+        self.engines = engines
+        self.counts = {name: 0 for name in engines}
+        self._threads = {threading.get_ident()}
+        self._listeners = []
+
+    def include_current_thread(self):
+        self._threads.add(threading.get_ident())
+
+    def __enter__(self):
+        for name, engine in self.engines.items():
+            def count(conn, cursor, statement, parameters, context, executemany, name=name):
+                if threading.get_ident() in self._threads:
+                    self.counts[name] += 1
+            event.listen(engine, "before_cursor_execute", count)
+            self._listeners.append((engine, count))
+        return self
+
+    def __exit__(self, *exc):
+        for engine, count in self._listeners:
+            event.remove(engine, "before_cursor_execute", count)
+        self._listeners = []
+
+class SyncProgress:
+    """
+    Live progress of a sync run: the current phase ('up' or 'down'), the model being
+    written and rows done out of the phase total (None when unknown up front).
+    Written by the sync threads, read by status requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.phase_name = None
+        self.model = None
+        self.done = 0
+        self.total = None
+        self._phase_started = None
+
+    def phase(self, name: str, total: int = None):
+        with self._lock:
+            self.phase_name, self.model, self.done, self.total = name, None, 0, total
+            self._phase_started = time.monotonic()
+            self.version += 1
+
+    def advance(self, model: str, rows: int):
+        with self._lock:
+            self.model = model
+            self.done += rows
+            self.version += 1
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._phase_started if self._phase_started else 0.0
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.total is not None and rate:
+                eta = round(max(0, self.total - self.done) / rate)
+            return {
+                "phase": self.phase_name,
+                "model": self.model,
+                "done": self.done,
+                "total": self.total,
+                "rows_per_second": round(rate, 1),
+                "eta_seconds": eta,
+            }
+
+
+class _Pipeline:
+    """
+    Iterates over chunks produced on a reader thread, up to `depth` chunks ahead of the
+    consumer, so reading the next chunk overlaps with processing the current one.
+    Chunks keep their order. depth <= 0 reads each chunk only when the consumer asks for it.
+    Time and rows are recorded per stage: 'read' is spent producing, 'write' consuming.
+    """
+    _DONE = object()
+
+    def __init__(self, chunks, depth: int, rows=len, on_reader_start=None):
+        self.chunks = chunks
+        self.depth = depth
+        self.rows = rows
+        self.on_reader_start = on_reader_start
+        self.stages = {stage: {"rows": 0, "seconds": 0.0} for stage in ("read", "write")}
+        self.seconds = 0.0
+        self._stop = threading.Event()
+
+    def _next(self):
+        started = time.monotonic()
+        chunk = next(self.chunks, self._DONE)
+        self.stages["read"]["seconds"] += time.monotonic() - started
+        if chunk is not self._DONE:
+            self.stages["read"]["rows"] += self.rows(chunk)
+        return chunk
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, q: queue.Queue):
+        if self.on_reader_start:
+            self.on_reader_start()
+        try:
+            while not self._stop.is_set():
+                chunk = self._next()
+                if chunk is self._DONE or not self._put(q, (chunk, None)):
+                    break
+            self._put(q, (self._DONE, None))
+        except BaseException as e:
+            self._put(q, (None, e))
+        finally:
+            # Close the producer (and its cursor) on the thread that used it
+            getattr(self.chunks, "close", lambda: None)()
+
+    def __iter__(self):
+        started = time.monotonic()
+        reader = None
+        try:
+            if self.depth <= 0:
+                take = self._next
+            else:
+                q = queue.Queue(maxsize=self.depth)
+                reader = threading.Thread(target=self._read, args=(q,), name="sync-reader", daemon=True)
+                reader.start()
+
+                def take():
+                    chunk, error = q.get()
+                    if error is not None:
+                        raise error
+                    return chunk
+
+            while True:
+                chunk = take()
+                if chunk is self._DONE:
+                    return
+                consumed = time.monotonic()
+                yield chunk
+                self.stages["write"]["seconds"] += time.monotonic() - consumed
+                self.stages["write"]["rows"] += self.rows(chunk)
+        finally:
+            self._stop.set()
+            if reader is not None:
+                reader.join()
+            self.seconds += time.monotonic() - started
+
+    def stats(self):
+        stages = {
+            stage: {
+                "rows": s["rows"],
+                "seconds": round(s["seconds"], 3),
+                "rows_per_second": round(s["rows"] / s["seconds"], 1) if s["seconds"] else None,
+            }
+            for stage, s in self.stages.items()
+        }
+        return {"depth": self.depth, "seconds": round(self.seconds, 3), **stages}
+
+
 class SyncService:
     """
     Handles synchronization between Local (SQLite) and Cloud (PostgreSQL) databases.
@@ -20,8 +304,13 @@ class SyncService:
 
     MODELS_ORDER = [User, Practitioner, Patient, MedicalRecord]
 
+    # Foreign key columns that are translated between local and cloud ids via UUID
+    FK_MODELS = {"user_id": User, "patient_id": Patient, "practitioner_id": Practitioner}
+
     def __init__(self):
-        pass
+        self._cloud_change_log = None
+        # table -> False once a failed bulk push found no unique index on uuid
+        self._cloud_upserts = {}
 
     def get_local_db(self):
         return SessionLocal()
@@ -29,17 +318,29 @@ class SyncService:
     def get_cloud_db(self):
         if not SessionCloud:
             raise ConnectionError("Cloud database is not configured.")
+        if not cloud_health.allow_request():
+            raise ConnectionError("Cloud database unreachable; waiting for circuit breaker retry.")
         return SessionCloud()
 
-    def sync_all(self):
+    @contextmanager
+    def _count_queries(self, local_db: Session, cloud_db: Session, results):
+        """Report the statements sent to each database by this run in results["queries"]."""
+        counter = _QueryCounter(local=local_db.get_bind(), cloud=cloud_db.get_bind())
+        try:
+            with counter:
+                yield counter
+        finally:
+            results["queries"] = counter.counts
+
+    def sync_all(self, progress: SyncProgress = None):
         """Unified sync method: Push then Pull."""
         # 1. Sync Up
-        up_results = self.sync_up()
+        up_results = self.sync_up(progress)
         if up_results['status'] == 'error':
             return up_results
         
         # 2. Sync Down
-        down_results = self.sync_down()
+        down_results = self.sync_down(progress)
         if down_results['status'] == 'error':
             # Partial success on up
             down_results['data']['synced_up'] = up_results['data']['synced']
@@ -52,40 +353,71 @@ class SyncService:
                 "synced": up_results['data']['synced'],
                 "failed": up_results['data']['failed'] + down_results['data']['failed'],
                 "downloaded": down_results['data']['synced'],
-                "details": up_results['data']['details'] + down_results['data']['details']
+                "skipped": down_results['data']['skipped'],
+                "details": up_results['data']['details'] + down_results['data']['details'],
+                "queries": {
+                    side: up_results['data'].get('queries', {}).get(side, 0)
+                    + down_results['data'].get('queries', {}).get(side, 0)
+                    for side in ("local", "cloud")
+                },
+                "pipeline": down_results['data'].get('pipeline'),
             }
         }
 
-    def sync_up(self):
+    def _prepare_cloud_session(self, local_db: Session, cloud_db: Session) -> bool:
+        """Tag cloud writes with this node's id; returns whether the cloud keeps a change log."""
+        watch_engine(cloud_db.get_bind())
+        if self._cloud_change_log is None:
+            self._cloud_change_log = inspect(cloud_db.get_bind()).has_table(ChangeLog.__tablename__)
+            if not self._cloud_change_log:
+                logger.warning("Cloud database has no change_log table (run scripts/migrate_cloud_schema.py); "
+                               "pulling by updated_at instead.")
+        cloud_db.info["change_log"] = self._cloud_change_log
+        cloud_db.info["sync_origin"] = node_id(local_db)
+        return self._cloud_change_log
+
+    def _sync_state(self, local_db: Session, direction: str) -> SyncState:
+        state = local_db.query(SyncState).filter(
+            SyncState.peer == SYNC_PEER, SyncState.direction == direction
+        ).first()
+        if state is None:
+            state = SyncState(peer=SYNC_PEER, direction=direction, last_seq=None)
+            local_db.add(state)
+        return state
+
+    @staticmethod
+    def _change_log_head(db: Session) -> int:
+        return db.query(func.max(ChangeLog.seq)).scalar() or 0
+
+    def sync_up(self, progress: SyncProgress = None):
         """
-        Push pending changes from Local to Cloud.
+        Push local changes to the Cloud.
+        Reads the local change log after the last acknowledged seq (sync_state 'up'), plus
+        rows whose last push failed. The first run after upgrading has no mark yet and
+        pushes every row still flagged pending or failed instead.
         """
         local_db = self.get_local_db()
         cloud_db = None
         results = {"synced": 0, "failed": 0, "details": []}
+        progress = progress or SyncProgress()
 
         try:
             cloud_db = self.get_cloud_db()
+            self._prepare_cloud_session(local_db, cloud_db)
+            id_map = SyncIdMap(local_db, cloud_db)
             
-            # 1. Iterate through models in dependency order
-            for model in self.MODELS_ORDER:
-                # Find pending records
-                pending_records = local_db.query(model).filter(
-                    (model.sync_status == 'pending') | (model.sync_status == 'failed')
-                ).all()
-
-                for record in pending_records:
-                    try:
-                        self._sync_record_up(local_db, cloud_db, model, record)
-                        results["synced"] += 1
-                    except Exception as e:
-                        logger.error(f"Failed to sync {model.__tablename__} {record.uuid}: {e}")
-                        if cloud_db:
-                            cloud_db.rollback()
-                        record.sync_status = 'failed'
-                        local_db.commit()
-                        results["failed"] += 1
-                        results["details"].append(f"UP:{model.__tablename__}:{record.id} - {str(e)}")
+            with cloud_health.track(), self._count_queries(local_db, cloud_db, results):
+                state = self._sync_state(local_db, "up")
+                head = self._change_log_head(local_db)
+                if state.last_seq is None:
+                    self._push_by_status(local_db, cloud_db, id_map, results, progress)
+                else:
+                    self._push_changes(local_db, cloud_db, id_map, state.last_seq, head, results, progress)
+                state.last_seq = head
+                # Everything up to the mark has been pushed (failed deletes are logged again
+                # past it); pulled entries are never pushed
+                local_db.query(ChangeLog).filter(ChangeLog.seq <= head).delete(synchronize_session=False)
+                local_db.commit()
 
         except ConnectionError as e:
             logger.error(f"Sync aborted: {e}")
@@ -100,44 +432,122 @@ class SyncService:
 
         return {"status": "completed", "data": results}
 
-    def sync_down(self):
+    def _push_by_status(self, local_db: Session, cloud_db: Session, id_map: SyncIdMap, results, progress: SyncProgress):
+        """Push every pending or failed row, model by model in dependency order."""
+        progress.phase("up")
+        for model in self.MODELS_ORDER:
+            after_id = 0
+            while True:
+                # Keyset on id: rows that fail stay 'failed' and must not be picked up again
+                chunk = local_db.query(model).filter(
+                    (model.sync_status == 'pending') | (model.sync_status == 'failed'),
+                    model.id > after_id,
+                ).order_by(model.id).limit(SYNC_CHUNK_SIZE).all()
+                if not chunk:
+                    break
+                after_id = chunk[-1].id
+                self._sync_chunk_up(local_db, cloud_db, model, chunk, results, id_map)
+                progress.advance(model.__tablename__, len(chunk))
+
+    def _push_changes(self, local_db: Session, cloud_db: Session, id_map: SyncIdMap, after: int, head: int, results,
+                      progress: SyncProgress):
+        """Push the rows changed locally in (after, head], and retry rows whose last push failed."""
+        changed = {}  # table -> {uuid: last op}
+        for table_name, row_uuid, op in local_db.query(ChangeLog.table_name, ChangeLog.row_uuid, ChangeLog.op).filter(
+            ChangeLog.seq > after, ChangeLog.seq <= head, ChangeLog.origin == LOCAL_ORIGIN
+        ).order_by(ChangeLog.seq):
+            changed.setdefault(table_name, {})[row_uuid] = op
+
+        progress.phase("up", sum(len(ops) for ops in changed.values()))
+        for model in self.MODELS_ORDER:
+            ops = changed.get(model.__tablename__, {})
+            uuids = list(ops)
+            uuids += [u for (u,) in local_db.query(model.uuid).filter(model.sync_status == 'failed') if u not in ops]
+            found = set()
+            for i in range(0, len(uuids), SYNC_CHUNK_SIZE):
+                chunk = local_db.query(model).filter(
+                    model.uuid.in_(uuids[i:i + SYNC_CHUNK_SIZE])
+                ).order_by(model.id).all()
+                found.update(record.uuid for record in chunk)
+                if chunk:
+                    self._sync_chunk_up(local_db, cloud_db, model, chunk, results, id_map)
+                    progress.advance(model.__tablename__, len(chunk))
+            deleted = [u for u, op in ops.items() if op == 'delete' and u not in found]
+            if deleted:
+                if not self._delete_cloud_rows(cloud_db, model, deleted, results):
+                    # A deleted row has no sync_status to retry by: log the delete again past the
+                    # mark, so pruning keeps it and the next run pushes it
+                    log_changes(local_db, model.__tablename__, deleted, "delete", origin=LOCAL_ORIGIN)
+                progress.advance(model.__tablename__, len(deleted))
+
+    def _delete_cloud_rows(self, cloud_db: Session, model, uuids, results) -> bool:
+        """Propagate local deletes as soft deletes, so other clients stop pulling the rows; returns success."""
+        values = {model.is_deleted: True}
+        if hasattr(model, 'updated_at'):
+            values[model.updated_at] = datetime.now()
+        try:
+            for i in range(0, len(uuids), SYNC_CHUNK_SIZE):
+                batch = uuids[i:i + SYNC_CHUNK_SIZE]
+                cloud_db.query(model).filter(model.uuid.in_(batch)).update(values, synchronize_session=False)
+                if cloud_db.info.get("change_log"):
+                    log_changes(cloud_db, model.__tablename__, batch, "delete")
+            cloud_db.commit()
+            results["synced"] += len(uuids)
+            return True
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.error(f"Failed to delete {len(uuids)} {model.__tablename__} in cloud: {e}")
+            cloud_db.rollback()
+            results["failed"] += len(uuids)
+            results["details"].append(f"UP:{model.__tablename__}:delete - {str(e)}")
+            return False
+
+    def sync_down(self, progress: SyncProgress = None):
         """
-        Pull new records from Cloud to Local.
-        Simplistic approach: Query all active records from Cloud and Upsert locally.
-        For larger datasets, efficient delta sync (based on last_synced_at) is needed.
+        Pull new and updated records from Cloud to Local.
+        Reads the cloud change log after the last acknowledged seq (sync_state 'down'),
+        skipping entries this node wrote itself. Without a mark yet, or when the cloud
+        has no change log, pulls rows updated after the newest local updated_at instead.
+        Rows deleted in the cloud are deleted locally.
         """
         local_db = self.get_local_db()
+        # Pulled rows are logged with their remote origin, so sync_up does not echo them back
+        local_db.info["sync_origin"] = CLOUD_ORIGIN
         cloud_db = None
-        results = {"synced": 0, "failed": 0, "details": []}
+        results = {"synced": 0, "skipped": 0, "failed": 0, "details": []}
+        progress = progress or SyncProgress()
 
         try:
             cloud_db = self.get_cloud_db()
+            logged = self._prepare_cloud_session(local_db, cloud_db)
+            id_map = SyncIdMap(local_db, cloud_db)
             
-            # Iterate: User -> Practitioner -> Patient -> MedicalRecord
-            for model in self.MODELS_ORDER:
-                # Get all records from Cloud (ignoring deleted for now)
-                # Incremental Sync Optimization
-                query = cloud_db.query(model).filter(model.is_deleted == False)
-                
-                # Check if model supports incremental sync (has updated_at)
-                if hasattr(model, 'updated_at'):
-                    last_update = local_db.query(func.max(model.updated_at)).scalar()
-                    if last_update:
-                        logger.info(f"Incremental sync for {model.__tablename__} since {last_update}")
-                        query = query.filter(model.updated_at > last_update)
-                
-                cloud_records = query.all()
-                
-                for cloud_record in cloud_records:
-                    try:
-                        self._sync_record_down(local_db, cloud_db, model, cloud_record)
-                        results["synced"] += 1
-                    except Exception as e:
-                        logger.error(f"Failed to pull {model.__tablename__} {cloud_record.uuid}: {e}")
-                        if local_db:
-                            local_db.rollback()
-                        results["failed"] += 1
-                        results["details"].append(f"DOWN:{model.__tablename__} - {str(e)}")
+            with cloud_health.track(), self._count_queries(local_db, cloud_db, results) as counter:
+                state = self._sync_state(local_db, "down") if logged else None
+                if state is not None and state.last_seq is not None:
+                    ack = self._settled_seq(cloud_db, state.last_seq)
+                    chunks = self._changed_cloud_chunks(cloud_db, state.last_seq, progress)
+                else:
+                    ack = self._settled_seq(cloud_db, 0) if logged else None
+                    progress.phase("down")
+                    chunks = self._cloud_chunks_by_updated_at(local_db, cloud_db)
+
+                # Read the next cloud chunk while the previous one is written locally
+                pipeline = _Pipeline(
+                    self._with_cloud_parents(chunks, id_map), SYNC_PIPELINE_DEPTH,
+                    rows=lambda chunk: len(chunk[1]), on_reader_start=counter.include_current_thread,
+                )
+                try:
+                    for model, cloud_records, origins in pipeline:
+                        self._apply_cloud_records(local_db, cloud_db, model, cloud_records, id_map, results, origins)
+                        progress.advance(model.__tablename__, len(cloud_records))
+                finally:
+                    results["pipeline"] = pipeline.stats()
+
+                if state is not None:
+                    state.last_seq = ack
+                    local_db.commit()
                         
         except Exception as e:
             logger.error(f"Sync Down error: {e}")
@@ -146,16 +556,187 @@ class SyncService:
             local_db.close()
             if cloud_db:
                 cloud_db.close()
+            self._refresh_pulled(local_db)
+            if results["synced"]:
+                patient_suggest.invalidate()
         
         return {"status": "completed", "data": results}
 
-    def _sync_record_down(self, local_db: Session, cloud_db: Session, model, cloud_record):
+    def _settled_seq(self, cloud_db: Session, after: int) -> int:
+        """Highest cloud seq after `after` that is older than the settle window (else `after`)."""
+        cloud_now = cloud_db.query(func.now()).scalar()
+        cutoff = cloud_now - timedelta(seconds=SYNC_CHANGE_SETTLE_SECONDS)
+        settled = cloud_db.query(func.max(ChangeLog.seq)).filter(
+            ChangeLog.seq > after, ChangeLog.created_at <= cutoff
+        ).scalar()
+        return settled or after
+
+    @staticmethod
+    def _stream(cloud_db: Session, stmt, scalars: bool = False):
+        """
+        Chunks of SYNC_CHUNK_SIZE rows read through a server-side cursor, so only one
+        chunk of cloud rows is held in memory at a time.
+        """
+        result = cloud_db.execute(stmt.execution_options(yield_per=SYNC_CHUNK_SIZE))
+        return (result.scalars() if scalars else result).partitions()
+
+    def _cloud_chunks_by_updated_at(self, local_db: Session, cloud_db: Session):
+        """(model, cloud rows, None) chunks of rows updated after the newest local row of each model."""
+        since = {}
+        for model in self.MODELS_ORDER:
+            # Check if model supports incremental sync (has updated_at)
+            if hasattr(model, 'updated_at'):
+                since[model] = local_db.query(func.max(model.updated_at)).scalar()
+
+        def chunks():
+            for model in self.MODELS_ORDER:
+                # Deleted rows too: their local copies are deleted
+                stmt = select(model)
+                if since.get(model):
+                    logger.info(f"Incremental sync for {model.__tablename__} since {since[model]}")
+                    stmt = stmt.filter(model.updated_at > since[model])
+                for cloud_records in self._stream(cloud_db, stmt.order_by(model.id), scalars=True):
+                    yield model, cloud_records, None
+
+        return chunks()
+
+    def _changed_cloud_chunks(self, cloud_db: Session, after: int, progress: SyncProgress):
+        """(model, cloud rows, {uuid: origin}) chunks of rows other writers changed after seq `after`."""
+        changed = {}  # table -> {uuid: origin of the last change}
+        stmt = select(ChangeLog.table_name, ChangeLog.row_uuid, ChangeLog.origin).filter(
+            ChangeLog.seq > after, ChangeLog.origin != cloud_db.info["sync_origin"]
+        ).order_by(ChangeLog.seq)
+        for entries in self._stream(cloud_db, stmt):
+            for table_name, row_uuid, origin in entries:
+                changed.setdefault(table_name, {})[row_uuid] = origin
+
+        progress.phase("down", sum(len(origins) for origins in changed.values()))
+        for model in self.MODELS_ORDER:
+            origins = changed.get(model.__tablename__, {})
+            uuids = list(origins)
+            for i in range(0, len(uuids), SYNC_CHUNK_SIZE):
+                cloud_records = cloud_db.query(model).filter(
+                    model.uuid.in_(uuids[i:i + SYNC_CHUNK_SIZE])
+                ).order_by(model.id).all()
+                yield model, cloud_records, origins
+
+    def _with_cloud_parents(self, chunks, id_map: SyncIdMap):
+        """Look up the cloud side of each chunk's foreign keys while still on the cloud reader."""
+        try:
+            for model, cloud_records, origins in chunks:
+                for fk_column, related_model in self.FK_MODELS.items():
+                    if hasattr(model, fk_column):
+                        id_map.prefetch_cloud(related_model, [getattr(r, fk_column) for r in cloud_records])
+                yield model, cloud_records, origins
+        finally:
+            chunks.close()
+
+    def _apply_cloud_records(self, local_db: Session, cloud_db: Session, model, cloud_records, id_map: SyncIdMap,
+                             results, origins=None):
+        """
+        Write a chunk of cloud rows locally in one transaction. If the chunk fails as a
+        whole, its rows are applied again one transaction each, so a bad row only fails itself.
+        Rows whose local copy has a pending edit are left alone and counted as skipped.
+        """
+        # Resolve every parent these rows point at in bulk, before touching them one by one
+        for fk_column, related_model in self.FK_MODELS.items():
+            if hasattr(model, fk_column):
+                id_map.to_local(related_model, [getattr(r, fk_column) for r in cloud_records])
+        if origins:
+            local_db.info["sync_origins"] = origins
+
+        try:
+            applied = []
+            for cloud_record in cloud_records:
+                local_record = self._sync_record_down(local_db, cloud_db, model, cloud_record, id_map, commit=False)
+                if local_record is not None:
+                    applied.append((local_record, cloud_record))
+            local_db.flush()
+            written = [(local.uuid, local.id, cloud.id) for local, cloud in applied if not cloud.is_deleted]
+            pulled_ids = [local.id for local, _ in applied]
+            local_db.commit()
+            self._note_pulled(local_db, model, pulled_ids)
+            for row_uuid, local_id, cloud_id in written:
+                id_map.remember(model, row_uuid, local_id=local_id, cloud_id=cloud_id)
+            results["synced"] += len(applied)
+            results["skipped"] += len(cloud_records) - len(applied)
+            return
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.warning(f"Pulling {len(cloud_records)} {model.__tablename__} in one transaction failed, "
+                           f"retrying one by one: {e}")
+            local_db.rollback()
+        finally:
+            local_db.info.pop("sync_origins", None)
+
+        for cloud_record in cloud_records:
+            if origins:
+                local_db.info["sync_origin"] = origins[cloud_record.uuid]
+            try:
+                local_record = self._sync_record_down(local_db, cloud_db, model, cloud_record, id_map)
+                if local_record is None:
+                    results["skipped"] += 1
+                else:
+                    self._note_pulled(local_db, model, [local_record.id])
+                    results["synced"] += 1
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                logger.error(f"Failed to pull {model.__tablename__} {cloud_record.uuid}: {e}")
+                if local_db:
+                    local_db.rollback()
+                results["failed"] += 1
+                results["details"].append(f"DOWN:{model.__tablename__} - {str(e)}")
+        local_db.info["sync_origin"] = CLOUD_ORIGIN
+
+    @staticmethod
+    def _note_pulled(local_db: Session, model, local_ids):
+        """Remember pulled medical records, whose vectors and index entries are refreshed after the run."""
+        if model is MedicalRecord:
+            local_db.info.setdefault("pulled_records", set()).update(local_ids)
+
+    @staticmethod
+    def _refresh_pulled(local_db: Session):
+        """
+        Pulled records bypass record_service: refresh their stored vectors and index entries,
+        so a pull does not drop the in-memory indexes. Runs after the sync session is closed.
+        """
+        pulled = local_db.info.pop("pulled_records", None)
+        if not pulled:
+            return
+        local_db.info.pop("sync_origin", None)
+        try:
+            search_service.reindex_medical_records(local_db, pulled)
+        except Exception as e:
+            logger.error(f"Refreshing {len(pulled)} pulled records in the search indexes failed: {e}")
+            local_db.rollback()
+            search_service.invalidate_pulse_vectors()
+        finally:
+            local_db.close()
+
+    def _sync_record_down(self, local_db: Session, cloud_db: Session, model, cloud_record, id_map: SyncIdMap = None,
+                          commit: bool = True):
         """
         Sync a single record from Cloud to Local.
         Handles cases where local record exists with different UUID but same unique field.
+        A cloud soft delete removes the local copy, as local deletes do; the delete is
+        logged with the pulled origin, so it is not pushed back.
+        Returns the local record, or None when a pending local edit kept it unchanged
+        or a deleted row has no local copy.
+        With commit=False the changes are left in the caller's transaction.
         """
         local_record = local_db.query(model).filter(model.uuid == cloud_record.uuid).first()
-        
+
+        if cloud_record.is_deleted:
+            if not local_record or local_record.sync_status == 'pending':
+                # Never here, or edited here since: nothing to delete
+                return None
+            local_db.delete(local_record)
+            if commit:
+                local_db.commit()
+            return local_record
+
         if not local_record:
             # Try to find by unique fields before creating new record
             local_record = self._find_local_by_unique_fields(local_db, model, cloud_record)
@@ -175,7 +756,7 @@ class SyncService:
         if local_record.sync_status == 'pending':
             # Conflict! Skip for now or handle smart merge.
             # Assuming 'Offline First' means user entered data is sacred in conflict.
-            return 
+            return None
 
         # Update attributes
         for column in model.__table__.columns:
@@ -184,13 +765,17 @@ class SyncService:
             
             # Map Foreign Keys for Down Sync
             if column.name.endswith('_id') and getattr(cloud_record, column.name) is not None:
-                 self._resolve_foreign_key_down(local_db, cloud_db, model, local_record, cloud_record, column.name)
+                 self._resolve_foreign_key_down(local_db, cloud_db, model, local_record, cloud_record, column.name, id_map)
             else:
                  setattr(local_record, column.name, getattr(cloud_record, column.name))
         
         local_record.sync_status = 'synced'
         local_record.last_synced_at = datetime.now()
-        local_db.commit()
+        if commit:
+            local_db.commit()
+            if id_map is not None:
+                id_map.remember(model, local_record.uuid, local_id=local_record.id, cloud_id=cloud_record.id)
+        return local_record
 
     def _find_local_by_unique_fields(self, local_db: Session, model, cloud_record):
         """
@@ -219,19 +804,21 @@ class SyncService:
             ).first()
         return None
 
-    def _resolve_foreign_key_down(self, local_db, cloud_db, model, local_record, cloud_record, fk_column):
+    def _resolve_foreign_key_down(self, local_db, cloud_db, model, local_record, cloud_record, fk_column, id_map=None):
         """
         Map a Cloud FK ID to a Local FK ID using UUID matching.
         """
         cloud_fk_id = getattr(cloud_record, fk_column)
         
-        related_model = None
-        if fk_column == 'user_id': related_model = User
-        elif fk_column == 'patient_id': related_model = Patient
-        elif fk_column == 'practitioner_id': related_model = Practitioner
-        
+        related_model = self.FK_MODELS.get(fk_column)
         if not related_model: return
 
+        if id_map is not None:
+            local_fk_id = id_map.to_local(related_model, [cloud_fk_id]).get(cloud_fk_id)
+            if local_fk_id is not None:
+                setattr(local_record, fk_column, local_fk_id)
+            return
+
         # Cloud Related -> UUID
         cloud_related = cloud_db.query(related_model).filter(related_model.id == cloud_fk_id).first()
         if not cloud_related: return
@@ -246,7 +833,129 @@ class SyncService:
             # In simple loop, dependencies should come first. This implies strict order issues.
             pass
 
-    def _sync_record_up(self, local_db: Session, cloud_db: Session, model, record):
+    def _sync_chunk_up(self, local_db: Session, cloud_db: Session, model, records, results, id_map: SyncIdMap):
+        """
+        Push a chunk of pending rows with one multi-row INSERT ... ON CONFLICT (uuid) DO UPDATE,
+        then mark them synced locally in one UPDATE. Foreign keys are translated with one
+        UUID lookup per related table on each side. If the chunk fails as a whole, or a row
+        has a foreign key that cannot be resolved, those rows go through _sync_record_up one
+        by one so a bad row only fails itself.
+        """
+        singles = list(records)
+        dialect = _UPSERT_DIALECTS.get(cloud_db.get_bind().dialect.name)
+        if dialect is not None and self._cloud_upserts.get(model.__tablename__, True):
+            rows, singles = self._build_cloud_rows(model, records, id_map)
+            if rows:
+                try:
+                    written = self._upsert_cloud_rows(cloud_db, dialect, model, [row for _, row in rows])
+                    cloud_db.commit()
+                    synced_ids = [record.id for record, _ in rows]
+                    for record, row in rows:
+                        id_map.remember(model, row['uuid'], local_id=record.id, cloud_id=written.get(row['uuid']))
+                    marks = {model.sync_status: 'synced', model.last_synced_at: datetime.now()}
+                    if hasattr(model, 'updated_at'):
+                        # Keep the row version the cloud copy was written with (no onupdate)
+                        marks[model.updated_at] = model.updated_at
+                    local_db.query(model).filter(model.id.in_(synced_ids)).update(
+                        marks, synchronize_session=False,
+                    )
+                    # The bulk UPDATE bypasses the flush hooks that maintain the pending count
+                    pending_counter.note(
+                        local_db, model.__tablename__, -sum(record.sync_status == 'pending' for record, _ in rows)
+                    )
+                    local_db.commit()
+                    results["synced"] += len(synced_ids)
+                except Exception as e:
+                    if is_connection_error(e):
+                        raise
+                    cloud_db.rollback()
+                    local_db.rollback()
+                    if self._cloud_has_unique_uuid(cloud_db, model):
+                        logger.warning(f"Bulk push of {len(rows)} {model.__tablename__} failed, retrying one by one: {e}")
+                    else:
+                        self._cloud_upserts[model.__tablename__] = False
+                        logger.warning(f"Cloud table {model.__tablename__} has no unique index on uuid, which "
+                                       f"ON CONFLICT (uuid) needs; pushing its rows one by one. "
+                                       f"Run scripts/migrate_cloud_schema.py to fix.")
+                    singles += [record for record, _ in rows]
+
+        for record in sorted(singles, key=lambda r: r.id):
+            try:
+                self._sync_record_up(local_db, cloud_db, model, record, id_map)
+                results["synced"] += 1
+            except Exception as e:
+                if is_connection_error(e):
+                    # Lost the cloud: abort instead of timing out on every remaining record
+                    raise
+                logger.error(f"Failed to sync {model.__tablename__} {record.uuid}: {e}")
+                if cloud_db:
+                    cloud_db.rollback()
+                record.sync_status = 'failed'
+                local_db.commit()
+                results["failed"] += 1
+                results["details"].append(f"UP:{model.__tablename__}:{record.id} - {str(e)}")
+
+    @staticmethod
+    def _cloud_has_unique_uuid(cloud_db: Session, model) -> bool:
+        """Whether the cloud table can take ON CONFLICT (uuid); True when that cannot be told."""
+        table = model.__tablename__
+        try:
+            inspector = inspect(cloud_db.get_bind())
+            return any(c["column_names"] == ["uuid"] for c in inspector.get_unique_constraints(table)) or any(
+                i["unique"] and i["column_names"] == ["uuid"] for i in inspector.get_indexes(table)
+            )
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            return True
+
+    def _build_cloud_rows(self, model, records, id_map: SyncIdMap):
+        """
+        Column values to write to the cloud for each record, with foreign keys mapped to cloud ids.
+        Returns (rows, unresolved): records whose foreign key has no cloud counterpart are left
+        to the single-row path, which keeps the existing cloud value in that case.
+        """
+        fk_maps = {
+            column.name: id_map.to_cloud(self.FK_MODELS[column.name], [getattr(r, column.name) for r in records])
+            for column in model.__table__.columns if column.name in self.FK_MODELS
+        }
+        columns = [c.name for c in model.__table__.columns if c.name not in ('id', 'metadata')]
+        rows, unresolved = [], []
+        for record in records:
+            row = {}
+            for name in columns:
+                value = getattr(record, name)
+                if name in fk_maps and value is not None:
+                    value = fk_maps[name].get(value)
+                    if value is None:
+                        break
+                row[name] = value
+            else:
+                rows.append((record, row))
+                continue
+            unresolved.append(record)
+        return rows, unresolved
+
+    def _upsert_cloud_rows(self, cloud_db: Session, dialect, model, rows):
+        """
+        INSERT ... ON CONFLICT (uuid) DO UPDATE of every copied column, in the caller's transaction.
+        Returns {uuid: cloud id} of the written rows.
+        """
+        table = model.__table__
+        stmt = dialect.insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.uuid],
+            set_={name: stmt.excluded[name] for name in rows[0] if name != 'uuid'},
+        ).returning(table.c.uuid, table.c.id)
+        written = dict(cloud_db.execute(stmt).all())
+        if cloud_db.info.get("change_log"):
+            cloud_db.execute(ChangeLog.__table__.insert(), [
+                {"table_name": table.name, "row_uuid": row['uuid'], "op": "upsert", "origin": cloud_db.info["sync_origin"]}
+                for row in rows
+            ])
+        return written
+
+    def _sync_record_up(self, local_db: Session, cloud_db: Session, model, record, id_map: SyncIdMap = None):
         """
         Sync a single record from Local to Cloud.
         Uses UUID to find existing record in Cloud.
@@ -276,7 +985,7 @@ class SyncService:
             # Strategy: We assume dependencies (User, Practitioner) are synced FIRST.
             # We need to resolve the Cloud ID for the foreign key.
             if column.name.endswith('_id') and getattr(record, column.name) is not None:
-                self._resolve_foreign_key(local_db, cloud_db, model, record, cloud_record, column.name)
+                self._resolve_foreign_key(local_db, cloud_db, model, record, cloud_record, column.name, id_map)
             else:
                 setattr(cloud_record, column.name, getattr(record, column.name))
 
@@ -284,12 +993,15 @@ class SyncService:
         # cloud_record.sync_status = 'synced' # Cloud doesn't need to know it's synced relative to whom?
         cloud_db.commit()
 
+        if id_map is not None:
+            id_map.remember(model, record.uuid, local_id=record.id, cloud_id=cloud_record.id)
+
         # 4. Update Local Status
         record.sync_status = 'synced'
         record.last_synced_at = datetime.now()
         local_db.commit()
 
-    def _resolve_foreign_key(self, local_db, cloud_db, model, local_record, cloud_record, fk_column):
+    def _resolve_foreign_key(self, local_db, cloud_db, model, local_record, cloud_record, fk_column, id_map=None):
         """
         Map a Local FK ID to a Cloud FK ID using UUID matching.
         Example: record.patient_id (Local 10) -> Cloud Patient (UUID x) -> Cloud ID (25)
@@ -297,16 +1009,20 @@ class SyncService:
         local_fk_id = getattr(local_record, fk_column)
         
         # Determine the related model class based on fk_column name
-        # This acts as a simple mapper. 
         # CAUTION: This requires naming convention consistency.
-        related_model = None
-        if fk_column == 'user_id': related_model = User
-        elif fk_column == 'patient_id': related_model = Patient
-        elif fk_column == 'practitioner_id': related_model = Practitioner
+        related_model = self.FK_MODELS.get(fk_column)
         
         if not related_model:
             return # Cannot resolve, leave as is (might fail FK constraint if IDs don't match)
 
+        if id_map is not None:
+            cloud_fk_id = id_map.to_cloud(related_model, [local_fk_id]).get(local_fk_id)
+            if cloud_fk_id is not None:
+                setattr(cloud_record, fk_column, cloud_fk_id)
+            else:
+                logger.warning(f"Dependency missing in cloud: {fk_column} (local id {local_fk_id})")
+            return
+
         # 1. Find the UUID of the related record in Local DB
         local_related = local_db.query(related_model).filter(related_model.id == local_fk_id).first()
         if not local_related:
@@ -325,13 +1041,103 @@ class SyncService:
             # Or fail. For now, we rely on MODELS_ORDER to ensure parents are synced first.
             logger.warning(f"Dependency missing in cloud: {fk_column} (UUID {related_uuid})")
 
-    def get_pending_count(self):
-        """Count records waiting to be synced."""
+    def reconcile(self, progress: SyncProgress = None):
+        """
+        Find rows that differ between local and cloud without scanning both tables over
+        the network: compare bucket hashes top-down (see merkle.py), then transfer only
+        the rows of the buckets that differ. Only live rows are compared: a row live on one
+        side only is copied to the other unless the cloud holds a tombstone at least as new;
+        otherwise the newer updated_at wins.
+        """
         local_db = self.get_local_db()
-        count = 0
+        local_db.info["sync_origin"] = CLOUD_ORIGIN
+        cloud_db = None
+        results = {"pushed": 0, "pulled": 0, "skipped": 0, "failed": 0, "details": [], "tables": {}}
+        progress = progress or SyncProgress()
+
         try:
-            for model in self.MODELS_ORDER:
-                count += local_db.query(model).filter(model.sync_status == 'pending').count()
+            cloud_db = self.get_cloud_db()
+            self._prepare_cloud_session(local_db, cloud_db)
+            id_map = SyncIdMap(local_db, cloud_db)
+
+            with cloud_health.track(), self._count_queries(local_db, cloud_db, results):
+                progress.phase("reconcile")
+                for model in self.MODELS_ORDER:
+                    leaves, stats = merkle.diff_buckets(local_db, cloud_db, model)
+                    push, pull = self._diverged_rows(local_db, cloud_db, model, leaves)
+                    results["tables"][model.__tablename__] = {
+                        **stats, "buckets": len(leaves), "push": len(push), "pull": len(pull)
+                    }
+                    up = {"synced": 0, "failed": 0, "details": []}
+                    for i in range(0, len(push), SYNC_CHUNK_SIZE):
+                        chunk = local_db.query(model).filter(
+                            model.uuid.in_(push[i:i + SYNC_CHUNK_SIZE])
+                        ).order_by(model.id).all()
+                        self._sync_chunk_up(local_db, cloud_db, model, chunk, up, id_map)
+                        progress.advance(model.__tablename__, len(chunk))
+                    down = {"synced": 0, "skipped": 0, "failed": 0, "details": []}
+                    for i in range(0, len(pull), SYNC_CHUNK_SIZE):
+                        cloud_records = cloud_db.query(model).filter(
+                            model.uuid.in_(pull[i:i + SYNC_CHUNK_SIZE])
+                        ).order_by(model.id).all()
+                        self._apply_cloud_records(local_db, cloud_db, model, cloud_records, id_map, down)
+                        progress.advance(model.__tablename__, len(cloud_records))
+                    results["pushed"] += up["synced"]
+                    results["pulled"] += down["synced"]
+                    # Local copies with pending edits keep them; they win on the next push
+                    results["skipped"] += down["skipped"]
+                    results["failed"] += up["failed"] + down["failed"]
+                    results["details"] += up["details"] + down["details"]
+
+        except ConnectionError as e:
+            logger.error(f"Reconcile aborted: {e}")
+            return {"status": "error", "message": "Cloud connection unavailable"}
+        except Exception as e:
+            logger.error(f"Reconcile error: {e}")
+            return {"status": "error", "message": str(e)}
         finally:
             local_db.close()
-        return count
+            if cloud_db:
+                cloud_db.close()
+            self._refresh_pulled(local_db)
+            if results["pulled"]:
+                patient_suggest.invalidate()
+
+        return {"status": "completed", "data": results}
+
+    # Leaf buckets compared per pair of row queries
+    _RECONCILE_BUCKET_BATCH = 64
+
+    def _diverged_rows(self, local_db: Session, cloud_db: Session, model, leaves):
+        """(uuids to push, uuids to pull) among the live rows of the given buckets."""
+        push, pull, local_only = [], [], {}
+        for i in range(0, len(leaves), self._RECONCILE_BUCKET_BATCH):
+            batch = leaves[i:i + self._RECONCILE_BUCKET_BATCH]
+            local = dict(merkle.row_versions(local_db, model, batch))
+            cloud = dict(merkle.row_versions(cloud_db, model, batch))
+            for row_uuid in sorted(set(local) | set(cloud)):
+                if row_uuid not in cloud:
+                    local_only[row_uuid] = local[row_uuid]
+                elif row_uuid not in local:
+                    # Missing here: local deletes reach the cloud through the change log first
+                    pull.append(row_uuid)
+                elif local[row_uuid] != cloud[row_uuid]:
+                    newer_here = (local[row_uuid] or datetime.min) > (cloud[row_uuid] or datetime.min)
+                    (push if newer_here else pull).append(row_uuid)
+
+        # Rows only live here are new, or were deleted in the cloud: a tombstone at least
+        # as new as the local row wins, and pulling it deletes the local copy
+        uuids = list(local_only)
+        for i in range(0, len(uuids), SYNC_CHUNK_SIZE):
+            tombstones = dict(cloud_db.query(model.uuid, merkle.version_column(model)).filter(
+                model.uuid.in_(uuids[i:i + SYNC_CHUNK_SIZE]), model.is_deleted == True
+            ))
+            for row_uuid in uuids[i:i + SYNC_CHUNK_SIZE]:
+                deleted = row_uuid in tombstones and \
+                    (tombstones[row_uuid] or datetime.min) >= (local_only[row_uuid] or datetime.min)
+                (pull if deleted else push).append(row_uuid)
+        return push, pull
+
+    def get_pending_count(self):
+        """Count records waiting to be synced (maintained in memory, see pending_counter)."""
+        return pending_counter.count(self.get_local_db)
@@ -0,0 +1,364 @@
+"""Offline TF-IDF index over character n-grams of record text.
+
+Each record is a few text segments (pulse cells, complaint, diagnosis). Its
+vector is the L2-normalized TF-IDF of the 1..3-character n-grams within each
+segment (sublinear tf). Chinese needs no word segmentation for this, and typos
+or word-order changes still share most n-grams.
+
+The fitted corpus is stored column-wise (CSC): for every n-gram, the rows that
+contain it and their weights. A query only walks the postings of its own
+n-grams and accumulates cosine scores with one np.bincount, so the cost
+follows the query length rather than the corpus size.
+
+The vocabulary and IDF stay fixed after fit. New or edited records are
+vectorized with them into a small delta segment, which is scored by brute
+force and merged into the CSC arrays once it grows past COMPACT_THRESHOLD.
+N-grams unseen at fit time are ignored until the next refit.
+
+save() writes one .npy per array plus the vocabulary to a directory, and
+load() memory-maps the large arrays. scipy is not a dependency, so the sparse
+layout is plain numpy.
+"""
+import json
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.services.pulse_index import RecordMeta
+
+TEXT_INDEX_PATH = os.getenv("TEXT_INDEX_PATH", os.path.join("data", "models", "text_index"))
+
+NGRAM_RANGE = (1, 3)
+COMPACT_THRESHOLD = 2000
+_FORMAT_VERSION = 1
+_ARRAYS = ("indptr", "rows", "weights", "idf", "record_ids", "practitioner", "user", "patient", "visit_day")
+_MMAP_ARRAYS = ("indptr", "rows", "weights")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def ngrams(segments: Iterable[str], ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    """Character n-gram counts; n-grams never span punctuation, whitespace or segment boundaries."""
+    low, high = ngram_range
+    counts: Counter = Counter()
+    for segment in segments:
+        if not segment:
+            continue
+        for run in _WORD_RE.findall(segment.lower()):
+            for n in range(low, min(high, len(run)) + 1):
+                counts.update(run[i:i + n] for i in range(len(run) - n + 1))
+    return counts
+
+
+def _meta_row(meta: Optional[RecordMeta]) -> Tuple[int, int, int, int]:
+    meta = meta or RecordMeta()
+    return (
+        -1 if meta.practitioner_id is None else meta.practitioner_id,
+        -1 if meta.user_id is None else meta.user_id,
+        -1 if meta.patient_id is None else meta.patient_id,
+        meta.visit_date.toordinal() if meta.visit_date else 0,
+    )
+
+
+class TextIndex:
+    """Sparse TF-IDF cosine index keyed by record ID; thread-safe."""
+
+    def __init__(self, ngram_range: Tuple[int, int] = NGRAM_RANGE, compact_threshold: int = COMPACT_THRESHOLD):
+        self.ngram_range = tuple(ngram_range)
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop all contents; the next search refits or reloads."""
+        with self._lock:
+            self.fitted_at: Optional[datetime] = None
+            # Contents reflect all writes up to this time (fit or last save)
+            self.saved_at: Optional[datetime] = None
+            self._set_main([], np.zeros(0, dtype=np.float32), np.zeros(1, dtype=np.int64),
+                           np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32),
+                           np.zeros(0, dtype=np.int64), np.zeros((0, 4), dtype=np.int64))
+
+    def _set_main(self, terms: List[str], idf, indptr, rows, weights, record_ids, meta):
+        self._terms = terms
+        self._vocab: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self._idf = idf
+        self._indptr = indptr
+        self._rows = rows
+        self._weights = weights
+        self._record_ids = record_ids
+        self._meta = meta  # practitioner, user, patient, visit day per main row
+        self._live = np.ones(len(record_ids), dtype=bool)
+        self._row_of: Dict[int, int] = {int(r): i for i, r in enumerate(record_ids)}
+        # record_id -> (term ids, weights, meta row) for records added since the last compaction
+        self._delta: Dict[int, Tuple[np.ndarray, np.ndarray, Tuple[int, int, int, int]]] = {}
+        self._delta_cache = None
+
+    @property
+    def is_built(self) -> bool:
+        return self.fitted_at is not None
+
+    def __len__(self) -> int:
+        return int(self._live.sum()) + len(self._delta)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._delta or (record_id in self._row_of and self._live[self._row_of[record_id]])
+
+    def record_ids(self) -> set:
+        """IDs of all records currently in the index."""
+        with self._lock:
+            return set(np.asarray(self._record_ids)[self._live].tolist()) | set(self._delta)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self._terms)
+
+    def _vectorize(self, segments: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalized (term ids, weights) over the fitted vocabulary; unknown n-grams are dropped."""
+        counts = ngrams(segments, self.ngram_range)
+        pairs = [(self._vocab[t], c) for t, c in counts.items() if t in self._vocab]
+        if not pairs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        term_ids = np.fromiter((t for t, _ in pairs), dtype=np.int32, count=len(pairs))
+        tf = np.fromiter((c for _, c in pairs), dtype=np.float32, count=len(pairs))
+        weights = (1.0 + np.log(tf)) * self._idf[term_ids]
+        weights /= np.linalg.norm(weights)
+        order = np.argsort(term_ids)
+        return term_ids[order], weights[order].astype(np.float32)
+
+    def fit(self, docs: Iterable[Tuple[int, Sequence[str], Optional[RecordMeta]]], min_df: int = 1):
+        """Replace the index with (record_id, segments, meta) docs, learning vocabulary and IDF from them."""
+        record_ids, metas, doc_counts = [], [], []
+        df: Counter = Counter()
+        for record_id, segments, meta in docs:
+            counts = ngrams(segments, self.ngram_range)
+            record_ids.append(record_id)
+            metas.append(_meta_row(meta))
+            doc_counts.append(counts)
+            df.update(counts.keys())
+
+        terms = sorted(t for t, n in df.items() if n >= min_df)
+        vocab = {t: i for i, t in enumerate(terms)}
+        n_docs = len(record_ids)
+        df_array = np.array([df[t] for t in terms], dtype=np.float64)
+        idf = (np.log((1.0 + n_docs) / (1.0 + df_array)) + 1.0).astype(np.float32)
+
+        # COO triplets, normalized per row
+        coo_rows, coo_terms, coo_tf = [], [], []
+        for row, counts in enumerate(doc_counts):
+            for term, count in counts.items():
+                column = vocab.get(term)
+                if column is not None:
+                    coo_rows.append(row)
+                    coo_terms.append(column)
+                    coo_tf.append(count)
+        coo_rows = np.array(coo_rows, dtype=np.int32)
+        coo_terms = np.array(coo_terms, dtype=np.int32)
+        weights = (1.0 + np.log(np.array(coo_tf, dtype=np.float32))) * idf[coo_terms]
+        norms = np.sqrt(np.bincount(coo_rows, weights=weights.astype(np.float64) ** 2, minlength=n_docs))
+        weights = (weights / np.where(norms > 0, norms, 1.0)[coo_rows]).astype(np.float32)
+
+        with self._lock:
+            self._set_main(terms, idf, *self._to_csc(coo_terms, coo_rows, weights, len(terms)),
+                           np.array(record_ids, dtype=np.int64),
+                           np.array(metas, dtype=np.int64).reshape(-1, 4))
+            self.fitted_at = self.saved_at = datetime.now()
+
+    @staticmethod
+    def _to_csc(terms: np.ndarray, rows: np.ndarray, weights: np.ndarray, n_terms: int):
+        order = np.lexsort((rows, terms))
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=indptr[1:])
+        return indptr, rows[order].astype(np.int32), weights[order]
+
+    def upsert(self, record_id: int, segments: Sequence[str], meta: Optional[RecordMeta] = None):
+        """Insert or replace a record with the fitted vocabulary. No-op until the index is fitted."""
+        with self._lock:
+            if not self.is_built:
+                return
+            self._drop_main(record_id)
+            term_ids, weights = self._vectorize(segments)
+            self._delta[record_id] = (term_ids, weights, _meta_row(meta))
+            self._delta_cache = None
+            if len(self._delta) >= self.compact_threshold:
+                self.compact()
+
+    def remove(self, record_id: int):
+        with self._lock:
+            self._drop_main(record_id)
+            if self._delta.pop(record_id, None) is not None:
+                self._delta_cache = None
+
+    def _drop_main(self, record_id: int):
+        row = self._row_of.get(record_id)
+        if row is not None:
+            self._live[row] = False
+
+    def compact(self):
+        """Merge the delta segment into the CSC arrays and drop removed rows."""
+        with self._lock:
+            if not self._delta and self._live.all():
+                return
+            n_terms = len(self._terms)
+            terms = np.repeat(np.arange(n_terms, dtype=np.int32), np.diff(self._indptr))
+            keep_rows = np.flatnonzero(self._live)
+            new_row = np.full(len(self._live), -1, dtype=np.int32)
+            new_row[keep_rows] = np.arange(len(keep_rows), dtype=np.int32)
+            rows = new_row[self._rows]
+            kept = rows >= 0
+            parts_terms, parts_rows, parts_weights = [terms[kept]], [rows[kept]], [np.asarray(self._weights)[kept]]
+            record_ids = [np.asarray(self._record_ids)[keep_rows]]
+            metas = [np.asarray(self._meta)[keep_rows]]
+            next_row = len(keep_rows)
+            for record_id, (term_ids, weights, meta) in self._delta.items():
+                parts_terms.append(term_ids)
+                parts_rows.append(np.full(len(term_ids), next_row, dtype=np.int32))
+                parts_weights.append(weights)
+                record_ids.append(np.array([record_id], dtype=np.int64))
+                metas.append(np.array([meta], dtype=np.int64))
+                next_row += 1
+            csc = self._to_csc(np.concatenate(parts_terms), np.concatenate(parts_rows),
+                               np.concatenate(parts_weights).astype(np.float32), n_terms)
+            self._set_main(self._terms, self._idf, *csc, np.concatenate(record_ids), np.concatenate(metas))
+
+    def _filter_mask(self, meta: np.ndarray, practitioner_id=None, user_id=None, patient_id=None,
+                     start_date: Optional[date] = None, end_date: Optional[date] = None) -> np.ndarray:
+        mask = np.ones(len(meta), dtype=bool)
+        for column, value in ((0, practitioner_id), (1, user_id), (2, patient_id)):
+            if value is not None:
+                mask &= meta[:, column] == value
+        if start_date is not None:
+            mask &= meta[:, 3] >= start_date.toordinal()
+        if end_date is not None:
+            mask &= meta[:, 3] <= end_date.toordinal()
+        return mask
+
+    def query(self, text: str, k: int = 5, offset: int = 0, min_similarity: float = 0.0,
+              **filters) -> List[Tuple[int, float]]:
+        """
+        Return up to k (record_id, cosine similarity) pairs, best first, skipping the first offset.
+        Supported filters: practitioner_id, user_id, patient_id, start_date, end_date.
+        """
+        with self._lock:
+            if k <= 0 or not self.is_built:
+                return []
+            term_ids, q_weights = self._vectorize([text])
+            if not len(term_ids):
+                return []
+
+            n_main = len(self._record_ids)
+            starts, ends = self._indptr[term_ids], self._indptr[term_ids + 1]
+            lengths = ends - starts
+            scores = np.zeros(n_main, dtype=np.float32)
+            if n_main and lengths.sum():
+                # Gather all postings of the query terms with one fancy index
+                postings = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                contributions = np.asarray(self._weights[postings]) * np.repeat(q_weights, lengths)
+                scores = np.bincount(np.asarray(self._rows[postings]), weights=contributions,
+                                     minlength=n_main).astype(np.float32)
+            mask = self._live & (scores > 0)
+            if any(v is not None for v in filters.values()):
+                mask &= self._filter_mask(np.asarray(self._meta), **filters)
+            rows = np.flatnonzero(mask)
+            ids, scores = np.asarray(self._record_ids)[rows], scores[rows]
+
+            if self._delta:
+                d_ids, d_meta, d_doc, d_terms, d_weights = self._delta_arrays()
+                q_dense = np.zeros(len(self._terms), dtype=np.float32)
+                q_dense[term_ids] = q_weights
+                d_scores = np.bincount(d_doc, weights=q_dense[d_terms] * d_weights,
+                                       minlength=len(d_ids)).astype(np.float32)
+                d_mask = (d_scores > 0) & self._filter_mask(d_meta, **filters)
+                ids = np.concatenate([ids, d_ids[d_mask]])
+                scores = np.concatenate([scores, d_scores[d_mask]])
+
+        # Rounded so that equal documents tie regardless of the segment that scored them
+        scores = np.round(np.minimum(scores.astype(np.float64), 1.0), 6)
+        keep = scores >= min_similarity
+        ids, scores = ids[keep], scores[keep]
+        need = offset + k
+        if len(scores) > need:
+            # Keep every candidate tied with the need-th best, so ties resolve by record ID below
+            kth = np.partition(scores, len(scores) - need)[len(scores) - need]
+            keep = scores >= kth
+            ids, scores = ids[keep], scores[keep]
+        order = np.lexsort((ids, -scores))[offset:need]
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+
+    def _delta_arrays(self):
+        """Delta segment flattened for vectorized scoring; cached until the delta changes."""
+        if self._delta_cache is None:
+            d_ids = np.fromiter(self._delta, dtype=np.int64, count=len(self._delta))
+            entries = list(self._delta.values())
+            lengths = [len(term_ids) for term_ids, _, _ in entries]
+            self._delta_cache = (
+                d_ids,
+                np.array([meta for _, _, meta in entries], dtype=np.int64).reshape(-1, 4),
+                np.repeat(np.arange(len(entries)), lengths),
+                np.concatenate([term_ids for term_ids, _, _ in entries]),
+                np.concatenate([weights for _, weights, _ in entries]),
+            )
+        return self._delta_cache
+
+    def save(self, path: str):
+        """Compact and write the index to directory path (replaced atomically)."""
+        with self._lock:
+            self.compact()
+            saved_at = datetime.now()
+            tmp = f"{path}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            arrays = {
+                "indptr": self._indptr, "rows": self._rows, "weights": self._weights, "idf": self._idf,
+                "record_ids": self._record_ids, "practitioner": self._meta[:, 0], "user": self._meta[:, 1],
+                "patient": self._meta[:, 2], "visit_day": self._meta[:, 3],
+            }
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+            with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+                json.dump(self._terms, f, ensure_ascii=False)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": _FORMAT_VERSION,
+                    "ngram_range": list(self.ngram_range),
+                    "fitted_at": self.fitted_at.isoformat() if self.fitted_at else None,
+                    "saved_at": saved_at.isoformat(),
+                }, f)
+            old = f"{path}.old"
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(path):
+                os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+            self.saved_at = saved_at
+
+    def load(self, path: str, mmap: bool = True) -> "TextIndex":
+        """Replace the contents with an index written by save(); postings are memory-mapped unless mmap=False."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported text index format: {meta.get('version')}")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap and name in _MMAP_ARRAYS else None)
+            for name in _ARRAYS
+        }
+        with self._lock:
+            self.ngram_range = tuple(meta["ngram_range"])
+            self._set_main(
+                terms, arrays["idf"], arrays["indptr"], arrays["rows"], arrays["weights"], arrays["record_ids"],
+                np.stack([arrays[c] for c in ("practitioner", "user", "patient", "visit_day")], axis=1).reshape(-1, 4),
+            )
+            self.fitted_at = datetime.fromisoformat(meta["fitted_at"])
+            self.saved_at = datetime.fromisoformat(meta["saved_at"])
+        return self
+
+
+text_index = TextIndex()
@@ -0,0 +1,40 @@
+"""
+关键词匹配工具模块
+预编译的多模式匹配器（最长优先正则交替），用于脉象描述、处方和 OCR 文本的关键词查找
+"""
+
+import re
+from typing import Iterable, List
+
+
+class KeywordMatcher:
+    """
+    Multi-pattern keyword matcher, compiled once and reused.
+
+    - scan(): greedy leftmost-longest, non-overlapping matches (tokenization)
+    - contains_any(): whether any keyword occurs, stops at first hit
+
+    Both run on a regex alternation ordered longest-first, which under leftmost-first
+    alternation semantics yields exactly the leftmost-longest match; CPython executes
+    it in C, well ahead of a Python-level trie or Aho-Corasick walk.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = tuple(dict.fromkeys(k for k in keywords if k))
+        longest_first = sorted(self.keywords, key=len, reverse=True)
+        # An empty alternation would match everywhere; (?!) never matches
+        self._pattern = re.compile("|".join(map(re.escape, longest_first)) or "(?!)")
+
+    def scan(self, text: str) -> List[str]:
+        """
+        Split text into keywords, longest match first at each position.
+        Characters that start no keyword are skipped.
+        """
+        return self._pattern.findall(text)
+
+    def contains_any(self, text: str) -> bool:
+        """Whether any keyword occurs in text."""
+        return self._pattern.search(text) is not None
+
+    def __len__(self) -> int:
+        return len(self.keywords)
@@ -0,0 +1,35 @@
+"""
+分页工具模块
+基于 (时间, 唯一键) 的 keyset 游标分页：游标编码/解码与 SQL 比较条件
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+
+from sqlalchemy import and_, or_
+
+SortKey = Tuple[datetime, Any]
+
+
+def encode_cursor(sort_key: SortKey) -> str:
+    """Opaque page cursor for a (datetime, tiebreaker) sort key."""
+    payload = json.dumps([sort_key[0].isoformat(), sort_key[1]])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        when, tiebreak = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(when), tiebreak
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_before(sort_expr, tiebreak_expr, after: SortKey):
+    """SQL condition for rows strictly after `after` in (sort, tiebreak) descending order."""
+    when, tiebreak = after
+    return or_(sort_expr < when, and_(sort_expr == when, tiebreak_expr < tiebreak))
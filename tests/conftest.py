@@ -1,17 +1,24 @@
 import os
 import sys
+import tempfile
 
 # Set test environment variables BEFORE importing app code
 os.environ["SECRET_KEY"] = "test_secret_key"
 os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+os.environ["PATIENT_SUGGEST_WARM"] = "0"
+os.environ["TEXT_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(prefix="tcm-test-"), "text_index")
 
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
+from src.database import change_log
 from src.database.models import Base, User
 from src.database.connection import get_db
-from src.services import auth_service
+from src.services import auth_service, search_service
+from src.services.cloud_health import cloud_health
+from src.services.patient_suggest import patient_suggest
+from src.services.pending_counter import pending_counter
 from web.app import app
 
 from sqlalchemy.pool import StaticPool
@@ -37,6 +44,11 @@ def db_session():
     finally:
         session.close()
         Base.metadata.drop_all(bind=engine)
+        search_service.invalidate_pulse_vectors()
+        cloud_health.reset()
+        patient_suggest.invalidate()
+        pending_counter.invalidate()
+        change_log._node_ids.clear()
 
 @pytest.fixture(scope="function")
 def client(db_session):
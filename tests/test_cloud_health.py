@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from src.services import cloud_health as cloud_health_module
+from src.services.cloud_health import CircuitBreaker, CLOSED, OPEN, HALF_OPEN, watch_engine
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cloud_health_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _down():
+    return OperationalError("SELECT 1", {}, Exception("could not connect to server"))
+
+
+def test_opens_after_threshold_and_probes_with_exponential_backoff(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, base_backoff=10, max_backoff=25)
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure(_down())
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+    clock[0] += 10
+    assert breaker.allow_request()          # the single half-open probe
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()      # others keep skipping while it runs
+    breaker.record_failure(_down())
+    assert breaker.snapshot()["backoff_seconds"] == 20
+
+    clock[0] += 19
+    assert not breaker.allow_request()
+    clock[0] += 1
+    assert breaker.allow_request()
+    breaker.record_failure(_down())
+    assert breaker.snapshot()["backoff_seconds"] == 25  # capped
+
+    clock[0] += 25
+    assert breaker.allow_request()
+    breaker.record_success()
+    snapshot = breaker.snapshot()
+    assert snapshot["state"] == CLOSED and snapshot["backoff_seconds"] == 0.0
+    assert snapshot["opened"] == 3 and snapshot["probes"] == 3 and snapshot["rejected"] == 3
+
+
+def test_track_counts_only_connection_errors_of_the_cloud_engine(clock, tmp_path):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(IntegrityError):
+        with breaker.track():
+            raise IntegrityError("INSERT", {}, Exception("duplicate key"))
+    assert breaker.state == CLOSED
+
+    # Statements that reach the database and fail there (psycopg2 raises OperationalError
+    # for deadlocks and timeouts, SQLite for "database is locked") are no connection failures
+    cloud = create_engine("sqlite://")
+    watch_engine(cloud)
+    with pytest.raises(OperationalError):
+        with breaker.track(), cloud.connect() as conn:
+            conn.execute(text("SELECT * FROM missing_table"))
+    assert breaker.state == CLOSED
+
+    # Neither is failing to open a database that is not the cloud
+    local = create_engine(f"sqlite:///{tmp_path}/missing/local.db")
+    with pytest.raises(OperationalError):
+        with breaker.track(), local.connect():
+            pass
+    assert breaker.state == CLOSED
+
+    unreachable = create_engine(f"sqlite:///{tmp_path}/missing/cloud.db")
+    watch_engine(unreachable)
+    with pytest.raises(OperationalError):
+        with breaker.track(), unreachable.connect():
+            pass
+    assert breaker.state == OPEN
+    assert "unable to open database file" in breaker.snapshot()["last_error"]
+
+
+def test_open_circuit_skips_cloud_in_hybrid_search(db_session, monkeypatch):
+    from src.database.models import Patient
+    from src.services import search_service
+    from src.services.cloud_health import cloud_health
+
+    db_session.add(Patient(name="断路病人", age=30, gender="男"))
+    db_session.commit()
+    calls = []
+    monkeypatch.setattr(search_service, "SessionCloud", object())
+    monkeypatch.setattr(search_service, "_get_cloud_session", lambda: calls.append(1))
+
+    for _ in range(cloud_health.failure_threshold):
+        cloud_health.record_failure(_down())
+    results, partial = search_service.search_patients(db_session, "断路", return_partial=True)
+    assert [r["name"] for r in results] == ["断路病人"]
+    assert partial is True
+    assert calls == []
+
+
+def test_health_endpoint_reports_cloud_circuit(client):
+    from src.services.cloud_health import cloud_health
+    cloud_health.record_failure(_down())
+    body = client.get("/api/health").json()
+    assert body["database"] == "online"
+    assert body["cloud"]["state"] == CLOSED
+    assert body["cloud"]["consecutive_failures"] == 1
@@ -0,0 +1,34 @@
+import pytest
+from src.utils.keyword_matcher import KeywordMatcher
+from src.services.search_service import PULSE_KEYWORD_VECTORS, _extract_keywords
+
+
+def _legacy_extract(text, keywords):
+    """Reference implementation: per-position startswith over length-sorted keywords."""
+    sorted_kw = sorted(keywords, key=len, reverse=True)
+    found, remaining = [], text
+    while remaining:
+        for kw in sorted_kw:
+            if remaining.startswith(kw):
+                found.append(kw)
+                remaining = remaining[len(kw):]
+                break
+        else:
+            remaining = remaining[1:]
+    return found
+
+
+@pytest.mark.parametrize("text", [
+    "浮滑", "沉细弱", "有力应指", "稍空无力", "弦紧有力", "脉沉细弱无力",
+    "左关弦滑稍数，右尺沉细无力不空", "", "无", "空空稍空不空",
+])
+def test_scan_matches_legacy_longest_first(text):
+    assert _extract_keywords(text) == _legacy_extract(text, PULSE_KEYWORD_VECTORS)
+
+
+def test_contains_any():
+    matcher = KeywordMatcher(["无根", "空"])
+    assert matcher.contains_any("中空")
+    assert matcher.contains_any("浮大无根")
+    assert not matcher.contains_any("弦滑")
+    assert not KeywordMatcher([]).contains_any("弦滑")
@@ -0,0 +1,112 @@
+import time
+from datetime import datetime
+from src.database.models import Patient, User
+from src.services import record_service
+from src.services.patient_suggest import PatientSuggestIndex, PatientEntry, _ScopeIndex, search_keys, patient_suggest
+
+
+def test_search_keys_cover_name_pinyin_initials_and_phone():
+    keys = search_keys("张伟", "13812345678")
+    assert {"张伟", "zhangwei", "zw", "13812345678", "5678"} <= set(keys)
+
+
+def test_scope_index_ranks_by_recency_and_updates_incrementally():
+    index = _ScopeIndex([
+        PatientEntry(1, "张伟", "男", 40, None, datetime(2024, 1, 1)),
+        PatientEntry(2, "张薇", "女", 30, None, datetime(2024, 5, 1)),
+        PatientEntry(3, "李娜", "女", 30, "13900001234", datetime(2024, 3, 1)),
+    ])
+    assert [e.id for e in index.suggest("zh", 10)] == [2, 1]
+    assert [e.id for e in index.suggest("zw", 1)] == [2]
+    assert [e.id for e in index.suggest("1234", 10)] == [3]
+
+    index.upsert(PatientEntry(1, "张伟", "男", 40, None, datetime(2024, 6, 1)))
+    assert [e.id for e in index.suggest("zh", 10)] == [1, 2]
+    index.remove(2)
+    assert [e.id for e in index.suggest("zhangw", 10)] == [1]
+
+
+def test_hot_prefix_cache_is_refreshed_by_writes():
+    entries = [PatientEntry(i, f"张{chr(0x4e00 + i)}", None, None, None, datetime(2024, 1, 1)) for i in range(1, 600)]
+    index = _ScopeIndex(entries)
+    assert len(index.suggest("z", 5)) == 5
+    index.upsert(PatientEntry(9999, "赵新", None, None, None, datetime(2025, 1, 1)))
+    assert index.suggest("z", 1)[0].id == 9999
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.suggest("zh", 10)
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+
+def test_suggest_respects_scope_and_tracks_saves(db_session):
+    doctor = User(username="doc", hashed_password="x", account_type="practitioner")
+    db_session.add(doctor)
+    db_session.commit()
+    other = Patient(name="张三", age=50, gender="男")
+    db_session.add(other)
+    db_session.commit()
+
+    assert patient_suggest.suggest(db_session, "zhang", user_id=doctor.id) == []
+    assert [r["name"] for r in patient_suggest.suggest(db_session, "zhang")] == ["张三"]
+    assert len(patient_suggest) == 2
+
+    # New patients saved through the record service join the loaded scopes without a reload
+    result = record_service.save_medical_record(db_session, {
+        "patient_info": {"name": "张丽", "phone": "13711112222"},
+        "medical_record": {"complaint": "头痛"},
+        "mode": "personal",
+    }, user_id=doctor.id)
+    assert [r["id"] for r in patient_suggest.suggest(db_session, "2222", user_id=doctor.id)] == [result["patient_id"]]
+    assert [r["name"] for r in patient_suggest.suggest(db_session, "zhang")] == ["张丽", "张三"]
+
+    # Bounded: the least recently used scope is evicted
+    small = PatientSuggestIndex(max_scopes=1)
+    small.suggest(db_session, "z")
+    small.suggest(db_session, "z", user_id=doctor.id)
+    assert len(small) == 1
+
+
+def test_scope_loads_without_blocking_saves_or_other_scopes(db_session, monkeypatch):
+    import threading
+    from src.services import patient_suggest as module
+    index = PatientSuggestIndex()
+    index.suggest(db_session, "z", user_id=7)
+    loading, release = threading.Event(), threading.Event()
+    load_scope = module._load_scope
+
+    def slow_load(db, scope):
+        loaded = load_scope(db, scope)
+        loading.set()
+        assert release.wait(5)
+        return loaded
+
+    monkeypatch.setattr(module, "_load_scope", slow_load)
+    results = []
+    loader = threading.Thread(target=lambda: results.append(index.suggest(db_session, "wang")))
+    loader.start()
+    assert loading.wait(5)
+
+    # While the admin scope loads: a save and another scope's suggestions go through
+    start = time.perf_counter()
+    index.note_patient(Patient(id=1, name="王五", creator_id=None), user_id=7)
+    assert [r["name"] for r in index.suggest(db_session, "wang", user_id=7)] == ["王五"]
+    assert time.perf_counter() - start < 1
+
+    release.set()
+    loader.join(5)
+    # The scope was read before the save (which never reached the DB); it is replayed onto it
+    assert [r["name"] for r in results[0]] == ["王五"]
+    assert [r["name"] for r in index.suggest(db_session, "wang")] == ["王五"]
+
+
+def test_suggest_endpoint(client, db_session):
+    from src.services import auth_service
+    from web.app import app
+    admin = User(username="admin", hashed_password="x", role="admin", is_active=True)
+    db_session.add_all([admin, Patient(name="王芳", phone="13600007777", age=35, gender="女")])
+    db_session.commit()
+    app.dependency_overrides[auth_service.get_current_active_user] = lambda: admin
+    response = client.get("/api/patients/suggest", params={"q": "wangf"})
+    assert response.status_code == 200
+    assert [r["name"] for r in response.json()] == ["王芳"]
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from datetime import date, timedelta
+from src.services.pulse_index import PulseVectorIndex, RecordMeta, MAX_DISTANCE
+
+
+def _brute_force(entries, query, k, offset=0, min_similarity=None, predicate=lambda meta: True):
+    scored = []
+    for record_id, kw, llm, meta in entries:
+        vec = np.asarray(kw, dtype=np.float32)
+        if not vec.any() or not predicate(meta):
+            continue
+        sim = 1.0 - np.linalg.norm(vec - np.asarray(query, dtype=np.float32)) / MAX_DISTANCE
+        if min_similarity is None or sim >= min_similarity:
+            scored.append((record_id, sim))
+    scored.sort(key=lambda x: -x[1])
+    return scored[offset:offset + k]
+
+
+@pytest.fixture
+def random_entries():
+    rng = np.random.default_rng(7)
+    base = date(2020, 1, 1)
+    entries = []
+    for record_id in range(1, 3001):
+        vec = rng.uniform(-1, 1, 4)
+        vec /= np.abs(vec).max()  # keyword vectors are max-abs normalized
+        meta = RecordMeta(int(rng.integers(1, 4)), int(rng.integers(1, 6)), int(rng.integers(1, 200)),
+                          base + timedelta(days=int(rng.integers(0, 2000))))
+        entries.append((record_id, vec.tolist(), None, meta))
+    return entries
+
+
+def test_knn_matches_brute_force(random_entries):
+    index = PulseVectorIndex()
+    index.build(random_entries)
+    rng = np.random.default_rng(11)
+    for _ in range(20):
+        query = rng.uniform(-1, 1, 4).tolist()
+        got = index.query(query, k=10, offset=5)
+        expected = _brute_force(random_entries, query, k=10, offset=5)
+        assert [sim for _, sim, _ in got] == pytest.approx([sim for _, sim in expected], abs=1e-5)
+
+
+def test_knn_filters_and_threshold(random_entries):
+    index = PulseVectorIndex()
+    index.build(random_entries)
+    start, end = date(2021, 1, 1), date(2022, 6, 30)
+    query = [0.5, -0.2, 1.0, 0.1]
+    got = index.query(query, k=20, min_similarity=0.8, practitioner_id=2, start_date=start, end_date=end)
+    expected = _brute_force(
+        random_entries, query, k=20, min_similarity=0.8,
+        predicate=lambda m: m.practitioner_id == 2 and start <= m.visit_date <= end,
+    )
+    assert [record_id for record_id, _, _ in got] == [record_id for record_id, _ in expected]
+
+
+def test_remove_keeps_buckets_consistent(random_entries):
+    index = PulseVectorIndex()
+    index.build(random_entries)
+    for record_id in range(1, 3001, 2):
+        index.remove(record_id)
+    remaining = [e for e in random_entries if e[0] % 2 == 0]
+    query = [0.0, 0.3, -0.4, 0.9]
+    got = index.query(query, k=15)
+    assert [r for r, _, _ in got] == [r for r, _ in _brute_force(remaining, query, k=15)]
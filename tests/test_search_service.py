@@ -63,3 +63,555 @@ def test_source_identification_bug_fix(db_session):
     
     assert len(results) == 1
     assert results[0]["source"] == "cloud"
+
+def _add_teacher_record(db_session, patient, practitioner, grid, **data_extra):
+    record = MedicalRecord(
+        patient_id=patient.id,
+        practitioner_id=practitioner.id,
+        visit_date=date.today(),
+        data={"pulse_grid": grid, **data_extra},
+    )
+    db_session.add(record)
+    db_session.commit()
+    return record
+
+def test_search_similar_records_uses_full_corpus(db_session):
+    from src.database.models import Practitioner
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人B", age=50, gender="女")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    xu_han = {"left-chi-chen": "沉细无力", "overall_description": "沉细弱"}
+    target = _add_teacher_record(db_session, p, teacher, xu_han)
+    # More than the old 200-record recency window of unrelated pulses
+    for _ in range(210):
+        _add_teacher_record(db_session, p, teacher, {"left-cun-fu": "浮数洪大有力"})
+
+    results = search_service.search_similar_records(db_session, xu_han)
+    assert results
+    assert results[0]["record_id"] == target.id
+    assert results[0]["similarity"] == 1.0
+
+def test_pulse_index_tracks_saves_and_deletes(db_session):
+    from src.database.models import Practitioner
+    from src.services.pulse_index import pulse_index
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人C", age=50, gender="男")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    grid = {"left-guan-zhong": "弦滑"}
+    first = _add_teacher_record(db_session, p, teacher, grid)
+    search_service.ensure_pulse_index(db_session)
+    assert len(pulse_index) == 1
+
+    second = _add_teacher_record(db_session, p, teacher, grid)
+    search_service.index_medical_record(second)
+    ids = [r["record_id"] for r in search_service.search_similar_records(db_session, grid)]
+    assert set(ids) == {first.id, second.id}
+
+    search_service.unindex_medical_record(first.id)
+    ids = [r["record_id"] for r in search_service.search_similar_records(db_session, grid)]
+    assert ids == [second.id]
+
+def test_search_similar_records_sql_prefilter(db_session, monkeypatch):
+    from src.database.models import Practitioner, PulseVector
+    monkeypatch.setattr(search_service, "PULSE_INDEX_ENABLED", False)
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人D", age=40, gender="女")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    grid = {"left-chi-chen": "沉迟无力"}
+    near = _add_teacher_record(db_session, p, teacher, grid)
+    _add_teacher_record(db_session, p, teacher, {"left-cun-fu": "浮数洪大"})
+
+    results = search_service.search_similar_records(db_session, grid)
+    assert [r["record_id"] for r in results] == [near.id]
+
+    # Rows written under an older keyword table are detected and recomputed
+    row = db_session.get(PulseVector, near.id)
+    row.kw_revision = "outdated"
+    row.kw_xu_shi = 1.0
+    db_session.commit()
+    assert search_service.refresh_pulse_vector_table(db_session) == 1
+    assert db_session.get(PulseVector, near.id).kw_revision == search_service.keyword_vector_revision()
+
+def test_vector_caches_hit_and_invalidate_on_table_change(monkeypatch):
+    grid = {"left-cun-chen": "沉细无力", "right-guan-zhong": "弦滑", "overall_description": "稍空"}
+    first = search_service._grid_to_vector(grid)
+    before = search_service.pulse_vector_cache_info()["grid"]["hits"]
+    assert search_service._grid_to_vector(dict(grid)) == first
+    assert search_service.pulse_vector_cache_info()["grid"]["hits"] == before + 1
+
+    # Editing the keyword table must not serve stale vectors
+    table = dict(search_service.PULSE_KEYWORD_VECTORS)
+    table["弦滑"] = [1.0, 1.0, 1.0, 1.0]
+    monkeypatch.setattr(search_service, "PULSE_KEYWORD_VECTORS", table)
+    assert search_service._extract_keywords("弦滑") == ["弦滑"]
+    assert search_service._grid_to_vector(grid) != first
+
+    monkeypatch.setitem(search_service._DEPTH_WEIGHTS, "chen", 3.0)
+    assert search_service._text_to_vector("弦滑") == [1.0, 1.0, 1.0, 1.0]
+
+def test_keywords_past_the_bitmask_width_only_skip_position_bits(monkeypatch):
+    table = dict(search_service.PULSE_KEYWORD_VECTORS)
+    extra = [f"第{i:02d}脉" for i in range(40 - len(table))]
+    table.update({kw: [1.0, 0.0, 0.0, 0.0] for kw in extra})
+    monkeypatch.setattr(search_service, "PULSE_KEYWORD_VECTORS", table)
+
+    assert search_service._text_to_vector(extra[-1]) == [1.0, 0.0, 0.0, 0.0]
+    bits = search_service._grid_to_position_bits({"overall_description": f"浮{extra[-1]}"})
+    assert bits[-1] == 1  # 浮 is the first keyword; the 40th has no bit
+
+def test_llm_query_vector_is_cached_across_searches(db_session):
+    from unittest.mock import MagicMock
+    llm = MagicMock()
+    llm.model = "test-model"
+    llm._call_llm.return_value = '{"xu_shi": -0.5, "yin_yang": -0.4, "biao_li": 0.6, "han_re": -0.3}'
+
+    grid = {"left-chi-chen": "沉细无力"}
+    first = search_service._llm_query_vector(db_session, grid, llm)
+    # Whitespace-only differences normalize to the same cache key
+    second = search_service._llm_query_vector(db_session, {"left-chi-chen": " 沉细无力 "}, llm)
+    assert first == second == [-0.5, -0.4, 0.6, -0.3]
+    assert llm._call_llm.call_count == 1
+
+    llm.model = "other-model"
+    search_service._llm_query_vector(db_session, grid, llm)
+    assert llm._call_llm.call_count == 2
+
+def test_single_flight_shares_concurrent_calls():
+    import threading, time
+    from src.services import llm_vector_cache
+    calls = []
+
+    def slow_compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [0.1, 0.2, 0.3, 0.4]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(llm_vector_cache.single_flight("k", slow_compute)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [[0.1, 0.2, 0.3, 0.4]] * 5
+
+def test_llm_vector_cache_evicts_least_recently_used(db_session, monkeypatch):
+    from src.services import llm_vector_cache
+    from src.database.models import LLMVectorCache
+    monkeypatch.setattr(llm_vector_cache, "LLM_VECTOR_CACHE_MAX_ENTRIES", 2)
+    for key in ("a", "b", "c"):
+        llm_vector_cache.get_or_compute(db_session, key, "m@v1", lambda: [0.0, 0.0, 0.0, 1.0])
+    assert {row.cache_key for row in db_session.query(LLMVectorCache)} == {"b", "c"}
+
+def test_llm_vector_cache_hits_leave_the_caller_session_alone(db_session, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from src.services import llm_vector_cache
+    from src.database.models import LLMVectorCache
+    vec = [0.0, 0.0, 0.0, 1.0]
+    llm_vector_cache.get_or_compute(db_session, "k", "m@v1", lambda: vec)
+    unsaved = Patient(name="未保存")
+    db_session.add(unsaved)
+    assert llm_vector_cache.get_or_compute(db_session, "k", "m@v1", lambda: None) == vec
+    assert unsaved in db_session.new
+    db_session.expunge(unsaved)
+    assert db_session.get(LLMVectorCache, "k", populate_existing=True).hit_count == 1
+
+    # Bookkeeping is best-effort: a failing write still serves the hit
+    broken = create_engine("sqlite:///:memory:")
+    monkeypatch.setattr(llm_vector_cache, "_cache_session", lambda db: Session(bind=broken))
+    assert llm_vector_cache.get_or_compute(db_session, "k", "m@v1", lambda: None) == vec
+
+def test_search_similar_records_filters_and_paging(db_session):
+    from src.database.models import Practitioner
+    t1 = Practitioner(name="老师甲", role="teacher")
+    t2 = Practitioner(name="老师乙", role="teacher")
+    p = Patient(name="病人E", age=40, gender="女")
+    db_session.add_all([t1, t2, p])
+    db_session.commit()
+
+    grid = {"left-guan-zhong": "弦滑有力"}
+    own = [_add_teacher_record(db_session, p, t1, grid) for _ in range(3)]
+    other = _add_teacher_record(db_session, p, t2, grid)
+
+    results = search_service.search_similar_records(db_session, grid, practitioner_id=t1.id, limit=2)
+    assert len(results) == 2
+    assert all(r["record_id"] in {o.id for o in own} for r in results)
+    page2 = search_service.search_similar_records(db_session, grid, practitioner_id=t1.id, limit=2, offset=2)
+    assert len(page2) == 1
+
+    results = search_service.search_similar_records(db_session, grid, practitioner_id=t2.id)
+    assert [r["record_id"] for r in results] == [other.id]
+    assert search_service.search_similar_records(db_session, grid, end_date=date.today() - timedelta(days=1)) == []
+
+def test_position_mode_distinguishes_where_qualities_appear(db_session):
+    from src.database.models import Practitioner
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人F", age=40, gender="男")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    query = {"left-chi-chen": "细弱", "right-cun-chen": "弦滑"}
+    same = _add_teacher_record(db_session, p, teacher, dict(query))
+    swapped = _add_teacher_record(db_session, p, teacher, {"left-chi-chen": "弦滑", "right-cun-chen": "细弱"})
+
+    # The averaged 4D vector cannot tell the two apart
+    assert search_service._grid_to_vector(query) == search_service._grid_to_vector(swapped.data["pulse_grid"])
+
+    results = search_service.search_similar_records(db_session, query, mode="position", min_similarity=0.0)
+    assert [r["record_id"] for r in results] == [same.id]
+    assert results[0]["similarity"] == 1.0
+    with pytest.raises(ValueError):
+        search_service.search_similar_records(db_session, query, mode="unknown")
+
+def test_trained_pulse_model_replaces_llm_on_query_path(db_session, monkeypatch):
+    import random
+    from unittest.mock import MagicMock
+    from src.database.models import Practitioner
+    from src.services import pulse_model
+    monkeypatch.setattr(pulse_model, "_active_model", None)
+    monkeypatch.setattr(pulse_model, "_active_loaded", True)
+
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人G", age=40, gender="女")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    llm = MagicMock()
+    llm.model = "test-model"
+    revision = search_service.llm_vector_revision(llm)
+    keywords = list(search_service.PULSE_KEYWORD_VECTORS)
+    positions = ["left-cun-fu", "left-chi-chen", "right-guan-zhong"]
+    rng = random.Random(3)
+    for _ in range(120):
+        grid = {pos: rng.choice(keywords) for pos in rng.sample(positions, 2)}
+        # A position-dependent "LLM" labelling that plain keyword sums cannot reproduce
+        scale = {"left-cun-fu": 0.3, "left-chi-chen": 1.0, "right-guan-zhong": 0.6}
+        vec = [0.0, 0.0, 0.0, 0.0]
+        for pos, kw in grid.items():
+            vec = [v + scale[pos] * k for v, k in zip(vec, search_service.PULSE_KEYWORD_VECTORS[kw])]
+        _add_teacher_record(db_session, p, teacher, grid, pulse_vector=[max(-1, min(1, v)) for v in vec],
+                            pulse_vector_model=revision)
+
+    report = search_service.train_pulse_model(db_session, llm, save=False)
+    assert report["n_fit"] == 120
+    assert report["model"]["mean_similarity"] > report["keyword_baseline"]["mean_similarity"]
+    assert report["model"]["mean_similarity"] > 0.95
+
+    search_service.search_similar_records(db_session, {"left-chi-chen": "沉"}, llm_service=llm)
+    llm._call_llm.assert_not_called()
+
+    # A model trained for another LLM revision is ignored
+    llm.model = "other-model"
+    llm._call_llm.return_value = '{"xu_shi": 0, "yin_yang": 0, "biao_li": 0.5, "han_re": 0}'
+    search_service.search_similar_records(db_session, {"left-chi-chen": "沉"}, llm_service=llm)
+    assert llm._call_llm.call_count == 1
+
+def test_pulse_model_trains_on_vectors_cached_before_revision_stamps(db_session, monkeypatch):
+    import random
+    from unittest.mock import MagicMock
+    from src.database.models import Practitioner
+    from src.services import pulse_model
+    monkeypatch.setattr(pulse_model, "_active_model", None)
+    monkeypatch.setattr(pulse_model, "_active_loaded", True)
+
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人H", age=40, gender="女")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+
+    llm = MagicMock()
+    llm.model = "test-model"
+    keywords = list(search_service.PULSE_KEYWORD_VECTORS)
+    rng = random.Random(5)
+    for i in range(40):
+        grid = {"left-guan-zhong": rng.choice(keywords)}
+        vec = search_service.PULSE_KEYWORD_VECTORS[grid["left-guan-zhong"]]
+        # Legacy records carry no pulse_vector_model; a few come from another LLM revision
+        extra = {"pulse_vector_model": "other-model@v1"} if i % 4 == 0 else {}
+        _add_teacher_record(db_session, p, teacher, grid, pulse_vector=vec, **extra)
+
+    report = search_service.train_pulse_model(db_session, llm, save=False)
+    assert report["n_fit"] == 30
+
+def test_hybrid_search_queries_cloud_in_parallel_with_budget(db_session, monkeypatch):
+    import time
+    from sqlalchemy.orm import sessionmaker
+    p = Patient(name="并行病人", age=30, gender="男", phone="13900000000")
+    db_session.add(p)
+    db_session.commit()
+    db_session.add(MedicalRecord(patient_id=p.id, visit_date=date.today(), diagnosis="测试"))
+    db_session.commit()
+
+    # A reachable cloud holding the same rows: merged by UUID, not partial
+    CloudSession = sessionmaker(bind=db_session.get_bind())
+    monkeypatch.setattr(search_service, "SessionCloud", CloudSession)
+    monkeypatch.setattr(search_service, "_get_cloud_session", CloudSession)
+    results, partial = search_service.search_patients(db_session, "并行", return_partial=True)
+    assert [r["source"] for r in results] == ["local"]
+    assert partial is False
+
+    # A cloud slower than the budget: local results come back on time, marked partial
+    def slow_cloud():
+        time.sleep(0.5)
+        return None
+    monkeypatch.setattr(search_service, "_get_cloud_session", slow_cloud)
+    monkeypatch.setattr(search_service, "CLOUD_QUERY_BUDGET_SECONDS", 0.05)
+    start = time.monotonic()
+    results, partial = search_service.get_patients_by_date_range(
+        db_session, single_date_str=date.today().isoformat(), return_partial=True
+    )
+    assert time.monotonic() - start < 0.4
+    assert partial is True
+    assert [r["name"] for r in results] == ["并行病人"]
+
+def test_patients_by_date_groups_visits_without_loading_record_json(db_session):
+    from datetime import datetime
+    from sqlalchemy import event
+    p = Patient(name="多次就诊", age=45, gender="女")
+    other = Patient(name="范围外", age=45, gender="男")
+    db_session.add_all([p, other])
+    db_session.commit()
+    day = date(2024, 3, 10)
+    for visit in (datetime(2024, 3, 1, 9), datetime(2024, 3, 10, 23, 59), datetime(2024, 3, 5)):
+        db_session.add(MedicalRecord(patient_id=p.id, visit_date=visit, data={"pulse_grid": {}}))
+    db_session.add(MedicalRecord(patient_id=other.id, visit_date=datetime(2024, 3, 11, 0, 0)))
+    db_session.commit()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_session.get_bind(), "before_cursor_execute", listener)
+    try:
+        results = search_service._query_patients_by_date(db_session, date(2024, 3, 1), day)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", listener)
+
+    assert [(r["name"], r["last_visit"]) for r in results] == [("多次就诊", "2024-03-10")]
+    assert len(statements) == 1
+    assert "medical_records.data" not in statements[0]
+
+def test_search_patients_uses_trigram_index_and_tracks_writes(db_session):
+    from sqlalchemy import text
+    from src.database import search_index
+    engine = db_session.get_bind()
+    assert search_index.ensure_patient_search_index(engine)
+    try:
+        p = Patient(name="欧阳明月", pinyin="ouyangmingyue", phone="13912345678", age=30, gender="女")
+        db_session.add_all([p, Patient(name="李四", pinyin="lisi", age=40, gender="男")])
+        db_session.commit()
+
+        assert [r["name"] for r in search_service.search_patients(db_session, "yangming")] == ["欧阳明月"]
+        assert [r["name"] for r in search_service.search_patients(db_session, "2345")] == ["欧阳明月"]
+        # Shorter than a trigram: falls back to ILIKE
+        assert [r["name"] for r in search_service.search_patients(db_session, "李")] == ["李四"]
+        # FTS query syntax in user input is matched literally
+        assert search_service.search_patients(db_session, 'ming" OR "li') == []
+
+        p.phone = "13700000000"
+        db_session.commit()
+        assert search_service.search_patients(db_session, "2345") == []
+        db_session.execute(text("DELETE FROM patients WHERE id = :id"), {"id": p.id})
+        db_session.commit()
+        assert search_service.search_patients(db_session, "yangming") == []
+    finally:
+        search_index.drop_patient_search_index(engine)
+
+def test_patient_lists_page_by_cursor_and_stream(client, db_session):
+    import json
+    from datetime import datetime
+    from src.database.models import User
+    from src.services import auth_service
+    from web.app import app
+    admin = User(username="admin", hashed_password="x", role="admin", is_active=True)
+    db_session.add(admin)
+    patients = [Patient(name=f"分页{i}", age=30, gender="男") for i in range(7)]
+    db_session.add_all(patients)
+    db_session.commit()
+    # Two patients share a visit time: the uuid tiebreak must still split them cleanly
+    for i, p in enumerate(patients):
+        db_session.add(MedicalRecord(patient_id=p.id, visit_date=datetime(2024, 5, 1 + min(i, 5), 10)))
+    db_session.commit()
+    app.dependency_overrides[auth_service.get_current_active_user] = lambda: admin
+
+    params = {"start_date": "2024-05-01", "end_date": "2024-05-31", "limit": 3}
+    seen, cursor = [], None
+    while True:
+        response = client.get("/api/patients/by_date", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        assert response.headers["X-Search-Partial"] == "false"
+        seen += [r["name"] for r in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    everything = client.get("/api/patients/by_date", params={"start_date": "2024-05-01", "end_date": "2024-05-31"}).json()
+    assert seen == [r["name"] for r in everything]
+    assert sorted(seen) == sorted(p.name for p in patients)
+
+    lines = [json.loads(line) for line in client.get(
+        "/api/patients/search", params={"query": "分页", "limit": 4, "stream": "true"}
+    ).text.splitlines()]
+    assert len(lines) == 5 and "next_cursor" in lines[-1]
+    rest = client.get("/api/patients/search", params={"query": "分页", "cursor": lines[-1]["next_cursor"]}).json()
+    assert len({r["id"] for r in lines[:-1] + rest}) == 7
+
+    history = client.get(f"/api/patients/{patients[0].id}/history", params={"limit": 1})
+    assert len(history.json()) == 1 and "X-Next-Cursor" not in history.headers
+    assert client.get("/api/patients/search", params={"query": "分页", "cursor": "not-a-cursor"}).status_code == 400
+
+def test_streamed_lists_outlive_the_request_session(db_session):
+    import asyncio
+    import json
+    from datetime import datetime
+    from fastapi import Response
+    from sqlalchemy.orm import Session
+    from src.services import record_service
+    from web.routers.patients import _list_response
+    p = Patient(name="流式", age=30, gender="男")
+    db_session.add(p)
+    db_session.commit()
+    db_session.add_all([MedicalRecord(patient_id=p.id, visit_date=datetime(2024, 1, day), data={}) for day in (1, 2, 3)])
+    db_session.commit()
+
+    sessions = []
+
+    def rows_of(session):
+        sessions.append(session)
+        return record_service.iter_patient_history(session, p.id)
+
+    request_db = Session(bind=db_session.get_bind())
+    response = _list_response(Response(), request_db, rows_of, lambda row: {"id": row["id"]}, 2, True)
+    # FastAPI before 0.118 closes dependency sessions before the body is sent
+    request_db.close()
+    assert sessions[0] is not request_db and sessions[0].in_transaction()
+
+    async def body():
+        return [chunk async for chunk in response.body_iterator]
+    lines = [json.loads(line) for line in asyncio.run(body())]
+    assert len(lines) == 3 and "next_cursor" in lines[-1]
+    # The stream closes its session once the body is sent
+    assert not sessions[0].in_transaction()
+
+def _fake_pulse_llm(fail_marker=None):
+    """LLM stub answering single and batched pulse prompts; grids containing fail_marker get no vector."""
+    import json
+    import re
+    from unittest.mock import MagicMock
+    answer = {"xu_shi": 0.5, "yin_yang": 0.4, "biao_li": -0.6, "han_re": 0.3}
+
+    def call(system, user):
+        records = re.split(r"记录 (\d+):\n", user)
+        if len(records) == 1:
+            return "Error analyzing data" if fail_marker and fail_marker in user else json.dumps(answer)
+        pairs = zip(records[1::2], records[2::2])
+        return json.dumps([{"id": int(i), **answer} for i, text in pairs if not (fail_marker and fail_marker in text)])
+
+    llm = MagicMock()
+    llm.model = "test-model"
+    llm._call_llm.side_effect = call
+    return llm
+
+def test_precompute_job_runs_in_background_and_resumes_from_checkpoint(db_session):
+    from unittest.mock import MagicMock
+    from src.database.models import Practitioner, JobCheckpoint
+    from src.services import precompute_job
+    from sqlalchemy.orm import sessionmaker
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人P", age=40, gender="男")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+    records = [_add_teacher_record(db_session, p, teacher, {"left-cun-fu": f"浮数{i}"}) for i in range(7)]
+    failing = records[5].id
+
+    llm = _fake_pulse_llm(fail_marker="浮数5")
+
+    # A run interrupted after the first chunk: its checkpoint is still 'running'. It started
+    # before the last two records were saved, so its total is short
+    db_session.add(JobCheckpoint(kind=precompute_job.JOB_KIND, revision=search_service.llm_vector_revision(llm),
+                                 status="running", last_record_id=records[2].id, total=5, processed=3))
+    db_session.commit()
+    job = precompute_job.PrecomputeJob(sessionmaker(bind=db_session.get_bind()), workers=3, rate_per_second=0, chunk_size=3)
+    assert job.status(db_session)["status"] == "interrupted"
+
+    status, started = job.start(llm)
+    assert started
+    job.wait(10)
+    status = job.status(db_session)
+    assert (status["status"], status["processed"], status["updated"], status["failed"]) == ("completed", 7, 3, 1)
+    assert (status["total"], status["progress"]) == (7, 1.0)
+    # Only records past the checkpoint were sent: one batch, the single retry of the bad grid, the last chunk
+    assert llm._call_llm.call_count == 3
+    db_session.expire_all()
+    vectors = {r.id: r.data.get("pulse_vector") for r in db_session.query(MedicalRecord)}
+    assert vectors[records[6].id] == [0.5, 0.4, -0.6, 0.3]
+    assert vectors[records[0].id] is None and vectors[failing] is None
+
+    # A fresh run retries whatever still has no vector
+    job.start(llm, restart=True)
+    job.wait(10)
+    assert job.status(db_session)["updated"] == 3
+
+def test_llm_grids_to_vectors_batches_within_token_budget_and_retries_failures():
+    from concurrent.futures import ThreadPoolExecutor
+    grids = [(i, {"left-cun-fu": f"浮数{i}", "overall_description": "脉象平和" * 20}) for i in range(1, 11)]
+    one_grid = search_service._estimate_tokens(search_service._format_grid_for_prompt(grids[0][1]))
+    budget = 600
+    batches = search_service._pack_grid_batches(
+        [(i, search_service._format_grid_for_prompt(g)) for i, g in grids], token_budget=budget
+    )
+    assert len(batches) > 1 and sum(len(b) for b in batches) == 10
+    assert max(len(b) for b in batches) > 1
+    assert all(len(b) <= budget // one_grid for b in batches)
+
+    llm = _fake_pulse_llm(fail_marker="浮数7")
+    with ThreadPoolExecutor(2) as executor:
+        vectors = search_service.llm_grids_to_vectors(grids, llm, executor=executor, token_budget=budget)
+    assert set(vectors) == set(range(1, 11)) - {7}
+    assert vectors[1] == [0.5, 0.4, -0.6, 0.3]
+    # One request per batch, plus a single retry for the grid missing from its batch answer
+    assert llm._call_llm.call_count == len(batches) + 1
+
+    # Out-of-range values are clamped, malformed entries and unknown ids are dropped
+    llm._call_llm.side_effect = lambda system, user: (
+        '```json\n[{"id": 1, "xu_shi": 3, "yin_yang": 0, "biao_li": 0, "han_re": 0},'
+        ' {"id": 2, "xu_shi": "x"}, {"id": 99, "xu_shi": 0, "yin_yang": 0, "biao_li": 0, "han_re": 0}]\n```'
+        if "记录" in user else "not json"
+    )
+    assert search_service.llm_grids_to_vectors(grids[:2], llm) == {1: [1.0, 0.0, 0.0, 0.0]}
+
+def test_search_records_by_text_persists_and_catches_up(db_session):
+    from src.database.models import Practitioner
+    from src.services.text_index import text_index
+    teacher = Practitioner(name="老师", role="teacher")
+    p = Patient(name="病人T", age=40, gender="女")
+    db_session.add_all([teacher, p])
+    db_session.commit()
+    cold = _add_teacher_record(db_session, p, teacher, {"left-chi-chen": "沉迟无力"})
+    cold.complaint, cold.diagnosis = "畏寒肢冷", "脾肾阳虚"
+    _add_teacher_record(db_session, p, teacher, {"left-cun-fu": "浮数"})
+    db_session.commit()
+
+    results = search_service.search_records_by_text(db_session, "畏寒，脉沉迟")
+    assert [r["record_id"] for r in results] == [cold.id]
+    assert results[0]["diagnosis"] == "脾肾阳虚" and 0 < results[0]["similarity"] <= 1
+    import os
+    assert os.path.isdir(search_service.TEXT_INDEX_PATH)
+
+    # Saved on fit; a new process loads it, picks up records written since and saves again
+    first_saved = text_index.saved_at
+    search_service.invalidate_pulse_vectors()
+    later = _add_teacher_record(db_session, p, teacher, {"left-chi-chen": "沉迟"})
+    later.complaint = "畏寒"
+    db_session.delete(cold)
+    db_session.commit()
+    results = search_service.search_records_by_text(db_session, "畏寒，脉沉迟")
+    assert [r["record_id"] for r in results] == [later.id]
+    assert text_index.saved_at > first_saved and cold.id not in text_index
@@ -0,0 +1,601 @@
+import json
+import threading
+import time
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database.models import Base, User, Patient, Practitioner, MedicalRecord, ChangeLog
+from src.database import change_log
+from src.services import sync_service as sync_module
+from src.services.sync_service import SyncService
+from src.services.sync_runner import SyncRunner
+
+
+@pytest.fixture
+def cloud():
+    """A second in-memory database standing in for the cloud."""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def service(db_session, cloud):
+    svc = SyncService()
+    svc.get_local_db = sessionmaker(bind=db_session.get_bind())
+    svc.get_cloud_db = sessionmaker(bind=cloud)
+    return svc
+
+
+def _count_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_sync_up_pushes_chunks_with_mapped_foreign_keys(db_session, cloud, service, monkeypatch):
+    monkeypatch.setattr(sync_module, "SYNC_CHUNK_SIZE", 4)
+    # Cloud ids are offset from local ids, so copied foreign keys would point at the wrong rows
+    cloud_db = sessionmaker(bind=cloud)()
+    cloud_db.add_all([Patient(name=f"云端{i}") for i in range(3)] + [Practitioner(name="云端老师")])
+    cloud_db.commit()
+
+    teacher = Practitioner(name="老师")
+    patients = [Patient(name=f"病人{i}", phone=f"1380000000{i}") for i in range(10)]
+    db_session.add_all([teacher] + patients)
+    db_session.commit()
+    db_session.add_all([
+        MedicalRecord(patient_id=p.id, practitioner_id=teacher.id, visit_date=datetime(2024, 1, 1), data={"i": i})
+        for i, p in enumerate(patients)
+    ])
+    db_session.commit()
+
+    statements = _count_statements(cloud)
+    result = service.sync_up()
+    assert result["status"] == "completed"
+    assert (result["data"]["synced"], result["data"]["failed"], result["data"]["details"]) == (21, 0, [])
+    # One upsert plus one change-log insert per chunk; parents upserted earlier in the run are
+    # already mapped, so record chunks look nothing up: 1 practitioner + 3 patient + 3 record chunks
+    assert [s for s in statements if s.startswith("PRAGMA")] == ['PRAGMA main.table_info("change_log")']
+    assert len(statements) == 1 + 7 * 2
+    assert result["data"]["queries"]["cloud"] == 14
+
+    cloud_db.expire_all()
+    for record in cloud_db.query(MedicalRecord):
+        assert record.patient.name == f"病人{record.data['i']}"
+        assert record.practitioner.name == "老师"
+    db_session.expire_all()
+    assert {r.sync_status for r in db_session.query(MedicalRecord)} == {"synced"}
+
+    # Edits update the existing cloud rows in place; a new run maps parents in one bulk lookup per side
+    patients[0].phone = "13999999999"
+    patients[0].sync_status = "pending"
+    db_session.add_all([
+        MedicalRecord(patient_id=p.id, practitioner_id=teacher.id, visit_date=datetime(2024, 2, 1), data={"i": i})
+        for i, p in enumerate(patients[:3])
+    ])
+    db_session.commit()
+    del statements[:]
+    result = service.sync_up()
+    assert result["data"]["synced"] == 4
+    # patient upsert + (patient, practitioner) uuid -> cloud id lookups + record upsert, each upsert logged
+    assert len(statements) == 6
+    cloud_db.expire_all()
+    assert cloud_db.query(Patient).filter(Patient.name == "病人0").one().phone == "13999999999"
+    cloud_db.close()
+
+
+def test_sync_up_isolates_failing_rows(db_session, cloud, service):
+    cloud_db = sessionmaker(bind=cloud)()
+    # Same unique name under another uuid: the whole chunk fails, then only this row
+    cloud_db.add(Practitioner(name="重名"))
+    cloud_db.commit()
+
+    db_session.add_all([Practitioner(name="重名"), Practitioner(name="甲"), Practitioner(name="乙")])
+    db_session.commit()
+
+    result = service.sync_up()
+    assert (result["data"]["synced"], result["data"]["failed"]) == (2, 1)
+    assert result["data"]["details"][0].startswith("UP:practitioners:")
+    db_session.expire_all()
+    statuses = {p.name: p.sync_status for p in db_session.query(Practitioner)}
+    assert statuses == {"重名": "failed", "甲": "synced", "乙": "synced"}
+    assert cloud_db.query(Practitioner).count() == 3
+    cloud_db.close()
+
+
+def test_local_database_errors_fail_rows_not_the_cloud(db_session, cloud, service, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from src.services.cloud_health import cloud_health
+    cloud_db = sessionmaker(bind=cloud)()
+    cloud_db.add_all([Patient(name="锁"), Patient(name="甲"), Patient(name="乙")])
+    cloud_db.commit()
+    cloud_db.close()
+
+    sync_record_down = SyncService._sync_record_down
+
+    def locked(self, local_db, cloud_db, model, cloud_record, *args, **kwargs):
+        if cloud_record.name == "锁":
+            raise OperationalError("UPDATE patients", {}, Exception("database is locked"))
+        return sync_record_down(self, local_db, cloud_db, model, cloud_record, *args, **kwargs)
+
+    monkeypatch.setattr(SyncService, "_sync_record_down", locked)
+    result = service.sync_down()
+    assert result["status"] == "completed"
+    assert (result["data"]["synced"], result["data"]["failed"]) == (2, 1)
+    assert cloud_health.snapshot()["consecutive_failures"] == 0
+
+
+def test_sync_up_stops_bulk_upserts_without_a_unique_uuid_index(db_session, cloud, service):
+    # A cloud migrated with only a plain index on uuid rejects ON CONFLICT (uuid)
+    with cloud.begin() as conn:
+        conn.execute(text("DROP INDEX ix_patients_uuid"))
+        conn.execute(text("CREATE INDEX ix_patients_uuid ON patients (uuid)"))
+    db_session.add_all([Patient(name="甲"), Patient(name="乙")])
+    db_session.commit()
+    statements = _count_statements(cloud)
+    assert service.sync_up()["data"]["synced"] == 2
+    assert sum("ON CONFLICT" in s for s in statements) == 1
+
+    # Checked once: later chunks go one by one without trying the upsert first
+    db_session.add(Patient(name="丙"))
+    db_session.commit()
+    statements.clear()
+    assert service.sync_up()["data"]["synced"] == 1
+    assert not [s for s in statements if "ON CONFLICT" in s]
+    assert sessionmaker(bind=cloud)().query(Patient).count() == 3
+
+
+def test_sync_down_maps_foreign_keys_in_bulk(db_session, cloud, service):
+    # Local ids are offset from cloud ids, so copied foreign keys would point at the wrong rows
+    db_session.add_all([Patient(name=f"本地{i}", sync_status="synced") for i in range(2)])
+    db_session.commit()
+
+    cloud_db = sessionmaker(bind=cloud)()
+    teacher = Practitioner(name="老师")
+    patients = [Patient(name=f"病人{i}") for i in range(5)]
+    cloud_db.add_all([teacher] + patients)
+    cloud_db.commit()
+    cloud_db.add_all([
+        MedicalRecord(patient_id=p.id, practitioner_id=teacher.id, visit_date=datetime(2024, 1, 1), data={"i": i})
+        for i, p in enumerate(patients)
+    ])
+    cloud_db.commit()
+
+    result = service.sync_down()
+    assert (result["data"]["synced"], result["data"]["failed"]) == (11, 0)
+    assert set(result["data"]["queries"]) == {"local", "cloud"}
+    db_session.expire_all()
+    records = db_session.query(MedicalRecord).all()
+    assert len(records) == 5
+    for record in records:
+        assert record.patient.name == f"病人{record.data['i']}"
+        assert record.practitioner.name == "老师"
+    cloud_db.close()
+
+
+def test_local_changes_are_logged_and_pushed_once(db_session, cloud, service):
+    patient = Patient(name="病人")
+    db_session.add(patient)
+    db_session.commit()
+    assert service.sync_up()["data"]["synced"] == 1
+    db_session.expire_all()
+    # Pushed entries are pruned; marking rows synced is not a change
+    assert db_session.query(ChangeLog).count() == 0
+    assert patient.sync_status == "synced"
+
+    patient.age = 40
+    db_session.commit()
+    assert patient.sync_status == "pending"
+    assert [(c.table_name, c.op, c.origin) for c in db_session.query(ChangeLog)] == [("patients", "update", "local")]
+    assert service.sync_up()["data"]["synced"] == 1
+    assert service.sync_up()["data"]["synced"] == 0
+
+    cloud_db = sessionmaker(bind=cloud)()
+    assert cloud_db.query(Patient).one().age == 40
+    assert {c.origin for c in cloud_db.query(ChangeLog)} == {change_log.node_id(db_session)}
+    cloud_db.close()
+
+
+def test_node_id_is_generated_once_per_database(db_session, monkeypatch):
+    from src.database.models import SyncState
+    first = change_log.node_id(db_session)
+    # Persisted, not derived from the hostname: a fresh process reads the same id back
+    change_log._node_ids.clear()
+    assert change_log.node_id(db_session) == first
+    assert db_session.query(SyncState).filter(SyncState.direction == "self").one().peer == first
+
+    other = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=other)
+    assert change_log.node_id(sessionmaker(bind=other)()) != first
+    other.dispose()
+
+    monkeypatch.setattr(change_log, "SYNC_NODE_ID", "clinic-9")
+    assert change_log.node_id(db_session) == "clinic-9"
+
+
+def test_rebuilding_pulse_vectors_is_not_an_edit(db_session, service):
+    from src.database.models import PulseVector
+    from src.services import search_service
+    teacher = Practitioner(name="老师")
+    patient = Patient(name="病人")
+    db_session.add_all([teacher, patient])
+    db_session.commit()
+    db_session.add_all([
+        MedicalRecord(patient_id=patient.id, practitioner_id=teacher.id, visit_date=datetime(2024, 1, 1),
+                      updated_at=datetime(2024, 1, 1), data={"pulse_grid": {"left-guan-zhong": "弦滑"}})
+        for _ in range(3)
+    ])
+    db_session.commit()
+    assert service.sync_up()["data"]["synced"] == 5
+    db_session.expire_all()
+
+    # First build, then a rebuild after the keyword revision changed
+    assert search_service.refresh_pulse_vector_table(db_session) == 3
+    db_session.query(PulseVector).update({PulseVector.kw_revision: "stale"})
+    db_session.commit()
+    assert search_service.refresh_pulse_vector_table(db_session) == 3
+
+    db_session.expire_all()
+    records = db_session.query(MedicalRecord).all()
+    assert {(r.sync_status, r.updated_at) for r in records} == {("synced", datetime(2024, 1, 1))}
+    assert db_session.query(ChangeLog).count() == 0
+
+
+def test_pulled_records_are_reindexed_not_invalidated(db_session, cloud, service, monkeypatch):
+    from src.database.models import PulseVector
+    from src.services import search_service
+    from src.services.pulse_index import pulse_index
+    from src.services.text_index import text_index
+    monkeypatch.setattr(sync_module, "SYNC_CHANGE_SETTLE_SECONDS", 0)
+    teacher = Practitioner(name="老师")
+    patient = Patient(name="病人")
+    db_session.add_all([teacher, patient])
+    db_session.commit()
+    gone, kept = [
+        MedicalRecord(patient_id=patient.id, practitioner_id=teacher.id, visit_date=datetime(2024, 1, 1),
+                      updated_at=datetime(2024, 1, 1), data={"pulse_grid": {"left-guan-zhong": "弦滑"}})
+        for _ in range(2)
+    ]
+    db_session.add_all([gone, kept])
+    db_session.commit()
+    service.sync_all()
+    search_service.ensure_pulse_index(db_session)
+    search_service.ensure_text_index(db_session)
+
+    other = sessionmaker(bind=cloud, info={"sync_origin": "clinic-2"})()
+    cloud_teacher = other.query(Practitioner).one()
+    cloud_patient = other.query(Patient).one()
+    other.add(MedicalRecord(patient_id=cloud_patient.id, practitioner_id=cloud_teacher.id,
+                            visit_date=datetime(2024, 2, 1), complaint="畏寒",
+                            data={"pulse_grid": {"left-chi-chen": "沉迟"}}))
+    other.query(MedicalRecord).filter(MedicalRecord.uuid == kept.uuid).one().data = \
+        {"pulse_grid": {"left-cun-fu": "浮数"}}
+    other.query(MedicalRecord).filter(MedicalRecord.uuid == gone.uuid).one().is_deleted = True
+    other.commit()
+    other.close()
+    kept_id, gone_id = kept.id, gone.id
+
+    assert service.sync_down()["data"]["synced"] == 3
+    db_session.expire_all()
+    new_id = db_session.query(MedicalRecord.id).filter(MedicalRecord.complaint == "畏寒").scalar()
+    # The indexes stay built and hold the pulled rows; stored vectors follow the pulled data
+    assert pulse_index.is_built and text_index.is_built
+    assert new_id in pulse_index and new_id in text_index
+    assert gone_id not in pulse_index and gone_id not in text_index
+    assert db_session.get(PulseVector, gone_id) is None
+    expected = search_service._grid_to_vector({"left-cun-fu": "浮数"})
+    stored = db_session.get(PulseVector, kept_id)
+    assert [getattr(stored, c) for c in PulseVector.KW_COLUMNS] == pytest.approx(expected)
+    assert db_session.get(PulseVector, new_id) is not None
+    assert db_session.query(ChangeLog).filter(ChangeLog.origin == change_log.LOCAL_ORIGIN).count() == 0
+
+
+def test_failed_cloud_delete_is_retried_on_the_next_run(db_session, cloud, service):
+    patient = Patient(name="病人")
+    db_session.add(patient)
+    db_session.commit()
+    assert service.sync_up()["data"]["synced"] == 1
+    db_session.delete(patient)
+    db_session.commit()
+
+    with cloud.begin() as conn:
+        conn.execute(text("CREATE TRIGGER keep BEFORE UPDATE OF is_deleted ON patients "
+                          "BEGIN SELECT RAISE(ABORT, 'blocked'); END"))
+    assert service.sync_up()["data"]["failed"] == 1
+    assert [c.op for c in db_session.query(ChangeLog)] == ["delete"]
+
+    with cloud.begin() as conn:
+        conn.execute(text("DROP TRIGGER keep"))
+    assert service.sync_up()["data"]["synced"] == 1
+    assert db_session.query(ChangeLog).count() == 0
+    cloud_db = sessionmaker(bind=cloud)()
+    assert cloud_db.query(Patient).one().is_deleted
+    cloud_db.close()
+
+
+def test_sync_down_reads_changes_of_other_writers(db_session, cloud, service, monkeypatch):
+    monkeypatch.setattr(sync_module, "SYNC_CHANGE_SETTLE_SECONDS", 0)
+    db_session.add(Patient(name="本地", updated_at=datetime(2024, 6, 1)))
+    db_session.commit()
+    service.sync_all()
+
+    # Another clinic pushes a row last edited before the newest local row
+    other = sessionmaker(bind=cloud, info={"sync_origin": "clinic-2"})()
+    other.add(Patient(name="外院", updated_at=datetime(2024, 1, 1)))
+    other.commit()
+    result = service.sync_down()
+    assert result["data"]["synced"] == 1
+    db_session.expire_all()
+    pulled = db_session.query(Patient).filter(Patient.name == "外院").one()
+    assert pulled.sync_status == "synced"
+    # Logged with its origin, so it is not pushed back up
+    assert service.sync_up()["data"]["synced"] == 0
+    assert service.sync_down()["data"]["synced"] == 0
+
+    # Local deletes become soft deletes in the cloud
+    db_session.delete(db_session.query(Patient).filter(Patient.name == "本地").one())
+    db_session.commit()
+    assert service.sync_up()["data"]["synced"] == 1
+    other.expire_all()
+    assert other.query(Patient).filter(Patient.name == "本地").one().is_deleted
+
+    # And cloud deletes remove local copies, without echoing the delete back up;
+    # rows deleted before they got here stay away
+    other.query(Patient).filter(Patient.name == "外院").one().is_deleted = True
+    other.add(Patient(name="已删", is_deleted=True))
+    other.commit()
+    result = service.sync_down()
+    assert (result["data"]["synced"], result["data"]["skipped"]) == (1, 1)
+    db_session.expire_all()
+    assert db_session.query(Patient).count() == 0
+    assert [(c.op, c.origin) for c in db_session.query(ChangeLog)] == [("delete", "clinic-2")]
+    assert service.sync_up()["data"]["synced"] == 0
+    other.close()
+
+
+def test_sync_down_streams_chunks_in_one_transaction_each(db_session, cloud, service, monkeypatch):
+    monkeypatch.setattr(sync_module, "SYNC_CHUNK_SIZE", 2)
+    cloud_db = sessionmaker(bind=cloud)()
+    patient, gone = Patient(name="病人"), Patient(name="已删除", is_deleted=True)
+    cloud_db.add_all([patient, gone])
+    cloud_db.commit()
+    # The third record points at a patient that is not pulled, so it cannot be written locally
+    owners = [patient, patient, gone, patient, patient]
+    cloud_db.add_all([
+        MedicalRecord(patient_id=p.id, visit_date=datetime(2024, 1, i + 1), data={"i": i}) for i, p in enumerate(owners)
+    ])
+    cloud_db.commit()
+    cloud_db.close()
+
+    change_log.node_id(db_session)  # Generated on the first sync, in its own commit
+    commits = []
+    event.listen(db_session.get_bind(), "commit", lambda conn: commits.append(1))
+    result = service.sync_down()
+    # The deleted patient is read but has no local copy to apply the delete to
+    assert (result["data"]["synced"], result["data"]["skipped"], result["data"]["failed"]) == (5, 1, 1)
+    assert result["data"]["details"][0].startswith("DOWN:medical_records")
+    # patients: 1 chunk; records: 2 chunks of 2 + 1, the failing chunk retried row by row; sync state;
+    # stored vectors of the pulled records
+    assert len(commits) == 1 + 2 + 1 + 1 + 1
+    db_session.expire_all()
+    assert sorted(r.data["i"] for r in db_session.query(MedicalRecord)) == [0, 1, 3, 4]
+    stages = result["data"]["pipeline"]
+    assert stages["read"]["rows"] == stages["write"]["rows"] == 7
+
+
+def test_pipeline_overlaps_reads_with_writes():
+    def slow_chunks(errors_at=None):
+        for i in range(6):
+            time.sleep(0.05)
+            if i == errors_at:
+                raise ConnectionError("lost the cloud")
+            yield [i, i]
+
+    def consume(pipeline):
+        done = []
+        for chunk in pipeline:
+            time.sleep(0.05)
+            done.append(chunk[0])
+        return done
+
+    sequential = sync_module._Pipeline(slow_chunks(), depth=0)
+    assert consume(sequential) == list(range(6))
+    pipelined = sync_module._Pipeline(slow_chunks(), depth=2)
+    assert consume(pipelined) == list(range(6))
+    stats = pipelined.stats()
+    assert stats["read"]["rows"] == stats["write"]["rows"] == 12
+    assert stats["seconds"] < sequential.stats()["seconds"] * 0.8
+
+    # Reader errors reach the consumer after the chunks read before them
+    failing = sync_module._Pipeline(slow_chunks(errors_at=3), depth=2)
+    done = []
+    with pytest.raises(ConnectionError):
+        for chunk in failing:
+            done.append(chunk[0])
+    assert done == [0, 1, 2]
+
+
+class _SlowSync:
+    """Stands in for SyncService: each run reports progress, then waits to be released."""
+
+    def __init__(self):
+        self.runs = 0
+        self.release = threading.Event()
+        self.in_run = threading.Event()
+
+    def sync_all(self, progress):
+        self.runs += 1
+        progress.phase("up", 4)
+        progress.advance("patients", 2)
+        self.in_run.set()
+        self.release.wait(5)
+        return {"status": "completed", "data": {"synced": self.runs}}
+
+    def get_pending_count(self):
+        return 0
+
+
+def test_sync_runner_merges_overlapping_triggers_and_reports_progress():
+    service = _SlowSync()
+    runner = SyncRunner(service, interval=0)
+    first, started = runner.trigger()
+    assert started and service.in_run.wait(5)
+
+    status = runner.status()
+    assert status["running"] and not status["queued"]
+    assert status["progress"]["phase"] == "up" and (status["progress"]["done"], status["progress"]["total"]) == (2, 4)
+    # Triggers during a run collapse into one follow-up run
+    later = [runner.trigger() for _ in range(3)]
+    assert not any(started for _, started in later)
+    assert runner.status()["queued"]
+
+    service.release.set()
+    assert runner.wait(first, timeout=5)["data"]["synced"] in (1, 2)
+    assert runner.wait(later[-1][0], timeout=5)["data"]["synced"] == 2
+    assert service.runs == 2
+    status = runner.status()
+    assert not status["running"] and status["last_result"]["data"]["synced"] == 2
+
+
+def test_sync_events_stream_runner_status(client, db_session, monkeypatch):
+    from src.services import auth_service
+    from web.app import app
+    from web.routers import sync as sync_router
+    service = _SlowSync()
+    runner = SyncRunner(service, interval=0)
+    monkeypatch.setattr(sync_router, "sync_runner", runner)
+    monkeypatch.setattr(sync_router, "EVENTS_POLL_SECONDS", 0.01)
+    app.dependency_overrides[auth_service.get_current_active_user] = lambda: User(username="u", role="admin")
+
+    response = client.post("/api/sync/trigger", params={"wait": False})
+    assert response.status_code == 202 and response.json()["status"] == "started"
+    assert service.in_run.wait(5)
+    assert client.get("/api/sync/status").json()["sync"]["progress"]["model"] == "patients"
+
+    threading.Timer(0.1, service.release.set).start()
+    body = client.get("/api/sync/events").text
+    events = [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+    assert events[0]["running"] and events[0]["progress"]["done"] == 2
+    assert not events[-1]["running"] and events[-1]["last_result"]["status"] == "completed"
+    assert client.post("/api/sync/trigger").json()["data"]["synced"] == 2
+
+
+def test_pending_count_is_maintained_without_count_queries(db_session, cloud, service):
+    from src.services.pending_counter import pending_counter
+    assert service.get_pending_count() == 0
+    statements = _count_statements(db_session.get_bind())
+
+    patients = [Patient(name=f"病人{i}") for i in range(3)]
+    db_session.add_all(patients + [Practitioner(name="老师", sync_status="synced")])
+    db_session.commit()
+    assert service.get_pending_count() == 3
+    db_session.add(Patient(name="回滚"))
+    db_session.flush()
+    db_session.rollback()
+    assert service.get_pending_count() == 3
+
+    assert service.sync_up()["data"]["synced"] == 3
+    assert service.get_pending_count() == 0
+    patients[0].age = 50
+    db_session.delete(patients[1])
+    db_session.commit()
+    assert service.get_pending_count() == 1
+    assert not [s for s in statements if "count(" in s.lower()]
+
+    # Raw SQL bypasses the hooks until the next reconciliation
+    db_session.execute(text("UPDATE patients SET sync_status = 'pending'"))
+    db_session.commit()
+    assert service.get_pending_count() == 1
+    assert pending_counter.reconcile(db_session)["patients"] == 2
+    assert service.get_pending_count() == 2
+
+
+def test_pending_count_survives_invalidation_during_count(db_session):
+    from src.services.pending_counter import PendingCounter
+    db_session.add_all([Patient(name="甲"), Patient(name="乙")])
+    db_session.commit()
+    counter = PendingCounter()
+    reconcile = counter.reconcile
+
+    def reconcile_then_invalidate(db):
+        counts = reconcile(db)
+        counter.invalidate()  # e.g. a test teardown or bulk import on another thread
+        return counts
+
+    counter.reconcile = reconcile_then_invalidate
+    assert counter.count(sessionmaker(bind=db_session.get_bind())) == 2
+
+
+def test_reconcile_transfers_only_rows_of_differing_buckets(db_session, cloud, service, monkeypatch):
+    from src.services import merkle
+    monkeypatch.setattr(merkle, "RECONCILE_LEAF_ROWS", 8)
+    db_session.add_all([Patient(name=f"病人{i}", updated_at=datetime(2024, 1, 1)) for i in range(300)])
+    db_session.commit()
+    assert service.sync_all()["status"] == "completed"
+
+    result = service.reconcile()
+    assert result["data"]["tables"]["patients"] == {"levels": 1, "hashes": 1, "buckets": 0, "push": 0, "pull": 0}
+
+    # Diverge behind the change log's back, as a failed partial sync or a raw SQL script would
+    local = {p.name: p.uuid for p in db_session.query(Patient)}
+    db_session.execute(text("UPDATE patients SET age = 30, updated_at = '2024-03-01 00:00:00.000000' WHERE uuid = :u"),
+                       {"u": local["病人1"]})
+    db_session.execute(text("DELETE FROM patients WHERE uuid = :u"), {"u": local["病人2"]})
+    db_session.commit()
+    with cloud.begin() as conn:
+        conn.execute(text("UPDATE patients SET age = 70, updated_at = '2024-04-01 00:00:00.000000' WHERE uuid = :u"),
+                     {"u": local["病人3"]})
+        conn.execute(text("UPDATE patients SET is_deleted = 1 WHERE uuid = :u"), {"u": local["病人4"]})
+        conn.execute(text("INSERT INTO patients (uuid, name, is_deleted) VALUES ('ffffffff-0000-4000-8000-000000000000', '删除', 1)"))
+
+    statements = _count_statements(cloud)
+    result = service.reconcile()
+    tables = result["data"]["tables"]
+    assert tables["patients"]["levels"] > 1 and tables["patients"]["hashes"] < 300
+    # 病人1 up; 病人2, 病人3 and the delete of 病人4 down; the deleted cloud-only row is not compared
+    assert (tables["patients"]["push"], tables["patients"]["pull"]) == (1, 3)
+    assert (result["data"]["pushed"], result["data"]["pulled"], result["data"]["failed"]) == (1, 3, 0)
+    # Only the root hash reads the whole table (versions only); full rows are fetched per differing bucket
+    full_rows = [s for s in statements if "FROM patients" in s and "patients.name" in s]
+    assert full_rows and all("uuid >=" in s or "uuid IN" in s or "patients.uuid =" in s for s in full_rows)
+
+    db_session.expire_all()
+    by_name = {p.name: p for p in db_session.query(Patient)}
+    assert by_name["病人2"].uuid == local["病人2"] and by_name["病人3"].age == 70
+    assert "病人4" not in by_name
+    assert "删除" not in by_name
+    cloud_db = sessionmaker(bind=cloud)()
+    assert cloud_db.query(Patient).filter(Patient.uuid == local["病人1"]).one().age == 30
+    cloud_db.close()
+    # Tombstones are not compared, so the tables now hash alike
+    assert merkle.diff_buckets(db_session, sessionmaker(bind=cloud)(), Patient)[0] == []
+
+    # A local (hard) delete leaves a cloud tombstone; later reconciles still stop at the root
+    db_session.delete(db_session.query(Patient).filter(Patient.name == "病人5").one())
+    db_session.commit()
+    assert service.sync_all()["status"] == "completed"
+    for _ in range(2):
+        tables = service.reconcile()["data"]["tables"]
+        assert tables["patients"] == {"levels": 1, "hashes": 1, "buckets": 0, "push": 0, "pull": 0}
+
+
+def test_reconcile_reports_rows_kept_for_pending_local_edits(db_session, cloud, service):
+    db_session.add(Patient(name="病人", updated_at=datetime(2024, 1, 1)))
+    db_session.commit()
+    assert service.sync_all()["status"] == "completed"
+
+    # Newer in the cloud, while the local copy has an edit that has not been pushed yet
+    with cloud.begin() as conn:
+        conn.execute(text("UPDATE patients SET age = 70, updated_at = '2024-04-01 00:00:00.000000'"))
+    db_session.execute(text("UPDATE patients SET sync_status = 'pending'"))
+    db_session.commit()
+
+    data = service.reconcile()["data"]
+    assert data["tables"]["patients"]["pull"] == 1
+    assert (data["pulled"], data["skipped"], data["failed"]) == (0, 1, 0)
+    db_session.expire_all()
+    assert db_session.query(Patient).one().age is None
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from datetime import date, timedelta
+from src.services.pulse_index import RecordMeta
+from src.services.text_index import TextIndex, ngrams
+
+_WORDS = ["浮", "沉", "迟", "数", "滑", "涩", "弦", "紧", "细", "洪", "头痛", "咳嗽", "失眠", "胃胀", "口苦", "乏力", "风寒", "湿热"]
+
+
+def _brute_force(index, docs, text, k, predicate=lambda meta: True):
+    """Cosine over dense TF-IDF vectors built from the index's own vocabulary and IDF."""
+    def dense(segments):
+        vec = np.zeros(index.vocabulary_size)
+        for term, count in ngrams(segments).items():
+            column = index._vocab.get(term)
+            if column is not None:
+                vec[column] = (1 + np.log(count)) * index._idf[column]
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    q = dense([text])
+    scored = [(record_id, float(dense(segments) @ q)) for record_id, segments, meta in docs if predicate(meta)]
+    scored = [s for s in scored if s[1] > 0]
+    scored.sort(key=lambda s: (-s[1], s[0]))
+    return scored[:k]
+
+
+@pytest.fixture
+def random_docs():
+    rng = np.random.default_rng(3)
+    base = date(2021, 1, 1)
+    docs = []
+    for record_id in range(1, 801):
+        segments = ["".join(rng.choice(_WORDS, size=int(rng.integers(1, 5)))) for _ in range(3)]
+        meta = RecordMeta(int(rng.integers(1, 4)), int(rng.integers(1, 4)), int(rng.integers(1, 50)),
+                          base + timedelta(days=int(rng.integers(0, 365))))
+        docs.append((record_id, segments, meta))
+    return docs
+
+
+def _assert_same_ranking(actual, expected):
+    assert [r for r, _ in actual] == [r for r, _ in expected]
+    assert np.allclose([s for _, s in actual], [s for _, s in expected], atol=1e-5)
+
+
+def test_ngrams_stay_within_segments():
+    counts = ngrams(["脉浮数", "头痛，发热"])
+    assert counts["脉浮数"] == 1 and counts["浮数"] == 1
+    assert "数头" not in counts and "痛发" not in counts
+    assert counts["头痛"] == 1 and counts["发热"] == 1
+
+
+def test_query_matches_brute_force_cosine(random_docs):
+    index = TextIndex()
+    index.fit(random_docs)
+    for text in ["弦滑头痛", "沉细乏力失眠", "风寒咳嗽"]:
+        _assert_same_ranking(index.query(text, k=10), _brute_force(index, random_docs, text, 10))
+    _assert_same_ranking(
+        index.query("湿热口苦", k=5, practitioner_id=2, start_date=date(2021, 6, 1)),
+        _brute_force(index, random_docs, "湿热口苦", 5,
+                     lambda m: m.practitioner_id == 2 and m.visit_date >= date(2021, 6, 1)),
+    )
+    assert index.query("完全无关", k=5) == []
+
+
+def test_incremental_updates_and_compaction(random_docs):
+    index = TextIndex(compact_threshold=50)
+    index.fit(random_docs[:700])
+    changed = [(record_id, ["弦紧弦紧头痛"], meta) for record_id, _, meta in random_docs[:20]]
+    for record_id, segments, meta in random_docs[700:] + changed:
+        index.upsert(record_id, segments, meta)
+    index.remove(5)
+    expected_docs = [d for d in changed + random_docs[20:] if d[0] != 5]
+
+    assert len(index) == 799 and 5 not in index
+    _assert_same_ranking(index.query("弦紧头痛", k=15), _brute_force(index, expected_docs, "弦紧头痛", 15))
+    index.compact()
+    assert not index._delta and len(index._record_ids) == 799
+    _assert_same_ranking(index.query("弦紧头痛", k=15), _brute_force(index, expected_docs, "弦紧头痛", 15))
+
+
+def test_save_and_memory_mapped_load(random_docs, tmp_path):
+    index = TextIndex()
+    index.fit(random_docs)
+    index.upsert(9999, ["洪数口苦"], RecordMeta(1, 1, 1, date(2022, 1, 1)))
+    path = str(tmp_path / "text_index")
+    index.save(path)
+
+    loaded = TextIndex().load(path)
+    assert isinstance(loaded._weights, np.memmap)
+    assert loaded.record_ids() == index.record_ids()
+    for text in ["洪数口苦", "细涩乏力"]:
+        assert loaded.query(text, k=8) == index.query(text, k=8)
+    # Still updatable after a memory-mapped load
+    loaded.upsert(1, ["洪数口苦洪数口苦"])
+    assert loaded.query("洪数口苦", k=1)[0][0] in (1, 9999)
@@ -1,5 +1,6 @@
 import sys
 import os
+import threading
 
 from fastapi import FastAPI
 from fastapi.responses import HTMLResponse, FileResponse
@@ -10,7 +11,10 @@ import uvicorn
 # Ensure src is in python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.database.connection import engine, Base
+from src.database.connection import engine, Base, SessionLocal, SessionCloud
+from src.database.search_index import ensure_patient_search_index
+from src.services.patient_suggest import warm_patient_suggest
+from src.services.sync_runner import sync_runner
 # Import models to register tables with SQLAlchemy
 import src.database.models
 
@@ -20,9 +24,18 @@ from web.routers import auth, admin, patients, records, practitioners, analysis,
 # Note: In production, use Alembic for migrations
 try:
     Base.metadata.create_all(bind=engine)
+    ensure_patient_search_index(engine)
 except Exception as e:
     print(f"Warning: Could not connect to database to create tables. Please ensure PostgreSQL is running. Error: {e}")
 
+# Warm the search-as-you-type index in the background so startup is not delayed
+if os.getenv("PATIENT_SUGGEST_WARM", "1") != "0":
+    threading.Thread(target=warm_patient_suggest, args=(SessionLocal,), daemon=True).start()
+
+# Periodic cloud sync (SYNC_INTERVAL_SECONDS); nothing to do without a cloud database
+if SessionCloud is not None:
+    sync_runner.start_schedule()
+
 app = FastAPI(title="中医脉象九宫格OCR识别系统")
 
 # CORS middleware
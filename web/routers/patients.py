@@ -1,9 +1,14 @@
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Dict, Any, Optional, Callable, Iterator
+import itertools
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from src.database.connection import get_db
 from src.services import auth_service, search_service, record_service
+from src.services.patient_suggest import patient_suggest
 from src.database.models import User, Patient, MedicalRecord
+from src.utils.pagination import encode_cursor, decode_cursor
 
 router = APIRouter(
     prefix="/api/patients",
@@ -11,38 +16,137 @@ router = APIRouter(
     dependencies=[Depends(auth_service.get_current_active_user)]
 )
 
+def _mark_partial(response: Response, partial: bool):
+    """Hybrid searches keep their list body; incompleteness is reported in a header."""
+    response.headers["X-Search-Partial"] = "true" if partial else "false"
+
+
+def _parse_cursor(cursor: Optional[str], tiebreak_type: type):
+    if cursor is None:
+        return None
+    try:
+        after = decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after[1], tiebreak_type):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+def _list_response(response: Response, db: Session, rows_of: Callable[[Session], Iterator[Dict[str, Any]]],
+                   public: Callable, limit: Optional[int], stream: bool, partial: bool = False):
+    """
+    Page or stream the rows of rows_of(session), which carry an internal "_sort" key.
+    Lists keep their array body; when more rows follow, X-Next-Cursor holds the cursor
+    for the next page. stream=true sends NDJSON as rows arrive, ending with a
+    {"next_cursor": ...} line when the limit cut the stream short.
+    partial: the rows report in .partial whether the cloud missed its deadline.
+    """
+    if stream:
+        # The body is sent after the endpoint returns, when older FastAPI versions have
+        # already closed the request's session: the stream reads through its own
+        stream_db = Session(bind=db.get_bind(), autoflush=False)
+        try:
+            rows = rows_of(stream_db)
+            # Pulls the first row, which also settles whether the first cloud page made it
+            first = next(rows, None)
+        except BaseException:
+            stream_db.close()
+            raise
+        headers = {"X-Search-Partial": "true" if rows.partial else "false"} if partial else {}
+
+        def lines():
+            try:
+                last = None
+                for count, row in enumerate(itertools.chain([first] if first else [], rows)):
+                    if limit and count == limit:
+                        yield json.dumps({"next_cursor": encode_cursor(last)}) + "\n"
+                        return
+                    yield json.dumps(public(row), ensure_ascii=False, default=str) + "\n"
+                    last = row["_sort"]
+            finally:
+                stream_db.close()
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+    rows = rows_of(db)
+    page = list(itertools.islice(rows, limit + 1)) if limit else list(rows)
+    if limit and len(page) > limit:
+        page = page[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(page[-1]["_sort"])
+    if partial:
+        _mark_partial(response, rows.partial)
+    return [public(row) for row in page]
+
+
 @router.get("/search")
 async def search_patients(
+    response: Response,
     query: str = Query(None, min_length=1),
+    limit: int = Query(search_service.SEARCH_PAGE_SIZE, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    stream: bool = Query(False, description="Stream NDJSON rows instead of a JSON array"),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
-    Search patients by name or phone number.
+    Search patients by name or phone number, most recently updated first.
     Non-admin users only see their own patients.
+    X-Search-Partial: true means the cloud missed its deadline and only local results are included.
     """
+    after = _parse_cursor(cursor, str)
     # Admin sees all, others see only their own based on account type
     user_id = None if current_user.role == 'admin' else current_user.id
-    return search_service.search_patients(db, query, user_id=user_id, account_type=current_user.account_type)
+    rows_of = lambda session: search_service.iter_search_patients(
+        session, query, user_id=user_id, account_type=current_user.account_type, after=after, limit=limit
+    )
+    return _list_response(response, db, rows_of, search_service.public_row, limit, stream, partial=True)
+
+@router.get("/suggest")
+async def suggest_patients(
+    q: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Search-as-you-type suggestions: patients whose name, full pinyin, pinyin initials,
+    phone or last four phone digits start with q, most recently seen first.
+    Served from the in-memory index of the caller's scope (local patients only).
+    """
+    user_id = None if current_user.role == 'admin' else current_user.id
+    return patient_suggest.suggest(db, q, user_id=user_id, account_type=current_user.account_type, limit=limit)
 
 @router.get("/by_date")
 async def get_patients_by_date(
+    response: Response,
     start_date: str = Query(None, description="Start date in YYYY-MM-DD format"),
     end_date: str = Query(None, description="End date in YYYY-MM-DD format"),
     date: str = Query(None, description="Single date in YYYY-MM-DD format (deprecated, use start_date/end_date)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; unbounded when omitted"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    stream: bool = Query(False, description="Stream NDJSON rows instead of a JSON array"),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
-    Get patients who had a medical record within a date range.
+    Get patients who had a medical record within a date range, latest visit first.
     Non-admin users only see their own patients.
+    X-Search-Partial: true means the cloud missed its deadline and only local results are included.
     """
-    try:
-        # Admin sees all, others see only their own
-        user_id = None if current_user.role == 'admin' else current_user.id
-        return search_service.get_patients_by_date_range(db, start_date, end_date, date, user_id=user_id)
-    except ValueError:
-         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    after = _parse_cursor(cursor, str)
+    # Admin sees all, others see only their own
+    user_id = None if current_user.role == 'admin' else current_user.id
+
+    def rows_of(session: Session):
+        try:
+            return search_service.iter_patients_by_date_range(
+                session, start_date, end_date, date, user_id=user_id, after=after, limit=limit
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    return _list_response(response, db, rows_of, search_service.public_row, limit, stream, partial=True)
 
 @router.get("/{patient_id}")
 async def get_patient(
@@ -116,12 +220,19 @@ async def get_patient_latest_record(
 @router.get("/{patient_id}/history")
 async def get_patient_history(
     patient_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; unbounded when omitted"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    stream: bool = Query(False, description="Stream NDJSON rows instead of a JSON array"),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
-    Get a list of medical records for a patient
+    Get a list of medical records for a patient, newest first (keyset paged on visit date, id)
     """
+    after = _parse_cursor(cursor, int)
     if not auth_service.check_patient_permission(db, current_user, patient_id):
         raise HTTPException(status_code=403, detail="无权访问该患者记录")
-    return record_service.get_patient_history(db, patient_id)
+    rows_of = lambda session: record_service.iter_patient_history(session, patient_id, after=after)
+    public = lambda row: {k: v for k, v in row.items() if k != "_sort"}
+    return _list_response(response, db, rows_of, public, limit, stream)
@@ -6,8 +6,9 @@ from typing import Any, Dict, Optional
 from sqlalchemy.orm import Session
 from src.database.connection import get_db
 from src.services import auth_service, record_service, search_service
+from src.services.precompute_job import precompute_job
 from src.database.models import User, MedicalRecord
-from web.schemas import RecordData, SimilarSearchInput
+from web.schemas import RecordData, SimilarSearchInput, TextSearchInput
 
 router = APIRouter(
     prefix="/api/records",
@@ -66,6 +67,7 @@ async def delete_record(
         
     db.delete(record)
     db.commit()
+    search_service.unindex_medical_record(record_id)
     
     return {"status": "success", "message": f"Record {record_id} deleted"}
 
@@ -109,29 +111,113 @@ async def save_record(
 @router.post("/search_similar")
 async def search_similar_records(
     data: SimilarSearchInput,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
     Search for similar medical records based on pulse grid data.
     Uses LLM for semantic vector extraction when available, falls back to keyword matching.
+    Supports filtering (practitioner, patient, visit date window, own records) and k/offset paging.
     """
     from src.services.llm_service import llm_service
     current_grid = data.pulse_grid
-    return search_service.search_similar_records(db, current_grid, llm_service=llm_service)
+    return search_service.search_similar_records(
+        db, current_grid, llm_service=llm_service,
+        limit=data.k,
+        offset=data.offset,
+        min_similarity=data.min_similarity,
+        practitioner_id=data.practitioner_id,
+        patient_id=data.patient_id,
+        user_id=current_user.id if data.scope == "mine" else None,
+        start_date=data.start_date,
+        end_date=data.end_date,
+        mode=data.mode,
+    )
+
+
+@router.post("/search_text")
+async def search_text(
+    data: TextSearchInput,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Find teacher records similar to free text (pulse description, complaint, diagnosis).
+    Uses the local character n-gram TF-IDF index; no LLM call. Same filters as /search_similar.
+    """
+    return search_service.search_records_by_text(
+        db, data.text,
+        limit=data.k,
+        offset=data.offset,
+        min_similarity=data.min_similarity,
+        practitioner_id=data.practitioner_id,
+        patient_id=data.patient_id,
+        user_id=current_user.id if data.scope == "mine" else None,
+        start_date=data.start_date,
+        end_date=data.end_date,
+    )
+
+
+@router.post("/rebuild-text-index")
+async def rebuild_text_index(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.check_admin)
+):
+    """
+    Refit the free-text index on the current corpus (new vocabulary and IDF) and save it.
+    Incremental updates cover new records in between; refit after large imports. Admin only.
+    """
+    return {"status": "success", **search_service.rebuild_text_index(db)}
 
 
-@router.post("/precompute-vectors")
+@router.post("/precompute-vectors", status_code=202)
 async def precompute_vectors(
+    restart: bool = False,
+    current_user: User = Depends(auth_service.check_admin)
+):
+    """
+    Start a background job that precomputes LLM pulse vectors for all records without one.
+    Resumes an interrupted or cancelled run from its checkpoint unless restart=true.
+    Progress is reported by GET /precompute-vectors/status. Admin only.
+    """
+    from src.services.llm_service import llm_service
+    job, started = precompute_job.start(llm_service, restart=restart)
+    return {"status": "started" if started else "already_running", "job": job}
+
+
+@router.get("/precompute-vectors/status")
+async def precompute_vectors_status(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.check_admin)
+):
+    """Progress of the latest pulse vector precompute job. Admin only."""
+    return precompute_job.status(db)
+
+
+@router.post("/precompute-vectors/cancel")
+async def cancel_precompute_vectors(
+    current_user: User = Depends(auth_service.check_admin)
+):
+    """Stop the running precompute job after its current chunk; start it again to resume. Admin only."""
+    return {"cancelled": precompute_job.cancel()}
+
+
+@router.post("/train-pulse-model")
+async def train_pulse_model(
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.check_admin)
 ):
     """
-    Batch precompute LLM pulse vectors for all records that don't have one cached.
+    Fit the local pulse vector model to the precomputed LLM vectors, so similarity
+    search no longer calls the LLM per query. Returns the held-out calibration report.
     Admin only.
     """
     from src.services.llm_service import llm_service
-    updated = search_service.precompute_pulse_vectors(db, llm_service)
-    return {"status": "success", "updated": updated}
+    try:
+        report = search_service.train_pulse_model(db, llm_service)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "report": report}
 
 
 class AnalysisUpdate(BaseModel):
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from src.database.models import User
 from src.services import auth_service
-from src.services.sync_service import SyncService
+from src.services.sync_runner import sync_runner
 
 router = APIRouter(
     prefix="/api/sync",
@@ -8,27 +13,76 @@ router = APIRouter(
     dependencies=[Depends(auth_service.get_current_active_user)]
 )
 
-# Initialize Sync Service
-sync_service = SyncService()
+# Shared with the background runner, which owns every sync run
+sync_service = sync_runner.service
+
+# Seconds between progress checks of the event stream
+EVENTS_POLL_SECONDS = 0.5
 
 @router.get("/status")
-async def get_sync_status():
+def get_sync_status():
     """
-    Get current synchronization status.
+    Get current synchronization status: pending rows plus the state of the sync runner
+    (live progress of a running sync, result of the last one). Served from memory.
     """
-    pending_count = sync_service.get_pending_count()
+    pending_count = sync_runner.pending_count()
     return {
         "status": "online", 
         "pending_count": pending_count,
-        "message": f"{pending_count} records pending upload"
+        "message": f"{pending_count} records pending upload",
+        "sync": sync_runner.status(),
     }
 
 @router.post("/trigger")
-async def trigger_sync():
+async def trigger_sync(
+    wait: bool = Query(True, description="Wait for the run and return its result; false returns 202 at once")
+):
+    """
+    Trigger manual synchronization (Push & Pull) on the background sync runner.
+    A trigger during a running sync is merged into one follow-up run.
+    """
+    generation, started = sync_runner.trigger()
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "status": "started" if started else "queued", "sync": sync_runner.status()
+        })
+    # Block a worker thread, not the event loop
+    return await run_in_threadpool(sync_runner.wait, generation)
+
+@router.post("/reconcile")
+async def reconcile_sync(
+    wait: bool = Query(True, description="Wait for the run and return its result; false returns 202 at once"),
+    current_user: User = Depends(auth_service.check_admin)
+):
     """
-    Trigger manual synchronization (Push & Pull).
+    Sync, then compare local and cloud tables by bucket hashes and copy only the rows
+    that differ (e.g. after a failed partial sync or merge_duplicates.py). Admin only.
     """
-    # Run sync in background or await? For simplicity, await.
-    # In production, use BackgroundTasks.
-    result = sync_service.sync_all() # New push-pull
-    return result
+    generation, started = sync_runner.trigger(reconcile=True)
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "status": "started" if started else "queued", "sync": sync_runner.status()
+        })
+    return await run_in_threadpool(sync_runner.wait, generation)
+
+@router.get("/events")
+async def sync_events():
+    """
+    Server-sent events with the sync runner status, sent whenever it changes.
+    The stream ends with the first event in which no sync is running; the retry
+    field makes EventSource reconnect for the next run.
+    """
+    async def events():
+        yield "retry: 5000\n\n"
+        seen = None
+        while True:
+            version = sync_runner.progress_version()
+            if version != seen:
+                seen = version
+                status = sync_runner.status()
+                yield f"event: sync\ndata: {json.dumps(status, ensure_ascii=False, default=str)}\n\n"
+                if not status["running"] and not status["queued"]:
+                    return
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
-from src.database.connection import get_db
+from src.database.connection import get_db, SessionCloud
+from src.services.cloud_health import cloud_health
 from src.data_preparation.validator import DataValidator
 from web.schemas import ValidateInput
 
@@ -15,15 +16,17 @@ validator = DataValidator()
 @router.get("/api/health")
 async def health_check(db: Session = Depends(get_db)):
     """
-    Check database connection status
+    Check database connection status.
+    The cloud entry reports the circuit breaker state; it never blocks on the cloud itself.
     """
+    cloud = {"configured": SessionCloud is not None, **cloud_health.snapshot()}
     try:
         # Execute a simple query to check connection
         db.execute(text("SELECT 1"))
-        return {"status": "connected", "database": "online"}
+        return {"status": "connected", "database": "online", "cloud": cloud}
     except Exception as e:
         print(f"Health check failed: {e}")
-        return {"status": "disconnected", "error": str(e)}
+        return {"status": "disconnected", "error": str(e), "cloud": cloud}
 
 @router.post("/api/validate")
 async def validate_data(input_data: ValidateInput):
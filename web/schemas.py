@@ -1,4 +1,5 @@
-from typing import Dict, Any, Optional
+from datetime import date
+from typing import Dict, Any, Optional, Literal
 from pydantic import BaseModel, Field
 
 class ValidateInput(BaseModel):
@@ -21,6 +22,26 @@ class AnalysisInput(BaseModel):
     
 class SimilarSearchInput(BaseModel):
     pulse_grid: Dict[str, Any]
+    k: int = Field(5, ge=1, le=100)
+    offset: int = Field(0, ge=0)
+    min_similarity: Optional[float] = Field(None, ge=0.0, le=1.0)
+    practitioner_id: Optional[int] = None
+    patient_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    scope: Literal["all", "mine"] = "all"  # 'mine': only records authored by the current user
+    mode: Literal["vector", "position"] = "vector"  # 'position': per-position keyword overlap
+
+class TextSearchInput(BaseModel):
+    text: str = Field(..., min_length=1, max_length=2000)
+    k: int = Field(5, ge=1, le=100)
+    offset: int = Field(0, ge=0)
+    min_similarity: Optional[float] = Field(None, ge=0.0, le=1.0)
+    practitioner_id: Optional[int] = None
+    patient_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    scope: Literal["all", "mine"] = "all"
 
 class UserBase(BaseModel):
     username: str